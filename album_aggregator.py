@@ -0,0 +1,74 @@
+"""
+Сборка альбомов (сообщений с общим grouped_id) в одну медиагруппу
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+class AlbumAggregator:
+    """
+    Накопитель частей альбома
+
+    Telegram присылает каждую фотографию альбома отдельным событием с общим
+    grouped_id. Агрегатор собирает части, пока в течение короткого окна не
+    перестанут приходить новые, и передает альбом целиком в обработчик.
+    """
+
+    # Telegram не допускает больше 10 элементов в медиагруппе
+    MAX_ALBUM_SIZE = 10
+
+    def __init__(self, on_album: Callable[[List], Awaitable],
+                 settle_delay: float = 0.7):
+        """
+        Args:
+            on_album: Корутина, получающая список событий альбома по порядку
+            settle_delay: Сколько секунд ждать следующую часть альбома
+        """
+        self.on_album = on_album
+        self.settle_delay = settle_delay
+        self._parts: Dict[int, List] = {}
+        self._timers: Dict[int, asyncio.Task] = {}
+
+    def add(self, event):
+        """Добавляет часть альбома и перезапускает таймер ожидания"""
+        grouped_id = event.message.grouped_id
+        self._parts.setdefault(grouped_id, []).append(event)
+
+        timer = self._timers.pop(grouped_id, None)
+        if timer:
+            timer.cancel()
+
+        if len(self._parts[grouped_id]) >= self.MAX_ALBUM_SIZE:
+            self._timers[grouped_id] = asyncio.create_task(self._flush(grouped_id))
+        else:
+            self._timers[grouped_id] = asyncio.create_task(
+                self._flush(grouped_id, self.settle_delay))
+
+    def __len__(self) -> int:
+        return len(self._parts)
+
+    async def _flush(self, grouped_id: int, delay: float = 0):
+        if delay:
+            await asyncio.sleep(delay)
+        self._timers.pop(grouped_id, None)
+        parts = self._parts.pop(grouped_id, [])
+        if not parts:
+            return
+
+        # Части могут прийти не по порядку, восстанавливаем порядок альбома
+        parts.sort(key=lambda e: e.message.id)
+        logger.info("Собран альбом %s: %d частей", grouped_id, len(parts))
+        try:
+            await self.on_album(parts)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке альбома {grouped_id}: {e}")
+
+    async def flush_all(self):
+        """Немедленно обрабатывает все накопленные альбомы (при остановке бота)"""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        await asyncio.gather(*(self._flush(gid) for gid in list(self._parts)))
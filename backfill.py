@@ -0,0 +1,167 @@
+"""
+Догрузка истории каналов за период мониторинга
+"""
+
+import os
+import json
+import heapq
+import asyncio
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+class BackfillEvent:
+    """Сообщение из истории с тем же интерфейсом, что и событие NewMessage"""
+
+    def __init__(self, message, chat):
+        self.message = message
+        self.chat = chat
+        self.chat_id = message.chat_id
+        self.client = message.client
+
+class HistoryBackfill:
+    """
+    Догрузка сообщений, опубликованных, пока бот не работал
+
+    Каналы читаются параллельно страницами через get_messages, число
+    одновременных запросов ограничено семафором. Сообщения всех каналов
+    сливаются в хронологическом порядке и передаются в обычный обработчик.
+    Для каждого канала сохраняется id последнего обработанного сообщения,
+    так что прерванная догрузка продолжается с того же места.
+
+    Боты не могут читать историю каналов, поэтому для догрузки нужен клиент
+    пользовательского аккаунта.
+    """
+
+    PAGE_SIZE = 100  # максимум сообщений в одном запросе истории
+    CHECKPOINT_EVERY = 50
+
+    def __init__(self, client, channels: List[str], start_date: datetime, end_date: datetime,
+                 process: Callable[[BackfillEvent], Awaitable],
+                 checkpoint_path: str = 'backfill_checkpoint.json',
+                 concurrency: int = 4, prefetch_pages: int = 2):
+        """
+        Args:
+            client: Клиент, через который читается история
+            channels: Список каналов-источников
+            start_date: Начало периода мониторинга
+            end_date: Конец периода мониторинга
+            process: Обработчик сообщения (тот же, что и для новых сообщений)
+            checkpoint_path: Файл с позициями догрузки по каналам
+            concurrency: Максимум одновременных запросов истории
+            prefetch_pages: Сколько страниц каждого канала держать наготове
+        """
+        self.client = client
+        self.channels = channels
+        self.start_date = start_date
+        self.end_date = end_date
+        self.process = process
+        self.checkpoint_path = checkpoint_path
+        self.prefetch_pages = prefetch_pages
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.checkpoints: Dict[str, int] = self._load_checkpoints()
+
+    def _load_checkpoints(self) -> Dict[str, int]:
+        if not os.path.exists(self.checkpoint_path):
+            return {}
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Ошибка чтения позиций догрузки {self.checkpoint_path}: {e}")
+            return {}
+
+    def save_checkpoints(self):
+        """Атомарно сохраняет позиции догрузки"""
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.checkpoints, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    async def _produce(self, channel: str, queue: asyncio.Queue):
+        """Читает историю канала страницами и складывает сообщения в очередь"""
+        try:
+            entity = await self.client.get_entity(channel)
+            last_id = self.checkpoints.get(channel, 0)
+            fetched = 0
+            while True:
+                async with self._semaphore:
+                    if last_id:
+                        page = await self.client.get_messages(
+                            entity, limit=self.PAGE_SIZE, min_id=last_id, reverse=True)
+                    else:
+                        page = await self.client.get_messages(
+                            entity, limit=self.PAGE_SIZE, offset_date=self.start_date, reverse=True)
+                if not page:
+                    break
+
+                for message in page:
+                    if message.date > self.end_date:
+                        break
+                    await queue.put(BackfillEvent(message, entity))
+                else:
+                    last_id = page[-1].id
+                    fetched += len(page)
+                    if len(page) == self.PAGE_SIZE:
+                        continue
+                break
+
+            logger.info(f"История канала {channel} прочитана ({fetched} сообщений после позиции)")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка догрузки истории канала {channel}: {e}")
+
+        # Признак конца канала для слияния
+        await queue.put(None)
+
+    async def run(self) -> int:
+        """
+        Выполняет догрузку
+
+        Returns:
+            Количество переданных в обработчик сообщений
+        """
+        logger.info(f"Догрузка истории {len(self.channels)} каналов "
+                    f"за {self.start_date} - {self.end_date}")
+
+        queues = [asyncio.Queue(maxsize=self.PAGE_SIZE * self.prefetch_pages)
+                  for _ in self.channels]
+        producers = [asyncio.create_task(self._produce(channel, queue))
+                     for channel, queue in zip(self.channels, queues)]
+
+        # Слияние каналов по дате: в куче лежит по одному сообщению от каждого канала
+        heap = []
+        for index, queue in enumerate(queues):
+            event = await queue.get()
+            if event is not None:
+                heapq.heappush(heap, (event.message.date, event.message.id, index, event))
+
+        processed = 0
+        try:
+            while heap:
+                _, _, index, event = heapq.heappop(heap)
+                try:
+                    await self.process(event)
+                except Exception as e:
+                    logger.error(f"Ошибка обработки сообщения из истории: {e}")
+
+                self.checkpoints[self.channels[index]] = event.message.id
+                processed += 1
+                if processed % self.CHECKPOINT_EVERY == 0:
+                    self.save_checkpoints()
+
+                next_event = await queues[index].get()
+                if next_event is not None:
+                    heapq.heappush(heap, (next_event.message.date, next_event.message.id,
+                                          index, next_event))
+        finally:
+            for producer in producers:
+                producer.cancel()
+            await asyncio.gather(*producers, return_exceptions=True)
+            self.save_checkpoints()
+
+        logger.info(f"Догрузка истории завершена: обработано {processed} сообщений")
+        return processed
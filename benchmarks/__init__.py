@@ -0,0 +1,3 @@
+"""
+Офлайн-бенчмарк конвейера медицинского мониторинг-бота без подключения к Telegram
+"""
@@ -0,0 +1,200 @@
+"""
+Синтетические потоки событий, запись потока в файл и воспроизведение с ускорением
+"""
+
+import json
+import time
+import random
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+from benchmarks.fake_telegram import FakeChat, FakeEvent, FakeMessage
+
+# Маркер оформлен как ссылка, чтобы нормализация текста в боте его отбрасывала
+BENCH_MARKER = "https://bench/{}"
+
+SAMPLE_WORDS = (
+    "минздрав сообщил о росте заболеваемости гриппом в регионах врачи рекомендуют "
+    "вакцинацию новые методы лечения онкологии клинические исследования показали "
+    "эффективность препарата детская больница получила оборудование для диагностики "
+    "иммунитет витамины профилактика кардиология давление инсульт реабилитация"
+).split()
+
+# Доли типов событий в синтетическом потоке
+DEFAULT_MIX = {
+    'text': 0.45,
+    'photo': 0.2,
+    'album': 0.1,
+    'duplicate': 0.1,
+    'crosspost': 0.1,
+    'service': 0.05,
+}
+
+def generate_records(count: int, rate: float = 50.0, channels: int = 18,
+                     mix: Optional[Dict[str, float]] = None, seed: int = 0,
+                     photo_size: int = 200 * 1024,
+                     start_date: datetime = datetime(2025, 9, 1, tzinfo=timezone.utc)) -> List[dict]:
+    """
+    Генерирует поток записей о событиях
+
+    Args:
+        count: Количество событий
+        rate: Средняя частота событий в секунду (пуассоновский поток)
+        channels: Количество каналов-источников
+        mix: Доли типов событий (см. DEFAULT_MIX)
+        seed: Зерно генератора случайных чисел
+        photo_size: Средний размер фото в байтах
+        start_date: Дата первого сообщения
+
+    Returns:
+        Список записей, упорядоченных по времени появления
+    """
+    rnd = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    kinds, weights = zip(*mix.items())
+    next_ids = [1000] * channels
+    records: List[dict] = []
+    offset = 0.0
+    bench_id = 0
+    grouped_id = 0
+
+    def new_record(kind_channel: int, text: Optional[str], size: int = 0,
+                   group: Optional[int] = None, service: bool = False) -> dict:
+        nonlocal bench_id
+        bench_id += 1
+        next_ids[kind_channel] += 1
+        return {
+            't': round(offset, 6),
+            'chat_id': -1000000000000 - kind_channel,
+            'username': f"source_{kind_channel}",
+            'id': next_ids[kind_channel],
+            'date': (start_date + timedelta(seconds=offset)).isoformat(),
+            'text': text,
+            'photo_size': size,
+            'grouped_id': group,
+            'service': service,
+            'bench_id': bench_id,
+        }
+
+    def random_text() -> str:
+        return ' '.join(rnd.choice(SAMPLE_WORDS) for _ in range(rnd.randint(12, 60)))
+
+    while len(records) < count:
+        offset += rnd.expovariate(rate)
+        channel = rnd.randrange(channels)
+        kind = rnd.choices(kinds, weights)[0]
+
+        if kind == 'duplicate' and records:
+            # Повторная доставка уже полученного события
+            duplicate = dict(rnd.choice(records[-200:]))
+            duplicate['t'] = round(offset, 6)
+            records.append(duplicate)
+        elif kind == 'crosspost' and records:
+            # Та же новость в другом канале
+            source = rnd.choice(records[-200:])
+            if source['text']:
+                records.append(new_record(channel, source['text']))
+            else:
+                records.append(new_record(channel, random_text()))
+        elif kind == 'photo':
+            text = random_text() if rnd.random() < 0.7 else None
+            size = int(rnd.uniform(0.3, 1.7) * photo_size)
+            records.append(new_record(channel, text, size))
+        elif kind == 'album':
+            grouped_id += 1
+            for part in range(rnd.randint(2, 6)):
+                text = random_text() if part == 0 else None
+                size = int(rnd.uniform(0.3, 1.7) * photo_size)
+                records.append(new_record(channel, text, size, group=grouped_id))
+                offset += rnd.uniform(0.001, 0.02)
+        elif kind == 'service':
+            records.append(new_record(channel, None, service=True))
+        else:
+            records.append(new_record(channel, random_text()))
+
+    return records[:count]
+
+def build_event(record: dict, client, chats: Dict[int, FakeChat]) -> FakeEvent:
+    """Создает событие для бота из записи"""
+    chat = chats.get(record['chat_id'])
+    if chat is None:
+        chat = chats[record['chat_id']] = FakeChat(record['chat_id'], record['username'])
+
+    text = record.get('text')
+    if text:
+        text = f"{text}\n{BENCH_MARKER.format(record['bench_id'])}"
+
+    message = FakeMessage(
+        client, chat, record['id'], datetime.fromisoformat(record['date']),
+        text=text, photo_size=record.get('photo_size', 0),
+        grouped_id=record.get('grouped_id'),
+        action=object() if record.get('service') else None,
+        bench_id=record['bench_id'],
+    )
+    return FakeEvent(message, chat)
+
+def save_records(records: Iterable[dict], path: str):
+    """Сохраняет поток событий в JSONL"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+def load_records(path: str) -> List[dict]:
+    """Загружает поток событий из JSONL"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+async def replay(records: List[dict], speed: float = 1.0):
+    """
+    Воспроизводит записи, соблюдая интервалы между ними с ускорением speed
+
+    Yields:
+        Записи в момент их "появления"
+    """
+    start = time.perf_counter()
+    for record in records:
+        delay = record['t'] / speed - (time.perf_counter() - start)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        yield record
+
+class EventRecorder:
+    """
+    Запись живого потока событий Telethon в JSONL для последующего воспроизведения
+
+    Сохраняются только метаданные (тексты, размеры файлов, grouped_id), сами
+    медиа не скачиваются.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+        self._start = time.perf_counter()
+        self._count = 0
+
+    def attach(self, client, chats):
+        """Подписывается на новые сообщения каналов"""
+        from telethon import events
+        client.add_event_handler(self.record_event, events.NewMessage(chats=chats))
+
+    async def record_event(self, event):
+        self._count += 1
+        message = event.message
+        record = {
+            't': round(time.perf_counter() - self._start, 6),
+            'chat_id': event.chat_id,
+            'username': getattr(event.chat, 'username', None) or str(event.chat_id),
+            'id': message.id,
+            'date': message.date.isoformat(),
+            'text': message.text or message.message or None,
+            'photo_size': (message.file.size or 0) if message.photo and message.file else 0,
+            'grouped_id': message.grouped_id,
+            'service': message.action is not None,
+            'bench_id': self._count,
+        }
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
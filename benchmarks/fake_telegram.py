@@ -0,0 +1,190 @@
+"""
+Заменитель TelegramClient для офлайн-замеров: задержки сети, FloodWait и скорость скачивания
+"""
+
+import io
+import re
+import time
+import random
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional
+from telethon.errors import FileReferenceExpiredError, FloodWaitError
+from telethon.tl.types import InputFile, Message, PeerChannel
+
+BENCH_MARKER_RE = re.compile(r'https://bench/(\d+)')
+
+class FakeChat:
+    """Канал-источник"""
+
+    def __init__(self, chat_id: int, username: str):
+        self.id = chat_id
+        self.username = username
+        self.title = f"Канал {username}"
+
+class FakeFile:
+    """Аналог telethon.tl.custom.File: метаданные файла без скачивания"""
+
+    def __init__(self, size: int, ext: str = '.jpg', mime_type: str = 'image/jpeg',
+                 name: Optional[str] = None):
+        self.size = size
+        self.ext = ext
+        self.mime_type = mime_type
+        self.name = name
+
+class FakeMedia:
+    """Медиа сообщения; bench_id позволяет сопоставить отправку с исходным событием"""
+
+    def __init__(self, bench_id: int, size: int):
+        self.bench_id = bench_id
+        self.size = size
+
+    def __repr__(self):
+        return f"FakeMedia(bench_id={self.bench_id}, size={self.size})"
+
+class FakeMessage:
+    """Сообщение с теми атрибутами, которые использует бот"""
+
+    def __init__(self, client, chat: FakeChat, message_id: int, date: datetime,
+                 text: Optional[str] = None, photo_size: int = 0,
+                 grouped_id: Optional[int] = None, action: Optional[object] = None,
+                 bench_id: int = 0):
+        self.client = client
+        self.id = message_id
+        self.chat_id = chat.id
+        self.date = date
+        self.text = text
+        self.message = text
+        self.grouped_id = grouped_id
+        self.action = action
+        self.bench_id = bench_id
+        self.document = None
+        self.video = None
+        if photo_size:
+            self.media = FakeMedia(bench_id, photo_size)
+            self.photo = self.media
+            self.file = FakeFile(photo_size)
+        else:
+            self.media = None
+            self.photo = None
+            self.file = None
+
+    def __bytes__(self):
+        # Журнал исходящих хранит сообщения как TL-объекты; размер записи близок к настоящему
+        return bytes(Message(id=self.id, peer_id=PeerChannel(abs(self.chat_id) % 10 ** 12),
+                             date=self.date, message=self.text or ''))
+
+class FakeEvent:
+    """Аналог events.NewMessage.Event"""
+
+    def __init__(self, message: FakeMessage, chat: FakeChat):
+        self.message = message
+        self.chat = chat
+        self.chat_id = chat.id
+        self.client = message.client
+
+class FakeTelegramClient:
+    """
+    Клиент в памяти процесса, имитирующий сетевое поведение Telegram
+
+    Каждый вызов API ждет latency (+ случайный разброс jitter). С вероятностью
+    flood_probability отправка завершается FloodWait на flood_seconds секунд,
+    а с вероятностью expired_probability ссылка на файл считается устаревшей
+    (бот уходит на скачивание). Скачивание идет частями со скоростью
+    download_speed байт/с.
+    """
+
+    CHUNK_SIZE = 128 * 1024
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.02,
+                 flood_probability: float = 0.0, flood_seconds: int = 1,
+                 expired_probability: float = 0.0,
+                 download_speed: float = 20 * 1024 * 1024,
+                 upload_speed: float = 10 * 1024 * 1024, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_probability = flood_probability
+        self.flood_seconds = flood_seconds
+        self.expired_probability = expired_probability
+        self.download_speed = download_speed
+        self.upload_speed = upload_speed
+        self._random = random.Random(seed)
+        self._next_id = 1
+        # bench_id -> время завершения отправки (perf_counter)
+        self.delivered: Dict[int, float] = {}
+        self.calls: Dict[str, int] = {}
+        self.flood_waits = 0
+
+    async def _network(self, name: str, extra: float = 0.0):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        await asyncio.sleep(max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter)) + extra)
+
+    def _maybe_flood(self):
+        if self.flood_probability and self._random.random() < self.flood_probability:
+            self.flood_waits += 1
+            raise FloodWaitError(None, capture=self.flood_seconds)
+
+    def _deliver(self, *bench_ids: int):
+        now = time.perf_counter()
+        for bench_id in bench_ids:
+            if bench_id and bench_id not in self.delivered:
+                self.delivered[bench_id] = now
+
+    def _sent_message(self):
+        self._next_id += 1
+        return type('SentMessage', (), {'id': self._next_id, 'media': None})()
+
+    @staticmethod
+    def _bench_ids_from_text(text: Optional[str]) -> List[int]:
+        return [int(m) for m in BENCH_MARKER_RE.findall(text or '')]
+
+    async def get_entity(self, entity):
+        await self._network('get_entity')
+        return entity
+
+    async def get_permissions(self, entity):
+        await self._network('get_permissions')
+        return type('Permissions', (), {'is_admin': True, 'post_messages': True})()
+
+    async def send_message(self, entity, message: str = '', **kwargs):
+        await self._network('send_message')
+        self._maybe_flood()
+        self._deliver(*self._bench_ids_from_text(message))
+        return self._sent_message()
+
+    async def send_file(self, entity, file, caption=None, **kwargs):
+        files = file if isinstance(file, list) else [file]
+        await self._network('send_file')
+        self._maybe_flood()
+        if (self.expired_probability and any(isinstance(f, FakeMedia) for f in files)
+                and self._random.random() < self.expired_probability):
+            raise FileReferenceExpiredError(None)
+        bench_ids = [f.id if isinstance(f, InputFile) else getattr(f, 'bench_id', 0) for f in files]
+        self._deliver(*bench_ids, *self._bench_ids_from_text(caption))
+        sent = [self._sent_message() for _ in files]
+        return sent if isinstance(file, list) else sent[0]
+
+    async def upload_file(self, data, **kwargs):
+        if isinstance(data, str):
+            with open(data, 'rb') as f:
+                payload = f.read()
+        else:
+            payload = bytes(data.getbuffer())
+        await self._network('upload_file', len(payload) / self.upload_speed)
+        bench_id = int(payload[:16].split(b':')[1]) if payload.startswith(b'BENCH:') else 0
+        # Настоящий TL-объект, чтобы его можно было сохранить в UploadCache; id - это bench_id
+        return InputFile(id=bench_id, parts=1, name=getattr(data, 'name', 'media.jpg'), md5_checksum='')
+
+    async def iter_download(self, media, **kwargs):
+        self.calls['iter_download'] = self.calls.get('iter_download', 0) + 1
+        size = getattr(media, 'size', 0)
+        # Первые байты содержат bench_id, чтобы загрузку можно было сопоставить с событием
+        header = f"BENCH:{getattr(media, 'bench_id', 0)}:".encode()
+        payload = io.BytesIO(header + b'\0' * max(0, size - len(header)))
+        await asyncio.sleep(self.latency)
+        while True:
+            chunk = payload.read(self.CHUNK_SIZE)
+            if not chunk:
+                break
+            await asyncio.sleep(len(chunk) / self.download_speed)
+            yield chunk
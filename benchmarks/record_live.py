@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Запись живого потока событий из каналов-источников для последующего воспроизведения
+
+Пример:
+    python -m benchmarks.record_live --output stream.jsonl --duration 3600
+    python -m benchmarks.run_benchmark --replay stream.jsonl --speed 60
+"""
+
+import asyncio
+import argparse
+
+from benchmarks.events import EventRecorder
+
+async def record(output: str, duration: float):
+    from telethon import TelegramClient
+    from bot_config import API_ID, API_HASH, BOT_TOKEN, SOURCE_CHANNELS
+
+    client = TelegramClient('bench_recorder', API_ID, API_HASH)
+    recorder = EventRecorder(output)
+    await client.start(bot_token=BOT_TOKEN)
+    try:
+        recorder.attach(client, SOURCE_CHANNELS)
+        print(f"Запись событий в {output} ({duration:g} с)...")
+        await asyncio.sleep(duration)
+    finally:
+        recorder.close()
+        await client.disconnect()
+
+def main():
+    parser = argparse.ArgumentParser(description="Запись потока событий каналов-источников")
+    parser.add_argument('--output', required=True, help="файл JSONL для записи")
+    parser.add_argument('--duration', type=float, default=3600, help="длительность записи, с")
+    args = parser.parse_args()
+    asyncio.run(record(args.output, args.duration))
+
+if __name__ == '__main__':
+    main()
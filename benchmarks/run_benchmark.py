@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Офлайн-бенчмарк обработчика handle_new_message
+
+Запускает настоящий конвейер бота (фильтры, дедупликация, альбомы, очередь
+отправки, пересылка медиа) на синтетическом или записанном потоке событий с
+FakeTelegramClient вместо Telegram и выводит пропускную способность, задержку
+от получения события до отправки (p50/p99) и пиковое потребление памяти.
+
+Примеры:
+    python -m benchmarks.run_benchmark --events 2000 --rate 100
+    python -m benchmarks.run_benchmark --record stream.jsonl
+    python -m benchmarks.run_benchmark --replay stream.jsonl --speed 10 --json result.json
+    python -m benchmarks.run_benchmark --compare baseline.json --tolerance 0.2
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+from typing import List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(q * (len(values) - 1)))))
+    return values[index]
+
+def peak_rss_mb() -> float:
+    # ru_maxrss в Linux измеряется в килобайтах, в macOS - в байтах
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / (1024 if sys.platform == 'darwin' else 1)
+
+def configure_environment(args, workdir: str):
+    """Настраивает окружение бота до его импорта"""
+    os.environ['DEDUP_DB_PATH'] = os.path.join(workdir, 'processed_messages.db')
+    os.environ['MEDIA_CACHE_PATH'] = os.path.join(workdir, 'media_cache.db')
+    os.environ['OUTBOX_PATH'] = os.path.join(workdir, 'outbox.db')
+    os.environ['MEDIA_SPOOL_DIR'] = os.path.join(workdir, 'spool')
+    os.environ['METRICS_PORT'] = '0'
+    os.environ['METRICS_LOG_INTERVAL'] = '0'
+    if not args.realistic_limits:
+        # Лимиты Telegram на отправку в один чат сделали бы замер неинформативным
+        os.environ.setdefault('SEND_GLOBAL_RATE', '100000')
+        os.environ.setdefault('SEND_PER_CHAT_RATE', '6000000')
+
+async def run(args) -> dict:
+    import logging
+    logging.disable(logging.INFO if not args.verbose else logging.NOTSET)
+
+    import medical_monitor_bot as bot
+    from benchmarks.fake_telegram import FakeTelegramClient
+    from benchmarks.events import build_event, generate_records, load_records, replay, save_records
+
+    fake = FakeTelegramClient(
+        latency=args.latency, jitter=args.jitter,
+        flood_probability=args.flood_probability, flood_seconds=args.flood_seconds,
+        expired_probability=args.expired_probability,
+        download_speed=args.download_speed * 1024 * 1024, seed=args.seed
+    )
+    bot.client = fake
+    bot.media_forwarder.client = fake
+
+    if args.replay:
+        records = load_records(args.replay)
+    else:
+        records = generate_records(args.events, rate=args.rate, seed=args.seed,
+                                   photo_size=args.photo_size * 1024)
+    if args.record:
+        save_records(records, args.record)
+
+    chats = {}
+    dispatched = {}
+    handlers = []
+
+    bot.send_queue.start()
+    start = time.perf_counter()
+    async for record in replay(records, args.speed):
+        event = build_event(record, fake, chats)
+        dispatched.setdefault(record['bench_id'], time.perf_counter())
+        handlers.append(asyncio.create_task(bot.handle_new_message(event)))
+    ingest_done = time.perf_counter()
+
+    await asyncio.gather(*handlers)
+    while len(bot.album_aggregator):
+        await asyncio.sleep(0.01)
+    if bot.digest_buffer is not None:
+        await bot.digest_buffer.flush_all()
+    await bot.send_queue.stop(drain=True)
+    finished = time.perf_counter()
+
+    latencies = [fake.delivered[b] - dispatched[b] for b in fake.delivered if b in dispatched]
+    elapsed = finished - start
+    result = {
+        'events': len(records),
+        'delivered': len(fake.delivered),
+        'elapsed_seconds': round(elapsed, 3),
+        'ingest_seconds': round(ingest_done - start, 3),
+        'messages_per_second': round(len(records) / elapsed, 2) if elapsed else None,
+        'latency_p50_ms': round(percentile(latencies, 0.5) * 1000, 2) if latencies else None,
+        'latency_p99_ms': round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'api_calls': fake.calls,
+        'flood_waits': fake.flood_waits,
+        'forwarder': dict(bot.media_forwarder.stats),
+    }
+    bot.dedup_store.close()
+    bot.outbox.close()
+    bot.upload_cache.close()
+    bot.media_spool.close()
+    bot.image_transcoder.close()
+    return result
+
+def compare(result: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Возвращает список регрессий относительно базового замера"""
+    regressions = []
+    if baseline.get('messages_per_second') and result['messages_per_second'] is not None:
+        if result['messages_per_second'] < baseline['messages_per_second'] * (1 - tolerance):
+            regressions.append(f"пропускная способность: {result['messages_per_second']} < "
+                               f"{baseline['messages_per_second']}")
+    for key in ('latency_p50_ms', 'latency_p99_ms', 'peak_rss_mb'):
+        if baseline.get(key) and result.get(key) is not None:
+            if result[key] > baseline[key] * (1 + tolerance):
+                regressions.append(f"{key}: {result[key]} > {baseline[key]}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк медицинского мониторинг-бота")
+    parser.add_argument('--events', type=int, default=1000, help="количество синтетических событий")
+    parser.add_argument('--rate', type=float, default=100.0, help="частота событий в секунду")
+    parser.add_argument('--speed', type=float, default=1.0, help="ускорение воспроизведения")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--photo-size', type=int, default=200, help="средний размер фото, КБ")
+    parser.add_argument('--latency', type=float, default=0.05, help="задержка API, с")
+    parser.add_argument('--jitter', type=float, default=0.02, help="разброс задержки API, с")
+    parser.add_argument('--flood-probability', type=float, default=0.0)
+    parser.add_argument('--flood-seconds', type=int, default=1)
+    parser.add_argument('--expired-probability', type=float, default=0.0,
+                        help="доля отправок медиа с устаревшей ссылкой на файл")
+    parser.add_argument('--download-speed', type=float, default=20.0, help="скорость скачивания, МБ/с")
+    parser.add_argument('--realistic-limits', action='store_true',
+                        help="не снимать лимиты скорости отправки")
+    parser.add_argument('--record', help="сохранить поток событий в JSONL")
+    parser.add_argument('--replay', help="воспроизвести поток событий из JSONL")
+    parser.add_argument('--json', help="сохранить результат в JSON")
+    parser.add_argument('--compare', help="сравнить с результатом из JSON")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="допустимое ухудшение (доля)")
+    parser.add_argument('--verbose', action='store_true', help="не отключать логи бота")
+    args = parser.parse_args()
+
+    # Пути из аргументов считаются от текущего каталога, а сессия, базы и
+    # логи бота создаются во временном каталоге
+    for option in ('record', 'replay', 'json', 'compare'):
+        if getattr(args, option):
+            setattr(args, option, os.path.abspath(getattr(args, option)))
+    sys.path.insert(0, REPO_ROOT)
+    with tempfile.TemporaryDirectory(prefix='medbot-bench-') as workdir:
+        os.chdir(workdir)
+        configure_environment(args, workdir)
+        try:
+            result = asyncio.run(run(args))
+        finally:
+            # Текущий каталог нужно покинуть до удаления временного
+            os.chdir(REPO_ROOT)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        if regressions:
+            print("Обнаружены регрессии:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print("Регрессий не обнаружено")
+
+if __name__ == '__main__':
+    main()
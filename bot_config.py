@@ -0,0 +1,225 @@
+"""
+Конфигурация бота: учетные данные, каналы-источники и период мониторинга
+
+Модуль не импортирует Telethon и ничего не запускает при импорте, поэтому
+его могут использовать менеджер бота и вспомогательные скрипты. Каналы и
+период мониторинга загружаются при первом обращении и могут быть
+перечитаны из файла CHANNELS_CONFIG_PATH на лету (reload).
+"""
+
+import os
+import json
+import signal
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Учетные данные Telegram
+API_ID = int(os.getenv('API_ID', '27717201'))
+API_HASH = os.getenv('API_HASH', 'f64bbdb83fc622bcc52f2740348457c3')
+BOT_TOKEN = os.getenv('BOT_TOKEN', '8325424545:AAEOUPCJYp0KFjnNUoTwUmzRfOkGt798dQE')
+
+DESTINATION_CHANNEL = os.getenv('DESTINATION_CHANNEL', '@medical_news_aggregator')  # Целевой канал
+
+# Файл с каналами и периодом мониторинга (без него используются значения ниже)
+CHANNELS_CONFIG_PATH = os.getenv('CHANNELS_CONFIG_PATH') or None
+
+# Каналы-источники по умолчанию
+DEFAULT_SOURCE_CHANNELS = [
+    "https://t.me/docters_smp",
+    "https://t.me/onco_beseda",
+    "https://t.me/minzdrav_ru",
+    "https://t.me/immunobee",
+    "https://t.me/PSOmedics",
+    "https://t.me/DrButriy",
+    "https://t.me/dr_komarovskiy",
+    "https://t.me/mediamedics",
+    "https://t.me/medach",
+    "https://t.me/redcross_ru",
+    "https://t.me/oncolya",
+    "https://t.me/ru2ch_ban",
+    "https://t.me/pornhub_pr",
+    "https://t.me/Eric_Davidich_D3",
+    "https://t.me/labkovskiy",
+    "https://t.me/toplesofficial",
+    "https://t.me/naebnet",
+    "https://t.me/Wylsared"
+]
+
+# Временные рамки мониторинга по умолчанию
+DEFAULT_START_DATE = datetime(2025, 8, 17, 20, 0, 0, tzinfo=timezone.utc)
+DEFAULT_END_DATE = datetime(2026, 8, 17, 20, 0, 0, tzinfo=timezone.utc)
+
+class MonitorConfig:
+    """Перечитываемая часть конфигурации: каналы-источники и период мониторинга"""
+
+    __slots__ = ('source_channels', 'start_date', 'end_date')
+
+    def __init__(self, source_channels: List[str], start_date: datetime, end_date: datetime):
+        if start_date > end_date:
+            raise ValueError(f"Начало периода мониторинга позже конца: {start_date} > {end_date}")
+        self.source_channels = list(source_channels)
+        self.start_date = start_date
+        self.end_date = end_date
+
+    def __eq__(self, other) -> bool:
+        return (isinstance(other, MonitorConfig)
+                and self.source_channels == other.source_channels
+                and self.start_date == other.start_date
+                and self.end_date == other.end_date)
+
+    @staticmethod
+    def _parse_date(value: str) -> datetime:
+        date = datetime.fromisoformat(value)
+        # Дата без часового пояса считается в UTC, как и даты сообщений Telegram
+        return date if date.tzinfo else date.replace(tzinfo=timezone.utc)
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> 'MonitorConfig':
+        """
+        Загружает каналы и период мониторинга
+
+        Формат файла: {"source_channels": [...], "start_date": "2025-08-17T20:00:00+00:00",
+        "end_date": "..."}; отсутствующие ключи берутся из значений по умолчанию.
+
+        Args:
+            path: Путь к JSON-файлу (None - значения по умолчанию)
+        """
+        data = {}
+        if path:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        channels = data.get('source_channels', DEFAULT_SOURCE_CHANNELS)
+        if not isinstance(channels, list) or not all(isinstance(c, str) for c in channels):
+            raise ValueError("source_channels должен быть списком строк")
+        return cls(
+            channels,
+            cls._parse_date(data['start_date']) if 'start_date' in data else DEFAULT_START_DATE,
+            cls._parse_date(data['end_date']) if 'end_date' in data else DEFAULT_END_DATE
+        )
+
+_current: Optional[MonitorConfig] = None
+
+def current() -> MonitorConfig:
+    """Действующая конфигурация (загружается при первом обращении)"""
+    global _current
+    if _current is None:
+        _current = MonitorConfig.load(CHANNELS_CONFIG_PATH)
+    return _current
+
+def reload() -> Tuple[MonitorConfig, MonitorConfig]:
+    """
+    Перечитывает файл конфигурации
+
+    При ошибке в файле исключение пробрасывается, а действующая
+    конфигурация не меняется.
+
+    Returns:
+        (прежняя конфигурация, новая конфигурация)
+    """
+    global _current
+    previous = current()
+    _current = MonitorConfig.load(CHANNELS_CONFIG_PATH)
+    return previous, _current
+
+# Старые имена констант модуля читают действующую конфигурацию
+_ATTRIBUTES = {
+    'SOURCE_CHANNELS': 'source_channels',
+    'START_DATE': 'start_date',
+    'END_DATE': 'end_date',
+}
+
+def __getattr__(name: str):
+    if name in _ATTRIBUTES:
+        return getattr(current(), _ATTRIBUTES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+class ConfigWatcher:
+    """
+    Перечитывание конфигурации по SIGHUP и при изменении файла
+
+    Файл проверяется раз в interval секунд по времени изменения и размеру.
+    Если новая конфигурация отличается от действующей, вызывается
+    on_change(прежняя, новая). Ошибка в файле записывается в лог, бот
+    продолжает работать с прежней конфигурацией.
+    """
+
+    def __init__(self, on_change: Callable[[MonitorConfig, MonitorConfig], Awaitable],
+                 path: Optional[str] = CHANNELS_CONFIG_PATH, interval: float = 5.0):
+        """
+        Args:
+            on_change: Корутина применения новой конфигурации
+            path: Отслеживаемый файл (None - только SIGHUP)
+            interval: Период проверки файла, с (0 - не проверять)
+        """
+        self.on_change = on_change
+        self.path = path
+        self.interval = interval
+        self._stamp = self._file_stamp()
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self._signal_installed = False
+        self.reloads = 0
+
+    def _file_stamp(self):
+        if not self.path:
+            return None
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    async def reload(self, reason: str):
+        """Перечитывает конфигурацию и применяет ее, если она изменилась"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            self._stamp = self._file_stamp()
+            try:
+                previous, config = reload()
+            except Exception as e:
+                logger.error("Конфигурация не перечитана (%s): %s", reason, e)
+                return
+            if config == previous:
+                logger.info("Конфигурация перечитана (%s), изменений нет", reason)
+                return
+            logger.info("Конфигурация перечитана (%s): каналов %d, период %s - %s",
+                        reason, len(config.source_channels), config.start_date, config.end_date)
+            self.reloads += 1
+            try:
+                await self.on_change(previous, config)
+            except Exception as e:
+                logger.error("Ошибка при применении новой конфигурации: %s", e)
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if self._file_stamp() != self._stamp:
+                await self.reload("файл изменен")
+
+    def start(self):
+        """Подписывается на SIGHUP и запускает проверку файла"""
+        loop = asyncio.get_running_loop()
+        if hasattr(signal, 'SIGHUP'):
+            try:
+                loop.add_signal_handler(
+                    signal.SIGHUP, lambda: loop.create_task(self.reload("SIGHUP")))
+                self._signal_installed = True
+            except (NotImplementedError, RuntimeError) as e:
+                # Обработчик сигналов можно установить только в основном потоке
+                logger.warning("SIGHUP не будет перечитывать конфигурацию: %s", e)
+        if self.path and self.interval > 0:
+            self._task = loop.create_task(self._poll())
+
+    def stop(self):
+        """Отписывается от SIGHUP и останавливает проверку файла"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._signal_installed:
+            asyncio.get_running_loop().remove_signal_handler(signal.SIGHUP)
+            self._signal_installed = False
@@ -4,22 +4,34 @@
 Предоставляет дополнительные функции управления и мониторинга
 """
 
+import os
 import asyncio
 import logging
 from datetime import datetime, timezone
 from telethon import TelegramClient
-from medical_monitor_bot import (
-    API_ID, API_HASH, BOT_TOKEN, SOURCE_CHANNELS, 
-    DESTINATION_CHANNEL, START_DATE, END_DATE
-)
+from telethon.tl.functions.channels import GetFullChannelRequest
+from entity_cache import EntityCache
+# Легкий модуль конфигурации: импорт бота создал бы второй клиент и настроил логи
+import bot_config
+from bot_config import API_ID, API_HASH, BOT_TOKEN, DESTINATION_CHANNEL
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class BotManager:
+    # Сколько запросов GetFullChannel отправлять одним контейнером
+    FULL_INFO_BATCH_SIZE = 10
+    
     def __init__(self):
         self.client = TelegramClient('bot_manager', API_ID, API_HASH)
+        # Общий для всех проверок кэш каналов (переживает перезапуск менеджера)
+        self.entity_cache = EntityCache(
+            self.client,
+            os.getenv('ENTITY_CACHE_PATH', 'entity_cache.db'),
+            ttl=float(os.getenv('ENTITY_CACHE_TTL', str(EntityCache.DEFAULT_TTL))),
+            concurrency=int(os.getenv('RESOLVE_CONCURRENCY', '4'))
+        )
         
     async def start(self):
         """Запуск менеджера"""
@@ -29,6 +41,7 @@ class BotManager:
     async def stop(self):
         """Остановка менеджера"""
         await self.client.disconnect()
+        self.entity_cache.close()
         logger.info("Менеджер бота остановлен")
         
     async def check_channel_access(self):
@@ -38,16 +51,18 @@ class BotManager:
         accessible_channels = []
         inaccessible_channels = []
         
-        for channel in SOURCE_CHANNELS:
-            try:
-                entity = await self.client.get_entity(channel)
+        # Каналы разрешаются параллельно, повторные проверки берут их из кэша
+        source_channels = bot_config.current().source_channels
+        resolved, failed = await self.entity_cache.resolve_many(source_channels)
+        for channel in source_channels:
+            if channel in resolved:
                 accessible_channels.append(channel)
                 logger.info(f"✓ Доступен: {channel}")
-            except Exception as e:
+            else:
                 inaccessible_channels.append(channel)
-                logger.warning(f"✗ Недоступен: {channel} - {e}")
+                logger.warning(f"✗ Недоступен: {channel} - {failed[channel]}")
                 
-        logger.info(f"Доступных каналов: {len(accessible_channels)}/{len(SOURCE_CHANNELS)}")
+        logger.info(f"Доступных каналов: {len(accessible_channels)}/{len(source_channels)}")
         
         if inaccessible_channels:
             logger.warning("Недоступные каналы:")
@@ -59,7 +74,7 @@ class BotManager:
     async def check_destination_channel(self):
         """Проверка целевого канала"""
         try:
-            entity = await self.client.get_entity(DESTINATION_CHANNEL)
+            entity = await self.entity_cache.get_entity(DESTINATION_CHANNEL)
             participant = await self.client.get_permissions(entity)
             
             logger.info(f"Целевой канал: {DESTINATION_CHANNEL}")
@@ -73,17 +88,52 @@ class BotManager:
             
     async def get_channel_info(self, channel_url):
         """Получение информации о канале"""
+        return (await self.get_channels_info([channel_url])).get(channel_url)
+        
+    async def get_channels_info(self, channel_urls):
+        """
+        Получение информации о нескольких каналах
+        
+        Полная информация запрашивается пачками: несколько GetFullChannel
+        отправляются одним контейнером.
+        
+        Returns:
+            Словарь {ссылка: информация о канале}
+        """
+        resolved, failed = await self.entity_cache.resolve_many(channel_urls)
+        for channel_url, error in failed.items():
+            logger.error(f"Ошибка получения информации о канале {channel_url}: {error}")
+            
+        channels = [url for url in channel_urls if url in resolved]
+        info = {}
+        for i in range(0, len(channels), self.FULL_INFO_BATCH_SIZE):
+            batch = channels[i:i + self.FULL_INFO_BATCH_SIZE]
+            try:
+                full_results = await self.client(
+                    [GetFullChannelRequest(resolved[url]) for url in batch])
+            except Exception as e:
+                # Один недоступный канал не должен скрывать информацию об остальных
+                logger.warning(f"Ошибка пакетного запроса информации о каналах ({e}), запрос по одному")
+                full_results = [await self._get_full_channel(url, resolved[url]) for url in batch]
+                
+            for channel_url, full in zip(batch, full_results):
+                entity = resolved[channel_url]
+                full_chat = full.full_chat if full else None
+                info[channel_url] = {
+                    'id': entity.id,
+                    'title': getattr(entity, 'title', 'Неизвестно'),
+                    'username': getattr(entity, 'username', None) or 'Нет',
+                    'participants_count': getattr(full_chat, 'participants_count', None) or 'Неизвестно',
+                    'description': getattr(full_chat, 'about', None) or 'Нет описания'
+                }
+        return info
+            
+    async def _get_full_channel(self, channel_url: str, entity):
+        """Полная информация об одном канале или None при ошибке"""
         try:
-            entity = await self.client.get_entity(channel_url)
-            return {
-                'id': entity.id,
-                'title': getattr(entity, 'title', 'Неизвестно'),
-                'username': getattr(entity, 'username', 'Нет'),
-                'participants_count': getattr(entity, 'participants_count', 'Неизвестно'),
-                'description': getattr(entity, 'about', 'Нет описания')
-            }
+            return await self.client(GetFullChannelRequest(entity))
         except Exception as e:
-            logger.error(f"Ошибка получения информации о канале {channel_url}: {e}")
+            logger.error(f"Ошибка получения полной информации о канале {channel_url}: {e}")
             return None
             
     async def test_message_sending(self):
@@ -100,23 +150,25 @@ class BotManager:
     async def get_monitoring_status(self):
         """Получение статуса мониторинга"""
         now = datetime.now(timezone.utc)
+        config = bot_config.current()
+        start_date, end_date = config.start_date, config.end_date
         
         status = {
             'current_time': now,
-            'monitoring_active': START_DATE <= now <= END_DATE,
-            'days_until_start': (START_DATE - now).days if now < START_DATE else 0,
-            'days_until_end': (END_DATE - now).days if now < END_DATE else 0,
-            'start_date': START_DATE,
-            'end_date': END_DATE
+            'monitoring_active': start_date <= now <= end_date,
+            'days_until_start': (start_date - now).days if now < start_date else 0,
+            'days_until_end': (end_date - now).days if now < end_date else 0,
+            'start_date': start_date,
+            'end_date': end_date
         }
         
         logger.info("Статус мониторинга:")
         logger.info(f"  Текущее время: {status['current_time']}")
         logger.info(f"  Мониторинг активен: {'Да' if status['monitoring_active'] else 'Нет'}")
         
-        if now < START_DATE:
+        if now < start_date:
             logger.info(f"  До начала мониторинга: {status['days_until_start']} дней")
-        elif now > END_DATE:
+        elif now > end_date:
             logger.info(f"  Мониторинг завершен: {abs(status['days_until_end'])} дней назад")
         else:
             logger.info(f"  До окончания мониторинга: {status['days_until_end']} дней")
@@ -153,10 +205,9 @@ async def main():
         
         # Информация о каналах
         print("Информация о каналах:")
-        for channel in accessible[:3]:  # Показываем только первые 3 канала
-            info = await manager.get_channel_info(channel)
-            if info:
-                print(f"  {info['title']} (@{info['username']}) - {info['participants_count']} участников")
+        channels_info = await manager.get_channels_info(accessible[:3])  # Показываем только первые 3 канала
+        for info in channels_info.values():
+            print(f"  {info['title']} (@{info['username']}) - {info['participants_count']} участников")
         print()
         
         print("Проверка завершена!")
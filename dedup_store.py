@@ -0,0 +1,191 @@
+"""
+Персистентное хранилище ключей дедупликации для медицинского мониторинг-бота
+"""
+
+import math
+import asyncio
+import sqlite3
+import hashlib
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class BloomFilter:
+    """Фильтр Блума фиксированного размера для быстрых отрицательных ответов"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        # Оптимальные размеры: m = -n*ln(p)/ln(2)^2, k = m/n*ln(2)
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, min(4, round(self.num_bits / capacity * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, digest: bytes):
+        # Дайджест MD5 уже равномерно распределен, поэтому берем из него 4-байтные срезы
+        for i in range(self.num_hashes):
+            yield int.from_bytes(digest[i * 4:(i + 1) * 4], 'little') % self.num_bits
+
+    def add(self, digest: bytes):
+        """Добавляет ключ в фильтр"""
+        for pos in self._positions(digest):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, digest: bytes) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(digest))
+
+    def clear(self):
+        """Сбрасывает все биты фильтра"""
+        self.bits = bytearray(len(self.bits))
+
+class DedupStore:
+    """
+    Хранилище обработанных сообщений с фиксированным бюджетом памяти
+
+    Ключи (16-байтные дайджесты MD5) хранятся в SQLite в режиме WAL и
+    переживают перезапуск бота. Перед базой стоят фильтр Блума, который
+    отсекает новые сообщения без обращения к диску, и LRU-кэш недавно
+    просмотренных ключей. Удаление устаревших ключей и перестроение фильтра
+    выполняются в отдельном потоке со своим соединением.
+    """
+
+    DEFAULT_CACHE_SIZE = 50000
+    DEFAULT_BLOOM_CAPACITY = 2000000
+    EVICT_BATCH = 10000
+
+    def __init__(self, db_path: str = 'processed_messages.db',
+                 cache_size: int = DEFAULT_CACHE_SIZE,
+                 bloom_capacity: int = DEFAULT_BLOOM_CAPACITY):
+        self.db_path = db_path
+        self.cache_size = cache_size
+        self.bloom_capacity = bloom_capacity
+        self._cache: OrderedDict = OrderedDict()
+        self._bloom = BloomFilter(bloom_capacity)
+        # Ключи, добавленные, пока в фоне строится новый фильтр Блума
+        self._added_during_rebuild: Optional[List[bytes]] = None
+        self._evict_lock: Optional[asyncio.Lock] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='dedup')
+
+        self._db = sqlite3.connect(db_path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS processed ("
+            "digest BLOB PRIMARY KEY, ts INTEGER NOT NULL) WITHOUT ROWID"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS processed_ts ON processed(ts)")
+        self._db.commit()
+
+        self._load_bloom()
+
+    @staticmethod
+    def digest(data: str) -> bytes:
+        """Вычисляет 16-байтный ключ дедупликации"""
+        return hashlib.md5(data.encode()).digest()
+
+    def _load_bloom(self):
+        """Заполняет фильтр Блума ключами из базы"""
+        self._bloom.clear()
+        count = 0
+        for (digest,) in self._db.execute("SELECT digest FROM processed"):
+            self._bloom.add(digest)
+            count += 1
+        logger.info(f"Загружено ключей дедупликации: {count} ({self.db_path})")
+
+    def _remember(self, digest: bytes):
+        self._cache[digest] = True
+        self._cache.move_to_end(digest)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def __contains__(self, digest: bytes) -> bool:
+        if digest in self._cache:
+            self._cache.move_to_end(digest)
+            return True
+        if digest not in self._bloom:
+            return False
+        row = self._db.execute(
+            "SELECT 1 FROM processed WHERE digest = ?", (digest,)
+        ).fetchone()
+        if row:
+            self._remember(digest)
+            return True
+        return False
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM processed").fetchone()[0]
+
+    def add(self, digest: bytes, message_date: Optional[datetime] = None):
+        """Помечает сообщение как обработанное"""
+        ts = int((message_date or datetime.now()).timestamp())
+        self._db.execute(
+            "INSERT OR REPLACE INTO processed (digest, ts) VALUES (?, ?)", (digest, ts)
+        )
+        self._db.commit()
+        self._bloom.add(digest)
+        if self._added_during_rebuild is not None:
+            self._added_during_rebuild.append(digest)
+        self._remember(digest)
+
+    def _evict(self, start_ts: int, end_ts: int) -> Tuple[int, Optional[BloomFilter]]:
+        """Удаляет ключи вне периода и строит новый фильтр Блума (в потоке хранилища)"""
+        db = sqlite3.connect(self.db_path)
+        try:
+            removed = 0
+            while True:
+                # Удаление частями: запись бота ждет блокировку базы не дольше одной части
+                cursor = db.execute(
+                    "DELETE FROM processed WHERE digest IN (SELECT digest FROM processed "
+                    "WHERE ts < ? OR ts > ? LIMIT ?)", (start_ts, end_ts, self.EVICT_BATCH)
+                )
+                db.commit()
+                removed += cursor.rowcount
+                if cursor.rowcount < self.EVICT_BATCH:
+                    break
+            if not removed:
+                return 0, None
+            bloom = BloomFilter(self.bloom_capacity)
+            for (digest,) in db.execute("SELECT digest FROM processed"):
+                bloom.add(digest)
+            return removed, bloom
+        finally:
+            db.close()
+
+    async def evict_outside_window(self, start_date: datetime, end_date: datetime) -> int:
+        """
+        Удаляет ключи сообщений вне периода мониторинга
+
+        Такие сообщения все равно отбрасываются фильтром по датам, поэтому
+        хранить их ключи не нужно. Фильтр Блума без удаленных ключей строится
+        в фоне и подменяет прежний; ключи, добавленные за это время, переносятся
+        в новый фильтр.
+
+        Returns:
+            Количество удаленных ключей
+        """
+        if self._evict_lock is None:
+            self._evict_lock = asyncio.Lock()
+        async with self._evict_lock:
+            self._added_during_rebuild = []
+            try:
+                removed, bloom = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, self._evict,
+                    int(start_date.timestamp()), int(end_date.timestamp())
+                )
+                if bloom is not None:
+                    for digest in self._added_during_rebuild:
+                        bloom.add(digest)
+                    self._bloom = bloom
+            finally:
+                self._added_during_rebuild = None
+        if removed:
+            self._cache.clear()
+            logger.info(f"Удалено устаревших ключей дедупликации: {removed}")
+        return removed
+
+    def close(self):
+        """Закрывает базу данных"""
+        self._executor.shutdown(wait=True)
+        self._db.close()
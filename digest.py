@@ -0,0 +1,161 @@
+"""
+Объединение текстовых сообщений в дайджесты при всплесках публикаций
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Hashable, List
+from send_queue import SendJob
+
+logger = logging.getLogger(__name__)
+
+class DigestItem:
+    """Текстовое сообщение, ожидающее отправки в составе дайджеста"""
+
+    __slots__ = ('source', 'text', 'job')
+
+    def __init__(self, source: str, text: str, job: SendJob):
+        self.source = source
+        self.text = text
+        self.job = job
+
+class DigestBuffer:
+    """
+    Накопитель текстовых сообщений для канала назначения
+
+    Текстовые сообщения не отправляются сразу, а копятся в течение window
+    секунд после первого сообщения в буфере (по каналу назначения или по паре
+    канал назначения - источник). Затем они объединяются в как можно меньше
+    постов не длиннее MAX_MESSAGE_LENGTH, каждое с указанием источника.
+    Буфер отправляется раньше, если следующее сообщение уже не помещается в
+    пост или набрано max_items сообщений. Одиночное сообщение отправляется
+    без изменений.
+
+    Обработчики заданий исходных сообщений (on_success, on_failure, on_done)
+    вызываются по результату отправки поста, в который они вошли.
+    """
+
+    MAX_MESSAGE_LENGTH = 4096
+    SEPARATOR = '\n\n'
+
+    def __init__(self, send_text: Callable[[str, str], Awaitable],
+                 submit: Callable[[SendJob], Awaitable],
+                 window: float = 60.0, max_items: int = 20, per_source: bool = False):
+        """
+        Args:
+            send_text: Корутина отправки текста send_text(канал назначения, текст)
+            submit: Постановка задания в очередь отправки
+            window: Сколько секунд копить сообщения
+            max_items: Максимум сообщений в одном посте
+            per_source: Отдельный буфер для каждого источника
+        """
+        self.send_text = send_text
+        self.submit = submit
+        self.window = window
+        self.max_items = max_items
+        self.per_source = per_source
+        self._items: Dict[Hashable, List[DigestItem]] = {}
+        self._lengths: Dict[Hashable, int] = {}
+        self._timers: Dict[Hashable, asyncio.Task] = {}
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self.stats = {'messages': 0, 'posts': 0}
+
+    @staticmethod
+    def format_item(item: DigestItem) -> str:
+        """Текст сообщения с указанием источника"""
+        return f"**{item.source}**\n{item.text}"
+
+    async def add(self, destination: str, source: str, text: str, job: SendJob):
+        """
+        Добавляет текстовое сообщение в буфер канала назначения
+
+        Args:
+            destination: Канал назначения
+            source: Название канала-источника
+            text: Текст сообщения
+            job: Задание отправки этого сообщения (используются его обработчики)
+        """
+        key = (destination, source) if self.per_source else destination
+        item = DigestItem(source, text, job)
+        length = len(self.format_item(item))
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        # Пока _flush ждет места в очереди отправки, следующие сообщения этого буфера
+        # ждут на блокировке: иначе они попали бы в буфер, который затем перезаписывается
+        async with lock:
+            if length > self.MAX_MESSAGE_LENGTH:
+                # С заголовком сообщение не помещается в пост: оно отправляется отдельно и без
+                # изменений, как вне режима дайджестов (накопленные раньше уходят первыми)
+                await self._flush(key)
+                await self._send(destination, [item])
+                return
+
+            items = self._items.get(key)
+            if items and self._lengths[key] + len(self.SEPARATOR) + length > self.MAX_MESSAGE_LENGTH:
+                await self._flush(key)
+                items = None
+
+            if not items:
+                self._items[key] = [item]
+                self._lengths[key] = length
+                self._timers[key] = asyncio.create_task(self._flush_later(key))
+            else:
+                items.append(item)
+                self._lengths[key] += len(self.SEPARATOR) + length
+
+            if len(self._items[key]) >= self.max_items:
+                await self._flush(key)
+
+    def __len__(self) -> int:
+        return sum(len(items) for items in self._items.values())
+
+    async def _flush_later(self, key: Hashable):
+        await asyncio.sleep(self.window)
+        self._timers.pop(key, None)
+        try:
+            await self._flush(key)
+        except Exception as e:
+            logger.error("Ошибка при отправке дайджеста: %s", e)
+
+    async def _flush(self, key: Hashable):
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        items = self._items.pop(key, [])
+        self._lengths.pop(key, None)
+        if items:
+            await self._send(key[0] if self.per_source else key, items)
+
+    async def _send(self, destination: str, items: List[DigestItem]):
+        if len(items) == 1:
+            text = items[0].text
+        else:
+            text = self.SEPARATOR.join(self.format_item(item) for item in items)
+        jobs = [item.job for item in items]
+
+        def notify(name: str):
+            def callback():
+                for job in jobs:
+                    handler = getattr(job, name)
+                    if handler:
+                        handler()
+            return callback
+
+        self.stats['messages'] += len(items)
+        self.stats['posts'] += 1
+        if len(items) > 1:
+            logger.info("Дайджест для %s: %d сообщений в одном посте", destination, len(items))
+        await self.submit(SendJob(
+            chat=destination,
+            send=lambda: self.send_text(destination, text),
+            on_success=notify('on_success'),
+            on_failure=notify('on_failure'),
+            on_done=notify('on_done'),
+            description=f"дайджест ({len(items)} сообщений)" if len(items) > 1 else jobs[0].description
+        ))
+
+    async def flush_all(self):
+        """Немедленно отправляет все накопленные сообщения (при остановке бота)"""
+        for key in list(self._items):
+            await self._flush(key)
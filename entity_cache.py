@@ -0,0 +1,159 @@
+"""
+Персистентный кэш сущностей Telegram (каналов) с ограниченным параллелизмом разрешения
+"""
+
+import time
+import sqlite3
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+from telethon import utils
+from telethon.extensions import BinaryReader
+
+logger = logging.getLogger(__name__)
+
+class EntityCache:
+    """
+    Кэш разрешенных каналов
+
+    Ссылки вида https://t.me/name и @name разрешаются через get_entity не
+    чаще одного раза за TTL: результат (TL-объект Channel/User) хранится в
+    SQLite и в памяти. Одновременные запросы одной и той же ссылки сливаются в
+    один, а число одновременных обращений к API ограничено семафором, чтобы
+    не упираться в лимиты ResolveUsername.
+    """
+
+    DEFAULT_TTL = 24 * 60 * 60  # 24 часа
+
+    def __init__(self, client, db_path: str = 'entity_cache.db',
+                 ttl: float = DEFAULT_TTL, concurrency: int = 4):
+        self.client = client
+        self.db_path = db_path
+        self.ttl = ttl
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._memory: Dict[str, Tuple[object, float]] = {}
+        self._pending: Dict[str, asyncio.Future] = {}
+
+        self._db = sqlite3.connect(db_path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entities ("
+            "key TEXT PRIMARY KEY, entity BLOB NOT NULL, resolved REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    @staticmethod
+    def normalize(reference) -> str:
+        """Приводит ссылку на канал к единому ключу"""
+        if isinstance(reference, int):
+            return str(reference)
+        reference = str(reference).strip()
+        for prefix in ('https://', 'http://'):
+            if reference.startswith(prefix):
+                reference = reference[len(prefix):]
+        for prefix in ('t.me/', 'telegram.me/', '@'):
+            if reference.startswith(prefix):
+                reference = reference[len(prefix):]
+        return reference.rstrip('/').lower()
+
+    def get_cached(self, reference, allow_stale: bool = False) -> Optional[object]:
+        """
+        Возвращает сущность из кэша без обращения к API (или None)
+        
+        Args:
+            reference: Ссылка на канал
+            allow_stale: Вернуть запись даже если истек ее TTL
+        """
+        key = self.normalize(reference)
+        entry = self._memory.get(key)
+        if entry is None:
+            row = self._db.execute(
+                "SELECT entity, resolved FROM entities WHERE key = ?", (key,)
+            ).fetchone()
+            if row:
+                try:
+                    entry = (BinaryReader(row[0]).tgread_object(), row[1])
+                except Exception as e:
+                    logger.warning(f"Поврежденная запись кэша сущностей {key}: {e}")
+                    return None
+                self._memory[key] = entry
+        if entry is None or (not allow_stale and time.time() - entry[1] > self.ttl):
+            return None
+        return entry[0]
+
+    def put(self, reference, entity):
+        """Сохраняет сущность в кэш"""
+        key = self.normalize(reference)
+        resolved = time.time()
+        self._memory[key] = (entity, resolved)
+        self._db.execute(
+            "INSERT OR REPLACE INTO entities (key, entity, resolved) VALUES (?, ?, ?)",
+            (key, bytes(entity), resolved)
+        )
+        self._db.commit()
+
+    async def get_entity(self, reference):
+        """Возвращает сущность канала, обращаясь к API только при промахе кэша"""
+        entity = self.get_cached(reference)
+        if entity is not None:
+            return entity
+
+        key = self.normalize(reference)
+        pending = self._pending.get(key)
+        if pending is not None:
+            # Отмена ожидающего не должна отменять общий запрос
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            async with self._semaphore:
+                entity = await self.client.get_entity(reference)
+            self.put(reference, entity)
+            future.set_result(entity)
+            return entity
+        except Exception as e:
+            # Если ссылка временно не разрешается, используем устаревшую запись
+            stale = self.get_cached(reference, allow_stale=True)
+            if stale is not None:
+                logger.warning(f"Не удалось обновить {reference} ({e}), используется кэш")
+                future.set_result(stale)
+                return stale
+            future.set_exception(e)
+            # Исключение уже передано ожидающим, здесь его не нужно доставать повторно
+            future.exception()
+            raise
+        except asyncio.CancelledError:
+            # Запрос отменен вместе с вызвавшей его задачей: ожидающие не должны зависнуть
+            future.set_exception(RuntimeError(f"Разрешение {reference} отменено"))
+            future.exception()
+            raise
+        finally:
+            del self._pending[key]
+
+    async def resolve_many(self, references: List) -> Tuple[Dict, Dict]:
+        """
+        Разрешает несколько ссылок параллельно
+
+        Returns:
+            Tuple[{ссылка: сущность}, {ссылка: ошибка}]
+        """
+        results = await asyncio.gather(
+            *(self.get_entity(reference) for reference in references),
+            return_exceptions=True
+        )
+        resolved, failed = {}, {}
+        for reference, result in zip(references, results):
+            if isinstance(result, Exception):
+                failed[reference] = result
+            else:
+                resolved[reference] = result
+        return resolved, failed
+
+    async def get_input_entity(self, reference):
+        """Возвращает InputPeer канала (id + access_hash) для запросов без повторного разрешения"""
+        return utils.get_input_peer(await self.get_entity(reference))
+
+    def close(self):
+        """Закрывает базу данных"""
+        self._db.close()
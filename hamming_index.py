@@ -0,0 +1,98 @@
+"""
+Индекс 64-битных подписей для поиска по расстоянию Хэмминга
+"""
+
+import time
+from collections import deque
+from itertools import combinations
+from typing import Dict, List, Optional, Set, Tuple
+
+class HammingIndex:
+    """
+    Индекс подписей в скользящем временном окне (multi-index hashing)
+
+    Подпись делится на полосы (bands). Если две подписи отличаются не более
+    чем на max_distance бит, то по принципу Дирихле хотя бы в одной полосе
+    они отличаются не более чем на max_distance // bands бит. Поэтому поиск
+    сводится к обращениям к словарям по ключу полосы и его ближайшим
+    соседям и проверке небольшого числа кандидатов, а не к перебору всего
+    окна.
+    """
+
+    HASH_BITS = 64
+
+    def __init__(self, max_distance: int, window_seconds: float, bands: Optional[int] = None):
+        """
+        Args:
+            max_distance: Порог сходства - максимальное расстояние Хэмминга между подписями
+            window_seconds: Сколько секунд хранить подписи
+            bands: Число полос (по умолчанию max_distance + 1 - совпадение полосы целиком)
+        """
+        self.max_distance = max_distance
+        self.window_seconds = window_seconds
+        self.bands = bands or max_distance + 1
+        self.band_bits = self.HASH_BITS // self.bands
+        self._band_mask = (1 << self.band_bits) - 1
+        # Ключи полосы, отличающиеся от ключа подписи не более чем на radius бит
+        radius = max_distance // self.bands
+        self._flips = [0]
+        for distance in range(1, radius + 1):
+            for bits in combinations(range(self.band_bits), distance):
+                self._flips.append(sum(1 << bit for bit in bits))
+        self._buckets: List[Dict[int, Set[int]]] = [{} for _ in range(self.bands)]
+        # signature -> (время добавления, описание источника)
+        self._entries: Dict[int, Tuple[float, object]] = {}
+        self._order: deque = deque()
+
+    def _band_keys(self, signature: int):
+        for band in range(self.bands):
+            yield band, (signature >> (band * self.band_bits)) & self._band_mask
+
+    def _evict(self, now: float):
+        while self._order and now - self._order[0][0] > self.window_seconds:
+            added, signature = self._order.popleft()
+            entry = self._entries.get(signature)
+            if entry is None or entry[0] != added:
+                continue
+            del self._entries[signature]
+            for band, key in self._band_keys(signature):
+                bucket = self._buckets[band].get(key)
+                if bucket is not None:
+                    bucket.discard(signature)
+                    if not bucket:
+                        del self._buckets[band][key]
+
+    def find(self, signature: int) -> Optional[Tuple[int, object]]:
+        """
+        Ищет похожую подпись в окне
+
+        Returns:
+            Tuple[расстояние Хэмминга, описание источника] или None
+        """
+        self._evict(time.time())
+        best = None
+        seen = set()
+        for band, key in self._band_keys(signature):
+            buckets = self._buckets[band]
+            for flip in self._flips:
+                for candidate in buckets.get(key ^ flip, ()):
+                    if candidate in seen:
+                        continue
+                    seen.add(candidate)
+                    distance = bin(signature ^ candidate).count('1')
+                    if distance <= self.max_distance and (best is None or distance < best[0]):
+                        best = (distance, self._entries[candidate][1])
+                        if distance == 0:
+                            return best
+        return best
+
+    def add(self, signature: int, source: object):
+        """Добавляет подпись в индекс (source возвращается find как описание источника)"""
+        now = time.time()
+        self._entries[signature] = (now, source)
+        self._order.append((now, signature))
+        for band, key in self._band_keys(signature):
+            self._buckets[band].setdefault(key, set()).add(signature)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,102 @@
+"""
+Поиск одинаковых изображений из разных каналов по перцептивному хешу (dHash)
+"""
+
+import io
+import logging
+from typing import Optional, Tuple
+from telethon import utils
+from telethon.tl.types import PhotoCachedSize, PhotoStrippedSize
+from hamming_index import HammingIndex
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow не обязателен: без него поиск похожих изображений отключен
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+class ImageHashIndex(HammingIndex):
+    """
+    Индекс dHash-подписей фото в скользящем временном окне
+
+    dHash сравнивает яркость соседних пикселей уменьшенного до 9x8 серого
+    изображения, поэтому не меняется при пережатии, изменении размера и
+    небольшой цветокоррекции. Подпись считается по миниатюре, которая
+    приходит вместе с сообщением, так что фото не скачивается. Подпись
+    делится на 4 полосы по 16 бит, и при max_distance до 7 поиск проверяет
+    ключ полосы и его соседей на расстоянии 1 бит.
+
+    Вместе с подписью фото хранится SimHash-подпись текста поста: одно и то
+    же фото под другим текстом - это другая новость, а не дубликат.
+    """
+
+    HASH_WIDTH = 9
+    HASH_HEIGHT = 8
+    BANDS = 4
+
+    def __init__(self, max_distance: int = 6, window_seconds: float = 3 * 24 * 60 * 60,
+                 enabled: bool = True):
+        """
+        Args:
+            max_distance: Порог сходства - максимальное расстояние Хэмминга между подписями
+            window_seconds: Сколько секунд хранить подписи
+            enabled: Проверка включена (требует Pillow)
+        """
+        super().__init__(max_distance, window_seconds, bands=min(self.BANDS, max_distance + 1))
+        if enabled and Image is None:
+            logger.warning("Pillow не установлен, поиск одинаковых изображений отключен")
+
+    def add(self, signature: int, source: str, caption: Optional[int] = None):
+        """Добавляет подпись фото вместе с подписью текста поста (None - без текста)"""
+        super().add(signature, (source, caption))
+
+    def find(self, signature: int) -> Optional[Tuple[int, str, Optional[int]]]:
+        """
+        Ищет похожее фото в окне
+
+        Returns:
+            Tuple[расстояние Хэмминга, описание источника, подпись текста] или None
+        """
+        match = super().find(signature)
+        if match is None:
+            return None
+        distance, (source, caption) = match
+        return distance, source, caption
+
+    @classmethod
+    def dhash(cls, data: bytes) -> int:
+        """Вычисляет 64-битный dHash изображения"""
+        image = Image.open(io.BytesIO(data)).convert('L')
+        image = image.resize((cls.HASH_WIDTH, cls.HASH_HEIGHT), Image.LANCZOS)
+        pixels = list(image.getdata())
+        result = 0
+        for row in range(cls.HASH_HEIGHT):
+            offset = row * cls.HASH_WIDTH
+            for col in range(cls.HASH_WIDTH - 1):
+                result = result << 1 | (pixels[offset + col] < pixels[offset + col + 1])
+        return result
+
+    @staticmethod
+    def thumbnail(photo) -> Optional[bytes]:
+        """Миниатюра фото из самого сообщения (JPEG) или None, если ее нет"""
+        for size in getattr(photo, 'sizes', ()):
+            if isinstance(size, PhotoStrippedSize):
+                return utils.stripped_photo_to_jpg(size.bytes)
+            if isinstance(size, PhotoCachedSize):
+                return size.bytes
+        return None
+
+    @classmethod
+    def signature(cls, photo) -> Optional[int]:
+        """dHash-подпись фото по миниатюре (None без Pillow, миниатюры или при ошибке)"""
+        if Image is None:
+            return None
+        data = cls.thumbnail(photo)
+        if not data:
+            return None
+        try:
+            return cls.dhash(data)
+        except Exception as e:
+            logger.debug("Не удалось вычислить хеш изображения: %s", e)
+            return None
@@ -0,0 +1,147 @@
+"""
+Неблокирующая настройка логов: запись в файл и консоль в фоновом потоке
+"""
+
+import json
+import time
+import queue
+import atexit
+import logging
+import logging.handlers
+from typing import Dict, Optional
+
+# Поля LogRecord, которые не считаются пользовательскими (extra)
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись в одну строку JSON (поля из extra добавляются как есть)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+class SamplingFilter(logging.Filter):
+    """
+    Ограничивает частоту массовых сообщений
+
+    Запись с extra={'sample': 'ключ'} пропускается не более burst раз за
+    interval секунд для каждого ключа. Число отброшенных записей добавляется
+    к первой записи следующего интервала. Записи без ключа не ограничиваются.
+    """
+
+    def __init__(self, burst: int = 10, interval: float = 60.0):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        # ключ -> [начало интервала, пропущено, отброшено]
+        self._windows: Dict[str, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, 'sample', None)
+        if key is None or self.burst <= 0:
+            return True
+
+        now = time.monotonic()
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.interval:
+            dropped = window[2] if window else 0
+            window = self._windows[key] = [now, 0, 0]
+            if dropped:
+                record.msg = f"{record.msg} (еще {dropped} подобных записей отброшено)"
+
+        if window[1] >= self.burst:
+            window[2] += 1
+            return False
+        window[1] += 1
+        return True
+
+class _InProcessQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler без форматирования в вызывающем потоке
+
+    Стандартный prepare() форматирует сообщение до постановки в очередь, чтобы
+    запись можно было передать в другой процесс. Очередь здесь внутри процесса,
+    поэтому подстановка аргументов и трейсбеки форматируются в фоновом потоке.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def setup_logging(path: str = 'medical_bot.log', level: int = logging.INFO,
+                  json_format: bool = False, max_bytes: int = 10 * 1024 * 1024,
+                  backup_count: int = 5, rotate_when: Optional[str] = None,
+                  sample_burst: int = 10, sample_interval: float = 60.0) -> logging.handlers.QueueListener:
+    """
+    Настраивает корневой логгер
+
+    Обработчики корневого логгера только кладут записи в очередь, а запись в
+    файл и консоль выполняет QueueListener в отдельном потоке, поэтому
+    дисковый ввод-вывод не блокирует цикл событий.
+
+    Args:
+        path: Файл логов
+        level: Уровень логирования
+        json_format: Писать файл в формате JSON (по записи на строку)
+        max_bytes: Размер файла для ротации (0 - без ротации по размеру)
+        backup_count: Количество хранимых архивных файлов
+        rotate_when: Интервал ротации по времени ('midnight', 'H', ...) вместо размера
+        sample_burst: Лимит массовых записей на ключ за интервал (0 - без ограничения)
+        sample_interval: Интервал ограничения массовых записей, с
+
+    Returns:
+        Запущенный QueueListener (останавливается автоматически при выходе)
+    """
+    global _listener
+    stop_logging()
+
+    text_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if rotate_when:
+        file_handler = logging.handlers.TimedRotatingFileHandler(
+            path, when=rotate_when, backupCount=backup_count, encoding='utf-8'
+        )
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+        )
+    file_handler.setFormatter(JsonFormatter() if json_format else text_formatter)
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(text_formatter)
+
+    log_queue: queue.Queue = queue.Queue(-1)
+    queue_handler = _InProcessQueueHandler(log_queue)
+    # Фильтр стоит до очереди, чтобы отброшенные записи не форматировались вовсе
+    queue_handler.addFilter(SamplingFilter(sample_burst, sample_interval))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, file_handler, console_handler, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+def stop_logging():
+    """Дописывает оставшиеся записи и останавливает фоновый поток"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
@@ -0,0 +1,359 @@
+"""
+Контроль задержки цикла событий, медленных обработчиков и профилирование по запросу
+"""
+
+import io
+import os
+import sys
+import time
+import pstats
+import signal
+import asyncio
+import cProfile
+import logging
+import threading
+import collections
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+from metrics import LOOP_LAG, LOOP_STALLS, SLOW_HANDLERS
+
+logger = logging.getLogger(__name__)
+
+# Каталог проекта: блокирующей считается самая глубокая функция проекта в стеке
+_PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def frame_label(frame, line: bool = True) -> str:
+    """Имя функции кадра с файлом и строкой (или первой строкой функции)"""
+    code = frame.f_code
+    lineno = frame.f_lineno if line else code.co_firstlineno
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{lineno})"
+
+def stack_frames(frame) -> List:
+    """Кадры стека от внешнего к самому глубокому"""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+def blocking_function(frames: List) -> str:
+    """
+    Функция, в которой находится поток
+
+    Если самый глубокий кадр не из проекта (библиотека или stdlib),
+    указывается и вызвавшая его функция проекта.
+    """
+    if not frames:
+        return '?'
+    innermost = frame_label(frames[-1])
+    for frame in reversed(frames):
+        if frame.f_code.co_filename.startswith(_PROJECT_DIR):
+            own = frame_label(frame)
+            return innermost if frame is frames[-1] else f"{innermost} <- {own}"
+    return innermost
+
+class LoopWatchdog:
+    """
+    Сторож цикла событий
+
+    Сердцебиение в цикле событий каждые interval секунд измеряет задержку
+    планирования (гистограмма medbot_loop_lag_seconds). Отдельный поток
+    замечает, что сердцебиение не приходит дольше stall_threshold секунд, и,
+    пока цикл заблокирован, снимает стек потока цикла каждые sample_interval
+    секунд. После разблокировки в лог пишется длительность остановки,
+    функции, в которых чаще всего находился поток, и стек самой частой.
+
+    Вызовы, обернутые в track(), выполняющиеся дольше handler_threshold
+    секунд, записываются в лог со стеком ожидания задачи (например,
+    отправка, ждущая ответа Telegram).
+    """
+
+    # Через сколько секунд непрекращающейся остановки записать стек, не дожидаясь ее конца
+    HANG_REPORT_SECONDS = 10.0
+    TOP_FUNCTIONS = 3
+
+    def __init__(self, stall_threshold: float = 0.25, handler_threshold: float = 10.0,
+                 interval: float = 0.1, sample_interval: float = 0.005):
+        """
+        Args:
+            stall_threshold: Задержка цикла, с которой она считается остановкой, с (0 - не отслеживать)
+            handler_threshold: Длительность отслеживаемого вызова, после которой он
+                считается медленным, с (0 - не отслеживать)
+            interval: Период сердцебиения, с
+            sample_interval: Период снятия стека во время остановки, с
+        """
+        self.stall_threshold = stall_threshold
+        self.handler_threshold = handler_threshold
+        self.interval = interval
+        self.sample_interval = sample_interval
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._beat = time.monotonic()
+        # токен вызова -> (метка, описание, начало, задача)
+        self._active: Dict[object, Tuple[str, Optional[Callable[[], str]], float, asyncio.Task]] = {}
+        self._reported = set()
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self.max_lag = 0.0
+
+    def start(self):
+        """Запускает сердцебиение и поток наблюдения (если включен хотя бы один порог)"""
+        if self.stall_threshold <= 0 and self.handler_threshold <= 0:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        if self.stall_threshold > 0:
+            self._task = self._loop.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+        logger.info("Контроль цикла событий: остановка от %g с, медленный обработчик от %g с",
+                    self.stall_threshold, self.handler_threshold)
+
+    def stop(self):
+        """Останавливает наблюдение"""
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    async def _heartbeat(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self._beat = time.monotonic()
+            lag = max(0.0, self._beat - start - self.interval)
+            LOOP_LAG.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.stall_threshold:
+                LOOP_STALLS.inc()
+
+    def _watch(self):
+        stall_beat = None
+        samples = collections.Counter()
+        stacks: Dict[str, List[str]] = {}
+        hang_reported = False
+        while not self._stopped.wait(self.sample_interval if stall_beat is not None else self.interval):
+            beat = self._beat
+            blocked = time.monotonic() - beat - self.interval
+            if self.stall_threshold > 0 and blocked >= self.stall_threshold:
+                if stall_beat is None:
+                    stall_beat, hang_reported = beat, False
+                    samples.clear()
+                    stacks.clear()
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is not None:
+                    frames = stack_frames(frame)
+                    function = blocking_function(frames)
+                    samples[function] += 1
+                    if function not in stacks:
+                        stacks[function] = [frame_label(f) for f in frames]
+                    del frame, frames
+                if not hang_reported and blocked >= self.HANG_REPORT_SECONDS and samples:
+                    hang_reported = True
+                    function = samples.most_common(1)[0][0]
+                    logger.error("Цикл событий заблокирован уже %.1f с в %s\n  %s",
+                                 blocked, function, '\n  '.join(stacks[function]))
+                continue
+            if stall_beat is not None and beat != stall_beat:
+                self._report_stall(beat - stall_beat - self.interval, samples, stacks)
+                stall_beat = None
+            self._check_handlers()
+
+    def _report_stall(self, duration: float, samples: collections.Counter,
+                      stacks: Dict[str, List[str]]):
+        total = sum(samples.values())
+        if not total:
+            logger.warning("Цикл событий был заблокирован %.3f с (стек не получен)", duration)
+            return
+        top = samples.most_common(self.TOP_FUNCTIONS)
+        logger.warning(
+            "Цикл событий был заблокирован %.3f с; блокирующая функция: %s (%s)\n  %s",
+            duration, top[0][0],
+            ', '.join(f"{function}: {count}/{total}" for function, count in top),
+            '\n  '.join(stacks[top[0][0]]),
+            extra={'sample': 'loop_stall'}
+        )
+
+    def _check_handlers(self):
+        if self.handler_threshold <= 0:
+            return
+        now = time.monotonic()
+        for token, (label, describe, start, task) in list(self._active.items()):
+            if now - start >= self.handler_threshold and token not in self._reported:
+                self._reported.add(token)
+                # Стек задачи можно получить только в потоке цикла событий
+                self._loop.call_soon_threadsafe(self._report_handler, token)
+
+    def _report_handler(self, token: object):
+        active = self._active.get(token)
+        if active is None:
+            # Вызов завершился, пока отчет ждал очереди в цикле событий
+            self._reported.discard(token)
+            return
+        label, describe, start, task = active
+        frames = task.get_stack()
+        waiting = frame_label(frames[-1]) if frames else '?'
+        logger.warning("%s%s выполняется уже %.1f с, ожидает в %s\n  %s",
+                       label, f" ({describe()})" if describe else '', time.monotonic() - start,
+                       waiting, '\n  '.join(frame_label(frame) for frame in frames))
+
+    @contextmanager
+    def track(self, label: str, describe: Optional[Callable[[], str]] = None):
+        """
+        Отслеживает длительность вызова в текущей задаче
+
+        Args:
+            label: Название вызова для лога
+            describe: Функция, возвращающая подробности (вызывается только для медленных)
+        """
+        token = object()
+        start = time.monotonic()
+        self._active[token] = (label, describe, start, asyncio.current_task())
+        try:
+            yield
+        finally:
+            del self._active[token]
+            elapsed = time.monotonic() - start
+            if 0 < self.handler_threshold <= elapsed:
+                SLOW_HANDLERS.inc(label)
+                if token in self._reported:
+                    self._reported.discard(token)
+                    logger.warning("%s завершился через %.1f с", label, elapsed)
+                else:
+                    logger.warning("%s%s выполнялся %.1f с", label,
+                                   f" ({describe()})" if describe else '', elapsed)
+
+class LoopProfiler:
+    """
+    Профилирование потока цикла событий по сигналу SIGUSR1
+
+    Режим cprofile записывает статистику cProfile за duration секунд в файл
+    .prof (открывается pstats или snakeviz) и пишет в лог самые затратные
+    функции. Режим flamegraph снимает стек потока цикла каждые
+    sample_interval секунд и записывает свернутые стеки в файл .folded
+    (формат flamegraph.pl и speedscope). Профилирование не влияет на работу
+    бота, пока не запрошено.
+    """
+
+    MODES = ('cprofile', 'flamegraph')
+    TOP_FUNCTIONS = 15
+
+    def __init__(self, mode: str, directory: str = 'profiles', duration: float = 30.0,
+                 sample_interval: float = 0.005):
+        """
+        Args:
+            mode: cprofile или flamegraph
+            directory: Каталог для файлов профиля
+            duration: Длительность записи профиля, с
+            sample_interval: Период снятия стека в режиме flamegraph, с
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"Неизвестный режим профилирования: {mode} (допустимы: {', '.join(self.MODES)})")
+        self.mode = mode
+        self.directory = directory
+        self.duration = duration
+        self.sample_interval = sample_interval
+        self._running = False
+        self._signal_installed = False
+
+    def start(self):
+        """Подписывается на SIGUSR1"""
+        loop = asyncio.get_running_loop()
+        if not hasattr(signal, 'SIGUSR1'):
+            logger.warning("SIGUSR1 недоступен, профилирование по сигналу отключено")
+            return
+        try:
+            loop.add_signal_handler(signal.SIGUSR1, lambda: loop.create_task(self.run()))
+            self._signal_installed = True
+        except (NotImplementedError, RuntimeError) as e:
+            logger.warning("Профилирование по сигналу отключено: %s", e)
+            return
+        logger.info("Профилирование (%s, %g с) запускается сигналом: kill -USR1 %d",
+                    self.mode, self.duration, os.getpid())
+
+    def stop(self):
+        """Отписывается от SIGUSR1"""
+        if self._signal_installed:
+            asyncio.get_running_loop().remove_signal_handler(signal.SIGUSR1)
+            self._signal_installed = False
+
+    async def run(self, duration: Optional[float] = None) -> Optional[str]:
+        """
+        Записывает профиль за duration секунд
+
+        Returns:
+            Путь к файлу профиля или None, если профилирование уже идет или не удалось
+        """
+        if self._running:
+            logger.warning("Профилирование уже выполняется")
+            return None
+        self._running = True
+        duration = duration or self.duration
+        extension = 'prof' if self.mode == 'cprofile' else 'folded'
+        path = os.path.join(self.directory, f"profile-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.{extension}")
+        loop = asyncio.get_running_loop()
+        logger.info("Профилирование (%s) на %g с...", self.mode, duration)
+        try:
+            if self.mode == 'cprofile':
+                profiler = cProfile.Profile()
+                profiler.enable()
+                try:
+                    await asyncio.sleep(duration)
+                finally:
+                    profiler.disable()
+                report = await loop.run_in_executor(None, self._dump_cprofile, profiler, path)
+            else:
+                stacks = collections.Counter()
+                stopped = threading.Event()
+                sampler = threading.Thread(
+                    target=self._sample, args=(threading.get_ident(), stacks, stopped),
+                    name='loop-profiler', daemon=True)
+                sampler.start()
+                try:
+                    await asyncio.sleep(duration)
+                finally:
+                    stopped.set()
+                    await loop.run_in_executor(None, sampler.join)
+                report = await loop.run_in_executor(None, self._dump_folded, stacks, path)
+            logger.info("Профиль записан в %s\n%s", path, report)
+            return path
+        except Exception as e:
+            logger.error("Ошибка профилирования: %s", e)
+            return None
+        finally:
+            self._running = False
+
+    def _dump_cprofile(self, profiler: cProfile.Profile, path: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        profiler.dump_stats(path)
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('tottime').print_stats(self.TOP_FUNCTIONS)
+        return output.getvalue()
+
+    def _sample(self, thread_id: int, stacks: collections.Counter, stopped: threading.Event):
+        while not stopped.wait(self.sample_interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+            stacks[';'.join(frame_label(f, line=False) for f in stack_frames(frame))] += 1
+            del frame
+
+    def _dump_folded(self, stacks: collections.Counter, path: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        # Самые частые функции на вершине стека
+        leaves = collections.Counter()
+        for stack, count in stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return '\n'.join(f"  {count * 100 / total:5.1f}%  {function}"
+                         for function, count in leaves.most_common(self.TOP_FUNCTIONS))
@@ -0,0 +1,140 @@
+"""
+Кэш загруженных медиа: повторная отправка без повторной загрузки байтов
+"""
+
+import time
+import sqlite3
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Optional
+from telethon.extensions import BinaryReader
+from telethon.tl.types import MessageMediaDocument, MessageMediaPhoto
+
+logger = logging.getLogger(__name__)
+
+class UploadCache:
+    """
+    Кэш дескрипторов загруженных файлов
+
+    Ключами служат идентификатор фото/документа Telegram и хеш содержимого,
+    значениями - TL-объекты InputFile/InputMedia, полученные при первой
+    загрузке. Объекты хранятся в сериализованном виде в SQLite и в LRU-кэше
+    в памяти; записи старше TTL считаются устаревшими.
+    """
+
+    DEFAULT_CAPACITY = 5000
+    DEFAULT_TTL = 24 * 60 * 60  # 24 часа
+
+    def __init__(self, db_path: str = 'media_cache.db',
+                 capacity: int = DEFAULT_CAPACITY, ttl: float = DEFAULT_TTL):
+        self.db_path = db_path
+        self.capacity = capacity
+        self.ttl = ttl
+        self._cache: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        self._db = sqlite3.connect(db_path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS uploads ("
+            "key TEXT PRIMARY KEY, handle BLOB NOT NULL, created REAL NOT NULL)"
+        )
+        self._db.commit()
+        self.evict_expired()
+
+    @staticmethod
+    def media_key(message) -> Optional[str]:
+        """Ключ по идентификатору фото/документа Telegram"""
+        media = message.media
+        if isinstance(media, MessageMediaPhoto) and media.photo:
+            return f"photo:{media.photo.id}"
+        if isinstance(media, MessageMediaDocument) and media.document:
+            return f"document:{media.document.id}"
+        return None
+
+    @staticmethod
+    def content_key(data) -> str:
+        """Ключ по SHA-256 содержимого (bytes, BytesIO или путь к файлу)"""
+        digest = hashlib.sha256()
+        if isinstance(data, str):
+            with open(data, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+        elif isinstance(data, (bytes, bytearray)):
+            digest.update(data)
+        else:
+            digest.update(data.getbuffer())
+        return f"sha256:{digest.hexdigest()}"
+
+    def get(self, key: Optional[str]):
+        """Возвращает TL-объект по ключу или None"""
+        if not key:
+            return None
+
+        entry = self._cache.get(key)
+        if entry is None:
+            row = self._db.execute(
+                "SELECT handle, created FROM uploads WHERE key = ?", (key,)
+            ).fetchone()
+            if row:
+                entry = (BinaryReader(row[0]).tgread_object(), row[1])
+                self._remember(key, entry)
+
+        if entry is None or time.time() - entry[1] > self.ttl:
+            if entry is not None:
+                self.discard(key)
+            self.misses += 1
+            return None
+
+        self._cache.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: Optional[str], handle):
+        """Сохраняет TL-объект по ключу"""
+        if not key or handle is None:
+            return
+        created = time.time()
+        self._db.execute(
+            "INSERT OR REPLACE INTO uploads (key, handle, created) VALUES (?, ?, ?)",
+            (key, bytes(handle), created)
+        )
+        self._db.commit()
+        self._remember(key, (handle, created))
+
+    def discard(self, key: str):
+        """Удаляет запись (например, если дескриптор отвергнут сервером)"""
+        self._cache.pop(key, None)
+        self._db.execute("DELETE FROM uploads WHERE key = ?", (key,))
+        self._db.commit()
+
+    def _remember(self, key: str, entry):
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+
+    def evict_expired(self) -> int:
+        """Удаляет записи старше TTL и ограничивает размер базы емкостью кэша"""
+        cursor = self._db.execute(
+            "DELETE FROM uploads WHERE created < ?", (time.time() - self.ttl,))
+        removed = cursor.rowcount
+        cursor = self._db.execute(
+            "DELETE FROM uploads WHERE key NOT IN "
+            "(SELECT key FROM uploads ORDER BY created DESC LIMIT ?)", (self.capacity * 4,))
+        removed += cursor.rowcount
+        self._db.commit()
+        if removed:
+            logger.info(f"Удалено устаревших записей кэша загрузок: {removed}")
+        return removed
+
+    def stats_summary(self) -> str:
+        """Краткая статистика попаданий в кэш"""
+        return f"попаданий: {self.hits}, промахов: {self.misses}"
+
+    def close(self):
+        """Закрывает базу данных"""
+        self._db.close()
@@ -0,0 +1,329 @@
+"""
+Пересылка медиа по ссылке на файл Telegram без скачивания на диск
+"""
+
+import io
+import os
+import logging
+from typing import Dict, List, Optional
+import asyncio
+from telethon.errors import (
+    FileReferenceEmptyError, FileReferenceExpiredError,
+    FileReferenceInvalidError, MediaEmptyError
+)
+from telethon import utils
+from telethon.tl.types import InputMediaUploadedDocument
+from media_utils import MediaHandler
+from media_cache import UploadCache
+from media_spool import MediaSpool, get_default_spool
+from media_transcode import ImageTranscoder
+from media_transfer import ChunkedTransfer
+from outbox import Outbox
+from metrics import BYTES, time_stage
+
+logger = logging.getLogger(__name__)
+
+class MediaForwarder:
+    """
+    Отправка медиа в целевой канал
+
+    Быстрый путь повторно использует InputPhoto/InputDocument из
+    message.media, поэтому байты файла не проходят через бота. Если ссылка на
+    файл устарела, медиа скачивается: небольшие файлы в память (BytesIO),
+    крупные во временный файл в каталоге спула. Загруженные файлы запоминаются в
+    UploadCache, поэтому одно и то же медиа загружается только один раз.
+    Крупные изображения перед загрузкой пережимаются ImageTranscoder, а не
+    отбрасываются. Временные файлы отмечаются в журнале Outbox, поэтому файл,
+    скачанный до сбоя, после перезапуска загружается без повторного скачивания.
+    Крупные документы и видео перекачиваются ChunkedTransfer по частям сразу
+    из скачивания в загрузку, минуя временный файл.
+    """
+
+    REFERENCE_ERRORS = (
+        FileReferenceExpiredError, FileReferenceEmptyError,
+        FileReferenceInvalidError, MediaEmptyError
+    )
+    DEFAULT_MEMORY_LIMIT = 10 * 1024 * 1024  # 10 MB
+
+    def __init__(self, client, memory_limit: int = DEFAULT_MEMORY_LIMIT,
+                 cache: Optional[UploadCache] = None, spool: Optional[MediaSpool] = None,
+                 transcoder: Optional[ImageTranscoder] = None,
+                 outbox: Optional[Outbox] = None,
+                 transfer: Optional[ChunkedTransfer] = None):
+        self.client = client
+        self.memory_limit = memory_limit
+        self.cache = cache
+        self.spool = spool or get_default_spool()
+        self.transcoder = transcoder
+        self.outbox = outbox
+        self.transfer = transfer
+        # media_key -> Future результата _resolve для скачиваемых сейчас медиа
+        self._pending: Dict[str, asyncio.Future] = {}
+        self.stats = {'fast_path': 0, 'memory': 0, 'disk': 0, 'relayed': 0,
+                      'cached': 0, 'uploaded': 0, 'transcoded': 0, 'failed': 0}
+
+    def stats_summary(self) -> str:
+        """Краткая статистика быстрых отправок и откатов к скачиванию"""
+        return (f"по ссылке: {self.stats['fast_path']}, "
+                f"через память: {self.stats['memory']}, "
+                f"через диск: {self.stats['disk']}, "
+                f"перекачано частями: {self.stats['relayed']}, "
+                f"из кэша загрузок: {self.stats['cached']}, "
+                f"загружено: {self.stats['uploaded']}, "
+                f"пережато: {self.stats['transcoded']}, "
+                f"не скачано: {self.stats['failed']}")
+
+    def should_relay(self, message) -> bool:
+        """Будет ли медиа при скачивании перекачано частями (крупный документ или видео)"""
+        if self.transfer is None or message.document is None or not message.file:
+            return False
+        size = message.file.size or 0
+        if size <= self.memory_limit:
+            return False
+        # Изображения, которые нужно пережать, скачиваются целиком
+        return not (self.transcoder and self.transcoder.needs_transcode(self._extension(message), size))
+
+    async def send_media(self, entity, events: List, caption: Optional[str] = None):
+        """
+        Отправляет медиа одного сообщения или альбома
+
+        Args:
+            entity: Целевой канал
+            events: События с медиа (одно событие или части альбома по порядку)
+            caption: Подпись к медиа (для альбома ставится к первому элементу)
+        """
+        # Ссылки на файлы действительны только для аккаунта, получившего сообщение
+        if any(getattr(event, 'client', self.client) is not self.client for event in events):
+            await self._send_downloaded(entity, events, caption)
+            return
+
+        media = [event.message.media for event in events]
+        try:
+            with time_stage('send_by_reference'):
+                await self.client.send_file(
+                    entity=entity,
+                    file=media if len(media) > 1 else media[0],
+                    caption=caption
+                )
+            self.stats['fast_path'] += len(media)
+            logger.info("Медиа отправлено по ссылке на файл (%d шт.)", len(media))
+            return
+        except self.REFERENCE_ERRORS as e:
+            logger.warning(f"Ссылка на файл недействительна ({e.__class__.__name__}), "
+                           f"медиа будет скачано")
+
+        await self._send_downloaded(entity, events, caption)
+
+    async def _send_downloaded(self, entity, events: List, caption: Optional[str]):
+        resolved = await asyncio.gather(*(self._resolve(event) for event in events))
+        items = [item for item in resolved if item is not None]
+        if not items:
+            raise RuntimeError("Не удалось скачать медиа")
+
+        handles = [handle for handle, _ in items]
+        try:
+            sent = await self.client.send_file(
+                entity=entity,
+                file=handles if len(handles) > 1 else handles[0],
+                caption=caption,
+                supports_streaming=True
+            )
+        except self.REFERENCE_ERRORS:
+            # Закэшированный дескриптор больше не принимается сервером
+            if self.cache:
+                for _, keys in items:
+                    for key in keys:
+                        self.cache.discard(key)
+            raise
+        logger.info("Медиа отправлено после скачивания (%s)", self.stats_summary())
+
+        if self.cache:
+            # Запоминаем медиа отправленного сообщения: его можно переотправлять
+            # дольше, чем живет загруженный InputFile
+            sent_messages = sent if isinstance(sent, list) else [sent]
+            for (_, keys), message in zip(items, sent_messages):
+                if message.media:
+                    input_media = utils.get_input_media(message.media)
+                    for key in keys:
+                        self.cache.put(key, input_media)
+
+    async def _resolve(self, event):
+        """
+        Возвращает (дескриптор для отправки, ключи кэша) или None
+
+        Одновременные запросы одного и того же медиа (например, при отправке
+        сообщения в несколько каналов) сливаются в одно скачивание и загрузку.
+        """
+        media_key = UploadCache.media_key(event.message)
+        if media_key is None:
+            return await self._fetch(event, media_key)
+
+        pending = self._pending.get(media_key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[media_key] = future
+        try:
+            result = await self._fetch(event, media_key)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            # Ожидающие не должны получить отмену чужой задачи
+            future.set_exception(RuntimeError("Скачивание медиа отменено"))
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже передано ожидающим, здесь его не нужно доставать повторно
+            future.exception()
+            raise
+        finally:
+            del self._pending[media_key]
+
+    async def _fetch(self, event, media_key: Optional[str]):
+        if self.cache:
+            cached = self.cache.get(media_key)
+            if cached is not None:
+                self.stats['cached'] += 1
+                return cached, [media_key]
+
+        if self.should_relay(event.message):
+            return await self._relay(event, media_key)
+
+        data = await self._download(event, media_key)
+        if data is None:
+            return None
+
+        try:
+            if not self.cache:
+                upload = await self._transcode(event, data)
+                if upload is None:
+                    return None
+                handle = self._document_media(event.message, await self._upload(upload), upload is data)
+                self.stats['uploaded'] += 1
+                return handle, []
+
+            # Хеширование файла до 50 MB не должно блокировать цикл событий
+            content_key = await self.spool.run(UploadCache.content_key, data)
+            cached = self.cache.get(content_key)
+            if cached is not None:
+                self.stats['cached'] += 1
+                logger.info("Медиа с таким содержимым уже загружалось, повторная загрузка не нужна")
+                return cached, [media_key, content_key]
+
+            upload = await self._transcode(event, data)
+            if upload is None:
+                return None
+            handle = self._document_media(event.message, await self._upload(upload), upload is data)
+            self.stats['uploaded'] += 1
+            self.cache.put(media_key, handle)
+            self.cache.put(content_key, handle)
+            return handle, [media_key, content_key]
+        finally:
+            if isinstance(data, str):
+                await self.spool.remove(data)
+                if self.outbox:
+                    self.outbox.release_download(media_key)
+
+    @staticmethod
+    def _document_media(message, handle, original: bool = True):
+        """
+        Оборачивает загруженный файл документа в InputMediaUploadedDocument
+
+        Атрибуты исходного документа (длительность и размеры видео, имя файла)
+        сохраняются. Пережатое изображение отправляется как фото.
+        """
+        if message.document is None or not original:
+            return handle
+        return InputMediaUploadedDocument(
+            file=handle,
+            mime_type=message.document.mime_type or 'application/octet-stream',
+            attributes=message.document.attributes
+        )
+
+    async def _relay(self, event, media_key: Optional[str]):
+        message = event.message
+        name = message.file.name or f"media{self._extension(message)}"
+        # Скачивание идет клиентом, получившим сообщение (пользователь догрузки истории, шард),
+        # а загрузка - клиентом бота
+        handle = await self.transfer.relay(message.media, message.file.size, name,
+                                           source=getattr(event, 'client', None) or self.client)
+        self.stats['relayed'] += 1
+        media = self._document_media(message, handle)
+        if self.cache and media_key:
+            self.cache.put(media_key, media)
+        return media, [media_key] if media_key else []
+
+    async def _size(self, data) -> int:
+        if isinstance(data, str):
+            size = self.spool.size(data)
+            if size is None:
+                size = await self.spool.run(os.path.getsize, data)
+            return size
+        return data.getbuffer().nbytes
+
+    @staticmethod
+    def _extension(message) -> str:
+        # Фото Telegram всегда хранит в JPEG
+        return '.jpg' if message.photo else MediaHandler.get_message_extension(message)
+
+    async def _transcode(self, event, data):
+        """Возвращает данные для загрузки: пережатое изображение, исходные данные или None"""
+        size = await self._size(data)
+        if not self.transcoder or not self.transcoder.needs_transcode(self._extension(event.message), size):
+            return data
+
+        with time_stage('transcode'):
+            result = await self.transcoder.transcode(
+                data if isinstance(data, str) else data.getvalue(), size)
+        if result is None:
+            if size > MediaHandler.MAX_FILE_SIZE:
+                # Бот не может загрузить файл больше лимита Telegram
+                self.stats['failed'] += 1
+                return None
+            return data
+
+        self.stats['transcoded'] += 1
+        BYTES.inc('transcode_saved', amount=size - len(result))
+        buffer = io.BytesIO(result)
+        buffer.name = 'media.jpg'
+        return buffer
+
+    async def _upload(self, data):
+        size = await self._size(data)
+        with time_stage('upload'):
+            handle = await self.client.upload_file(data)
+        BYTES.inc('uploaded', amount=size)
+        return handle
+
+    async def _download(self, event, media_key: Optional[str]):
+        if self.outbox:
+            # Файл, скачанный до перезапуска
+            path = self.outbox.downloaded_path(media_key)
+            if path is not None and await self.spool.adopt(path) is not None:
+                logger.info("Используется медиа, скачанное до перезапуска: %s", path)
+                self.stats['disk'] += 1
+                return path
+
+        size = event.message.file.size if event.message.file else None
+        # Изображения больше лимита Telegram можно скачать, если их удастся пережать
+        max_size = MediaHandler.MAX_FILE_SIZE
+        if self.transcoder and self.transcoder.is_image(self._extension(event.message)):
+            max_size = max(max_size, self.transcoder.max_source_bytes)
+
+        if size is not None and size <= self.memory_limit:
+            buffer = await MediaHandler.download_media_to_memory(event, max_size=max_size)
+            if buffer is not None:
+                self.stats['memory'] += 1
+                return buffer
+        else:
+            path = await MediaHandler.download_media_with_retry(event, spool=self.spool, max_size=max_size)
+            if path is not None:
+                self.stats['disk'] += 1
+                if self.outbox:
+                    self.outbox.mark_downloaded(media_key, path)
+                return path
+
+        self.stats['failed'] += 1
+        return None
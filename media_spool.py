@@ -0,0 +1,205 @@
+"""
+Каталог для временных медиа файлов с ограничением занимаемого места
+"""
+
+import os
+import time
+import asyncio
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class SpoolFile:
+    """Открытый файл в каталоге спула; запись выполняется в пуле потоков"""
+
+    def __init__(self, spool: 'MediaSpool', path: str, handle):
+        self.spool = spool
+        self.path = path
+        self._handle = handle
+
+    async def write(self, chunk: bytes):
+        await self.spool.run(self._handle.write, chunk)
+
+    async def close(self):
+        await self.spool.run(self._handle.close)
+
+class MediaSpool:
+    """
+    Временные файлы медиа
+
+    Все операции с файловой системой (создание, запись, размер, удаление)
+    выполняются в ограниченном пуле потоков, чтобы не блокировать цикл
+    событий. Суммарный размер файлов ограничен budget байтами: reserve() ждет,
+    пока другие файлы не будут удалены. Файлы старше stale_age секунд
+    (оставшиеся после аварийного завершения) удаляются пачками при запуске и
+    периодически.
+    """
+
+    DEFAULT_BUDGET = 1024 * 1024 * 1024  # 1 GB
+    DEFAULT_STALE_AGE = 60 * 60  # 1 час
+    PREFIX = 'media_'
+    SWEEP_BATCH = 100
+
+    def __init__(self, directory: Optional[str] = None, budget: int = DEFAULT_BUDGET,
+                 max_workers: int = 4, stale_age: float = DEFAULT_STALE_AGE):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'medbot-spool')
+        self.budget = budget
+        self.stale_age = stale_age
+        os.makedirs(self.directory, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='spool')
+        self._used = 0
+        # путь -> зарезервированный размер
+        self._reserved: Dict[str, int] = {}
+        self._released: Optional[asyncio.Condition] = None
+
+    @property
+    def used(self) -> int:
+        """Зарезервированный объем, байт"""
+        return self._used
+
+    async def run(self, func, *args):
+        """Выполняет блокирующую функцию в пуле потоков спула"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _condition(self) -> asyncio.Condition:
+        if self._released is None:
+            self._released = asyncio.Condition()
+        return self._released
+
+    async def create(self, size: int, suffix: str = '') -> SpoolFile:
+        """
+        Резервирует место и создает пустой файл
+
+        Если бюджет исчерпан, ждет освобождения места. Файл больше всего
+        бюджета допускается, только когда спул пуст.
+
+        Args:
+            size: Ожидаемый размер файла
+            suffix: Расширение файла
+        """
+        condition = self._condition()
+        async with condition:
+            await condition.wait_for(
+                lambda: self._used == 0 or self._used + size <= self.budget
+            )
+            self._used += size
+
+        try:
+            fd, path = await self.run(tempfile.mkstemp, suffix, self.PREFIX, self.directory)
+            handle = await self.run(os.fdopen, fd, 'wb')
+        except BaseException:
+            await self._release(size)
+            raise
+        self._reserved[path] = size
+        return SpoolFile(self, path, handle)
+
+    async def commit(self, path: str, size: int):
+        """Уточняет резерв файла по фактическому размеру"""
+        reserved = self._reserved.get(path)
+        if reserved is None:
+            return
+        self._reserved[path] = size
+        await self._release(reserved - size)
+
+    async def adopt(self, path: str) -> Optional[int]:
+        """
+        Учитывает в бюджете файл, оставшийся от прошлого запуска
+
+        Returns:
+            Размер файла или None, если файла нет
+        """
+        if path in self._reserved:
+            return self._reserved[path]
+        try:
+            size = await self.run(os.path.getsize, path)
+        except OSError:
+            return None
+        self._reserved[path] = size
+        self._used += size
+        return size
+
+    def size(self, path: str) -> Optional[int]:
+        """Размер файла по данным резерва (без обращения к диску)"""
+        return self._reserved.get(path)
+
+    async def remove(self, *paths: str):
+        """Удаляет файлы и освобождает их резерв"""
+        for path in paths:
+            if not path:
+                continue
+            try:
+                await self.run(os.unlink, path)
+                logger.debug("Удален временный файл: %s", path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error("Ошибка при удалении файла %s: %s", path, e)
+            await self._release(self._reserved.pop(path, 0))
+
+    async def _release(self, size: int):
+        if not size:
+            return
+        condition = self._condition()
+        async with condition:
+            self._used = max(0, self._used - size)
+            condition.notify_all()
+
+    def _stale_files(self) -> List[str]:
+        deadline = time.time() - self.stale_age
+        stale = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.name.startswith(self.PREFIX) or entry.path in self._reserved:
+                    continue
+                try:
+                    if entry.is_file() and entry.stat().st_mtime < deadline:
+                        stale.append(entry.path)
+                except OSError:
+                    continue
+        return stale
+
+    @staticmethod
+    def _unlink_batch(paths: List[str]) -> int:
+        removed = 0
+        for path in paths:
+            try:
+                os.unlink(path)
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    async def sweep(self) -> int:
+        """Удаляет забытые файлы пачками по SWEEP_BATCH; возвращает их количество"""
+        stale = await self.run(self._stale_files)
+        removed = 0
+        for i in range(0, len(stale), self.SWEEP_BATCH):
+            removed += await self.run(self._unlink_batch, stale[i:i + self.SWEEP_BATCH])
+        if removed:
+            logger.info("Удалено забытых временных файлов: %d", removed)
+        return removed
+
+    async def sweep_periodically(self, interval: float):
+        """Периодически удаляет забытые файлы"""
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error("Ошибка при очистке каталога спула: %s", e)
+            await asyncio.sleep(interval)
+
+    def close(self):
+        """Останавливает пул потоков"""
+        self._executor.shutdown(wait=True)
+
+_default_spool: Optional[MediaSpool] = None
+
+def get_default_spool() -> MediaSpool:
+    """Спул по умолчанию для вызовов без явно переданного спула"""
+    global _default_spool
+    if _default_spool is None:
+        _default_spool = MediaSpool()
+    return _default_spool
@@ -0,0 +1,153 @@
+"""
+Пережатие крупных и неэффективно сохраненных изображений в пуле процессов
+"""
+
+import io
+import os
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Union
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow не обязателен: без него изображения отправляются как есть
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+def recompress_image(source: Union[bytes, str], target_bytes: int, max_dimension: int,
+                     quality: int, min_quality: int) -> Optional[bytes]:
+    """
+    Уменьшает и пережимает изображение в JPEG не больше target_bytes
+
+    Выполняется в процессе пула, поэтому не использует ничего, кроме Pillow.
+    Качество снижается шагами по 10 до min_quality, затем уменьшается размер.
+
+    Args:
+        source: Содержимое файла или путь к нему
+
+    Returns:
+        JPEG или None, если изображение анимированное или выигрыша нет
+    """
+    image = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+    if getattr(image, 'is_animated', False):
+        return None
+    original_size = len(source) if isinstance(source, bytes) else os.path.getsize(source)
+
+    if image.mode in ('RGBA', 'LA', 'P'):
+        # У JPEG нет прозрачности: прозрачные области заливаются белым
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+    result = None
+    for _ in range(4):
+        for q in range(quality, min_quality - 1, -10):
+            buffer = io.BytesIO()
+            image.save(buffer, 'JPEG', quality=q, optimize=True, progressive=True)
+            result = buffer.getvalue()
+            if len(result) <= target_bytes:
+                return result if len(result) < original_size else None
+        image = image.resize((max(1, image.width * 3 // 4), max(1, image.height * 3 // 4)), Image.LANCZOS)
+    return result if result is not None and len(result) < original_size else None
+
+class ImageTranscoder:
+    """
+    Пережатие изображений перед загрузкой
+
+    Изображения больше target_bytes или в неэффективных форматах (PNG, BMP,
+    TIFF) уменьшаются до max_dimension по большей стороне и пережимаются в
+    JPEG. Работа с пикселями выполняется в ProcessPoolExecutor, поэтому не
+    занимает цикл событий и не упирается в GIL. Без Pillow пережатие
+    отключено.
+    """
+
+    DEFAULT_TARGET_BYTES = 5 * 1024 * 1024  # 5 MB
+    DEFAULT_MAX_SOURCE_BYTES = 200 * 1024 * 1024  # 200 MB
+    DEFAULT_MAX_DIMENSION = 2560
+    IMAGE_FORMATS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.tif', '.tiff'}
+    INEFFICIENT_FORMATS = {'.png', '.bmp', '.tif', '.tiff'}
+    MIN_INEFFICIENT_SIZE = 256 * 1024
+
+    def __init__(self, max_workers: int = 2, target_bytes: int = DEFAULT_TARGET_BYTES,
+                 max_source_bytes: int = DEFAULT_MAX_SOURCE_BYTES,
+                 max_dimension: int = DEFAULT_MAX_DIMENSION,
+                 quality: int = 85, min_quality: int = 50, enabled: bool = True):
+        """
+        Args:
+            max_workers: Число процессов пула
+            target_bytes: Целевой размер пережатого файла
+            max_source_bytes: Максимальный размер исходного изображения для скачивания
+            max_dimension: Максимальный размер большей стороны, px
+            quality: Начальное качество JPEG
+            min_quality: Минимальное качество JPEG
+            enabled: Включить пережатие (требует Pillow)
+        """
+        self.max_workers = max_workers
+        self.target_bytes = target_bytes
+        self.max_source_bytes = max_source_bytes
+        self.max_dimension = max_dimension
+        self.quality = quality
+        self.min_quality = min_quality
+        self.enabled = enabled and Image is not None
+        if enabled and Image is None:
+            logger.warning("Pillow не установлен, пережатие изображений отключено")
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.stats = {'transcoded': 0, 'skipped': 0, 'failed': 0, 'saved_bytes': 0}
+
+    def is_image(self, ext: str) -> bool:
+        """Можно ли пережимать файл с таким расширением"""
+        return self.enabled and ext in self.IMAGE_FORMATS
+
+    def needs_transcode(self, ext: str, size: int) -> bool:
+        """Нужно ли пережимать изображение такого формата и размера"""
+        if not self.is_image(ext):
+            return False
+        return size > self.target_bytes or (
+            ext in self.INEFFICIENT_FORMATS and size >= self.MIN_INEFFICIENT_SIZE)
+
+    async def transcode(self, source: Union[bytes, str], size: int) -> Optional[bytes]:
+        """
+        Пережимает изображение в пуле процессов
+
+        Args:
+            source: Содержимое файла или путь к нему (файл читается процессом пула)
+            size: Исходный размер, байт
+
+        Returns:
+            JPEG меньшего размера или None, если пережать не удалось или выигрыша нет
+        """
+        if self._executor is None:
+            # Процессы запускаются заново, а не через fork: у бота уже есть потоки
+            # (SQLite, журнал, сторож цикла), и копия их блокировок может зависнуть
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(
+                self._executor, recompress_image, source, self.target_bytes,
+                self.max_dimension, self.quality, self.min_quality
+            )
+        except Exception as e:
+            self.stats['failed'] += 1
+            logger.warning("Не удалось пережать изображение: %s", e)
+            return None
+
+        if result is None:
+            self.stats['skipped'] += 1
+            return None
+        self.stats['transcoded'] += 1
+        self.stats['saved_bytes'] += size - len(result)
+        logger.info("Изображение пережато: %d -> %d bytes", size, len(result))
+        return result
+
+    def close(self):
+        """Останавливает пул процессов"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
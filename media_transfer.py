@@ -0,0 +1,96 @@
+"""
+Перекачка крупных документов и видео частями без промежуточного файла
+"""
+
+import asyncio
+import logging
+from telethon import helpers
+from telethon.tl.functions.upload import SaveBigFilePartRequest, SaveFilePartRequest
+from telethon.tl.types import InputFile, InputFileBig
+from metrics import BYTES, time_stage
+
+logger = logging.getLogger(__name__)
+
+class ChunkedTransfer:
+    """
+    Перекачка файла из сообщения в загрузку по частям
+
+    Файл делится на части по part_size байт, которые скачиваются и сразу
+    загружаются parallel потоками: поток i обрабатывает части i, i + parallel,
+    i + 2 * parallel и т. д. Части загрузки независимы, поэтому их порядок не
+    важен, а в памяти одновременно находится не больше parallel частей. Файл
+    целиком не попадает ни на диск, ни в память.
+    """
+
+    # Часть загрузки не может быть больше 512 KB, а части скачивания выравниваются по 4 KB
+    PART_SIZE = 512 * 1024
+    # Файлы больше 10 MB загружаются через SaveBigFilePart
+    BIG_FILE_SIZE = 10 * 1024 * 1024
+    # Максимальный размер файла, который может загрузить бот
+    MAX_SIZE = 2000 * 1024 * 1024
+
+    def __init__(self, client, parallel: int = 4, part_size: int = PART_SIZE):
+        """
+        Args:
+            client: Клиент Telegram
+            parallel: Число одновременно передаваемых частей одного файла
+            part_size: Размер части (делитель 512 KB, кратный 4 KB)
+        """
+        if part_size % 4096 or (512 * 1024) % part_size:
+            raise ValueError("Размер части должен быть кратен 4 KB и делить 512 KB")
+        self.client = client
+        self.parallel = parallel
+        self.part_size = part_size
+
+    async def _relay_parts(self, source, media, worker: int, file_id: int, parts: int, size: int):
+        big = size > self.BIG_FILE_SIZE
+        part = worker
+        async for chunk in source.iter_download(
+                media, offset=worker * self.part_size, stride=self.parallel * self.part_size,
+                limit=len(range(worker, parts, self.parallel)),
+                chunk_size=self.part_size, request_size=self.part_size, file_size=size):
+            BYTES.inc('downloaded', amount=len(chunk))
+            if big:
+                request = SaveBigFilePartRequest(file_id, part, parts, chunk)
+            else:
+                request = SaveFilePartRequest(file_id, part, chunk)
+            if not await self.client(request):
+                raise RuntimeError(f"Telegram не принял часть {part} из {parts}")
+            BYTES.inc('uploaded', amount=len(chunk))
+            part += self.parallel
+        if part < parts:
+            raise RuntimeError(f"Скачано {part} частей из {parts}")
+
+    async def relay(self, media, size: int, name: str, source=None):
+        """
+        Скачивает медиа и одновременно загружает его заново
+
+        Args:
+            media: Медиа исходного сообщения
+            size: Размер файла, байт
+            name: Имя файла для загрузки
+            source: Клиент, получивший сообщение (ссылка на файл действительна только
+                для него); по умолчанию клиент загрузки
+
+        Returns:
+            InputFile или InputFileBig загруженного файла
+        """
+        if size > self.MAX_SIZE:
+            raise ValueError(f"Файл слишком большой: {size} bytes")
+        parts = max(1, (size + self.part_size - 1) // self.part_size)
+        source = source or self.client
+        file_id = helpers.generate_random_long()
+        tasks = [asyncio.ensure_future(self._relay_parts(source, media, worker, file_id, parts, size))
+                 for worker in range(min(self.parallel, parts))]
+        try:
+            with time_stage('relay'):
+                await asyncio.gather(*tasks)
+        except BaseException:
+            # Остальные части уже не нужны: файл будет загружаться заново целиком
+            for task in tasks:
+                task.cancel()
+            raise
+        logger.info("Файл %s перекачан без временного файла (%d bytes, %d частей)", name, size, parts)
+        if size > self.BIG_FILE_SIZE:
+            return InputFileBig(file_id, parts, name)
+        return InputFile(file_id, parts, name, '')
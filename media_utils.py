@@ -2,12 +2,15 @@
 Утилиты для работы с медиа файлами в медицинском мониторинг-боте
 """
 
+import io
 import os
-import tempfile
+import inspect
 import logging
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 from telethon.tl.types import MessageMediaPhoto, MessageMediaDocument
 import asyncio
+from metrics import BYTES, RETRIES, time_stage
+from media_spool import MediaSpool, get_default_spool
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +20,7 @@ class MediaHandler:
     SUPPORTED_PHOTO_FORMATS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
     SUPPORTED_VIDEO_FORMATS = {'.mp4', '.avi', '.mov', '.mkv'}
     MAX_FILE_SIZE = 50 * 1024 * 1024  # 50 MB
+    MAX_DOCUMENT_SIZE = 2000 * 1024 * 1024  # 2000 MB - лимит Telegram на загрузку файла
     
     @staticmethod
     def get_file_extension(filename: str) -> str:
@@ -40,78 +44,197 @@ class MediaHandler:
         else:
             return 'unknown'
     
+    @staticmethod
+    def get_message_extension(message) -> str:
+        """Определяет расширение файла по метаданным сообщения (без скачивания)"""
+        if not message.file:
+            return ''
+        if message.file.name:
+            ext = MediaHandler.get_file_extension(message.file.name)
+            if ext:
+                return ext
+        return (message.file.ext or '').lower()
+    
+    @staticmethod
+    def check_media_metadata(message, max_size: int = None) -> Tuple[bool, str]:
+        """
+        Проверяет размер и формат медиа по метаданным до скачивания
+        
+        Args:
+            message: Telegram сообщение с медиа
+            max_size: Максимальный размер файла (по умолчанию MAX_FILE_SIZE)
+            
+        Returns:
+            Tuple[можно_скачивать, причина_отказа]
+        """
+        if not message.file:
+            return False, "нет файла"
+        
+        max_size = max_size or MediaHandler.MAX_FILE_SIZE
+        size = message.file.size
+        if size is not None and size > max_size:
+            return False, f"файл слишком большой: {size} bytes"
+        
+        # Фото Telegram всегда хранит в JPEG, документы и видео пересылаются в любом формате
+        if message.photo or message.document:
+            return True, ""
+        
+        ext = MediaHandler.get_message_extension(message)
+        if MediaHandler.is_supported_format(f"file{ext}"):
+            return True, ""
+        
+        mime_type = message.file.mime_type or ''
+        return False, f"неподдерживаемый формат: {ext or '?'} ({mime_type or 'mime неизвестен'})"
+    
+    @staticmethod
+    async def stream_download(event, out, max_bytes: int) -> Optional[int]:
+        """
+        Скачивает медиа по частям в файловый объект, прерываясь при превышении лимита
+        
+        Args:
+            event: Telegram событие с медиа
+            out: Файловый объект для записи (write может быть корутиной)
+            max_bytes: Максимально допустимый размер
+            
+        Returns:
+            Количество записанных байт или None, если лимит превышен
+        """
+        written = 0
+        with time_stage('download'):
+            async for chunk in event.client.iter_download(event.message.media):
+                written += len(chunk)
+                BYTES.inc('downloaded', amount=len(chunk))
+                if written > max_bytes:
+                    logger.warning(f"Скачивание прервано: превышен лимит {max_bytes} bytes")
+                    return None
+                result = out.write(chunk)
+                if inspect.isawaitable(result):
+                    await result
+        return written
+    
     @staticmethod
     async def download_media_with_retry(event, max_retries: int = 3, 
-                                      delay_base: float = 1.0) -> Optional[str]:
+                                      delay_base: float = 1.0,
+                                      spool: Optional[MediaSpool] = None,
+                                      max_size: Optional[int] = None) -> Optional[str]:
         """
         Скачивает медиа файл с повторными попытками
         
+        Размер и формат проверяются по метаданным до скачивания, а само
+        скачивание прерывается, как только файл превысит max_size. Файл
+        создается в каталоге спула, место под него резервируется заранее.
+        
         Args:
             event: Telegram событие с медиа
             max_retries: Максимальное количество попыток
             delay_base: Базовая задержка между попытками
+            spool: Каталог временных файлов (по умолчанию общий)
+            max_size: Максимальный размер файла (по умолчанию MAX_FILE_SIZE)
             
         Returns:
             Путь к скачанному файлу или None при ошибке
         """
+        max_size = max_size or MediaHandler.MAX_FILE_SIZE
+        allowed, reason = MediaHandler.check_media_metadata(event.message, max_size)
+        if not allowed:
+            logger.warning(f"Медиа не скачивается: {reason}")
+            return None
+        
+        spool = spool or get_default_spool()
+        suffix = MediaHandler.get_message_extension(event.message) or '.tmp'
+        expected_size = event.message.file.size or max_size
+        
         for attempt in range(max_retries):
+            temp_path = None
             try:
-                # Создаем временный файл
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.tmp') as tmp_file:
-                    temp_path = tmp_file.name
+                # Скачиваем медиа во временный файл с правильным расширением
+                spool_file = await spool.create(expected_size, suffix)
+                temp_path = spool_file.path
+                try:
+                    file_size = await MediaHandler.stream_download(
+                        event, spool_file, max_size)
+                finally:
+                    await spool_file.close()
                 
-                # Скачиваем медиа
-                downloaded_path = await event.message.download_media(temp_path)
+                if file_size is None:
+                    await spool.remove(temp_path)
+                    return None
                 
-                if downloaded_path and os.path.exists(downloaded_path):
-                    # Проверяем размер файла
-                    file_size = os.path.getsize(downloaded_path)
-                    if file_size > MediaHandler.MAX_FILE_SIZE:
-                        logger.warning(f"Файл слишком большой: {file_size} bytes")
-                        os.unlink(downloaded_path)
-                        return None
-                    
-                    # Проверяем формат
-                    if not MediaHandler.is_supported_format(downloaded_path):
-                        logger.warning(f"Неподдерживаемый формат файла: {downloaded_path}")
-                        os.unlink(downloaded_path)
-                        return None
-                    
-                    logger.info(f"Медиа скачано успешно: {downloaded_path} ({file_size} bytes)")
-                    return downloaded_path
-                else:
-                    logger.warning(f"Файл не был скачан: {downloaded_path}")
-                    if os.path.exists(temp_path):
-                        os.unlink(temp_path)
+                if file_size:
+                    await spool.commit(temp_path, file_size)
+                    logger.info("Медиа скачано успешно: %s (%d bytes)", temp_path, file_size)
+                    return temp_path
+                
+                logger.warning(f"Файл не был скачан: {temp_path}")
+                await spool.remove(temp_path)
                         
+            except asyncio.CancelledError:
+                if temp_path:
+                    await asyncio.shield(spool.remove(temp_path))
+                raise
             except Exception as e:
                 logger.warning(f"Попытка {attempt + 1} скачивания не удалась: {e}")
                 
                 # Очищаем временные файлы
-                if 'temp_path' in locals() and os.path.exists(temp_path):
-                    os.unlink(temp_path)
-                if 'downloaded_path' in locals() and os.path.exists(downloaded_path):
-                    os.unlink(downloaded_path)
+                await spool.remove(temp_path)
                 
-                # Экспоненциальная задержка
-                if attempt < max_retries - 1:
-                    delay = delay_base * (2 ** attempt)
-                    logger.info(f"Ожидание {delay} секунд перед следующей попыткой...")
-                    await asyncio.sleep(delay)
+            # Экспоненциальная задержка
+            if attempt < max_retries - 1:
+                RETRIES.inc('download')
+                delay = delay_base * (2 ** attempt)
+                logger.info(f"Ожидание {delay} секунд перед следующей попыткой...")
+                await asyncio.sleep(delay)
         
         logger.error("Не удалось скачать медиа после всех попыток")
         return None
     
     @staticmethod
-    def cleanup_temp_files(*file_paths: str):
-        """Очищает временные файлы"""
-        for file_path in file_paths:
-            if file_path and os.path.exists(file_path):
-                try:
-                    os.unlink(file_path)
-                    logger.info(f"Удален временный файл: {file_path}")
-                except Exception as e:
-                    logger.error(f"Ошибка при удалении файла {file_path}: {e}")
+    async def download_media_to_memory(event, max_retries: int = 3,
+                                       delay_base: float = 1.0,
+                                       max_size: Optional[int] = None) -> Optional[io.BytesIO]:
+        """
+        Скачивает небольшой медиа файл в память, минуя диск
+        
+        Args:
+            event: Telegram событие с медиа
+            max_retries: Максимальное количество попыток
+            delay_base: Базовая задержка между попытками
+            max_size: Максимальный размер файла (по умолчанию MAX_FILE_SIZE)
+            
+        Returns:
+            BytesIO с содержимым файла (с атрибутом name) или None при ошибке
+        """
+        max_size = max_size or MediaHandler.MAX_FILE_SIZE
+        allowed, reason = MediaHandler.check_media_metadata(event.message, max_size)
+        if not allowed:
+            logger.warning(f"Медиа не скачивается: {reason}")
+            return None
+        
+        ext = MediaHandler.get_message_extension(event.message)
+        
+        for attempt in range(max_retries):
+            try:
+                buffer = io.BytesIO()
+                size = await MediaHandler.stream_download(event, buffer, max_size)
+                if size is None:
+                    return None
+                if size:
+                    buffer.seek(0)
+                    buffer.name = f"media{ext}"
+                    logger.info("Медиа скачано в память (%d bytes)", size)
+                    return buffer
+                logger.warning("Медиа не было скачано в память")
+                
+            except Exception as e:
+                logger.warning(f"Попытка {attempt + 1} скачивания в память не удалась: {e}")
+                
+            # Экспоненциальная задержка
+            if attempt < max_retries - 1:
+                RETRIES.inc('download')
+                await asyncio.sleep(delay_base * (2 ** attempt))
+        
+        logger.error("Не удалось скачать медиа в память после всех попыток")
+        return None
     
     @staticmethod
     def format_file_size(size_bytes: int) -> str:
@@ -126,29 +249,6 @@ class MediaHandler:
             i += 1
         
         return f"{size_bytes:.1f}{size_names[i]}"
-    
-    @staticmethod
-    def get_media_info(file_path: str) -> dict:
-        """Получает информацию о медиа файле"""
-        if not os.path.exists(file_path):
-            return {}
-        
-        try:
-            file_size = os.path.getsize(file_path)
-            file_ext = MediaHandler.get_file_extension(file_path)
-            media_type = MediaHandler.get_media_type(file_path)
-            
-            return {
-                'path': file_path,
-                'size': file_size,
-                'size_formatted': MediaHandler.format_file_size(file_size),
-                'extension': file_ext,
-                'type': media_type,
-                'supported': MediaHandler.is_supported_format(file_path)
-            }
-        except Exception as e:
-            logger.error(f"Ошибка при получении информации о файле {file_path}: {e}")
-            return {}
 
 class MessageProcessor:
     """Класс для обработки сообщений"""
@@ -170,12 +270,39 @@ class MessageProcessor:
             if has_photo:
                 media_type = 'photo'
             elif isinstance(event.message.media, MessageMediaDocument):
-                media_type = 'document'
+                media_type = 'video' if event.message.video else 'document'
             else:
                 media_type = 'other'
         
         return message_text, has_photo, media_type
     
+    @staticmethod
+    def has_forwardable_media(message) -> bool:
+        """Есть ли в сообщении медиа для пересылки: фото, видео или документ"""
+        if message.photo:
+            return True
+        media = message.media
+        return isinstance(media, MessageMediaDocument) and media.document is not None
+    
+    @staticmethod
+    def extract_album_content(events: List) -> Tuple[Optional[str], List]:
+        """
+        Извлекает содержимое альбома
+        
+        Returns:
+            Tuple[текст первой подписанной части, события с фото, видео и документами]
+        """
+        album_text = None
+        media_events = []
+        for event in events:
+            message_text = event.message.text or event.message.message
+            if message_text and album_text is None:
+                album_text = message_text
+            if MessageProcessor.has_forwardable_media(event.message):
+                media_events.append(event)
+        
+        return album_text, media_events
+    
     @staticmethod
     def should_process_message(event) -> bool:
         """Проверяет, нужно ли обрабатывать сообщение"""
@@ -185,9 +312,8 @@ class MessageProcessor:
         
         # Пропускаем пустые сообщения
         message_text = event.message.text or event.message.message
-        has_photo = bool(event.message.photo)
         
-        if not message_text and not has_photo:
+        if not message_text and not MessageProcessor.has_forwardable_media(event.message):
             return False
         
         return True
@@ -1,205 +1,968 @@
-from telethon import TelegramClient, events
-from telethon.tl.types import MessageMediaPhoto, MessageAction
-import tempfile
+from telethon import TelegramClient, events, utils
 import os
 import logging
 import asyncio
-from datetime import datetime, timezone
-import hashlib
-from typing import Set, Optional
-from media_utils import MediaHandler, MessageProcessor
-
-# Настройка логов
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('medical_bot.log'),
-        logging.StreamHandler()
-    ]
+import argparse
+import functools
+import signal
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from media_utils import MessageProcessor
+from dedup_store import DedupStore
+from send_queue import SendQueue, SendJob
+from album_aggregator import AlbumAggregator
+from digest import DigestBuffer
+from media_forwarder import MediaForwarder
+from media_cache import UploadCache
+from media_spool import MediaSpool
+from media_transcode import ImageTranscoder
+from media_transfer import ChunkedTransfer
+from text_dedup import SimHashIndex
+from image_dedup import ImageHashIndex
+from backfill import BackfillEvent, HistoryBackfill
+from outbox import Outbox
+from entity_cache import EntityCache
+from routing import Router
+from sharding import (
+    ShardEvent, ShardSupervisor, put_record, restore_message, serialize_message, split_channels
+)
+import metrics
+from log_setup import setup_logging
+import bot_config
+from bot_config import API_ID, API_HASH, BOT_TOKEN, DESTINATION_CHANNEL, ConfigWatcher, MonitorConfig
+from metrics import MESSAGES, time_stage
+from loop_watchdog import LoopProfiler, LoopWatchdog
+
+# Настройка логов: файл и консоль пишутся в фоновом потоке
+setup_logging(
+    path=os.getenv('LOG_PATH', 'medical_bot.log'),
+    level=getattr(logging, os.getenv('LOG_LEVEL', 'INFO').upper(), logging.INFO),
+    json_format=os.getenv('LOG_JSON', '').lower() in ('1', 'true', 'yes'),
+    max_bytes=int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024))),
+    backup_count=int(os.getenv('LOG_BACKUP_COUNT', '5')),
+    rotate_when=os.getenv('LOG_ROTATE_WHEN') or None,
+    sample_burst=int(os.getenv('LOG_SAMPLE_BURST', '10')),
+    sample_interval=float(os.getenv('LOG_SAMPLE_INTERVAL', '60'))
 )
 logger = logging.getLogger(__name__)
 
-# Конфигурация
-API_ID = int(os.getenv('API_ID', '27717201'))
-API_HASH = os.getenv('API_HASH', 'f64bbdb83fc622bcc52f2740348457c3')
-BOT_TOKEN = os.getenv('BOT_TOKEN', '8325424545:AAEOUPCJYp0KFjnNUoTwUmzRfOkGt798dQE')
-
-# Конфигурация каналов
-SOURCE_CHANNELS = [
-    "https://t.me/docters_smp",
-    "https://t.me/onco_beseda",
-    "https://t.me/minzdrav_ru",
-    "https://t.me/immunobee",
-    "https://t.me/PSOmedics",
-    "https://t.me/DrButriy",
-    "https://t.me/dr_komarovskiy",
-    "https://t.me/mediamedics",
-    "https://t.me/medach",
-    "https://t.me/redcross_ru",
-    "https://t.me/oncolya",
-    "https://t.me/ru2ch_ban",
-    "https://t.me/pornhub_pr",
-    "https://t.me/Eric_Davidich_D3",
-    "https://t.me/labkovskiy",
-    "https://t.me/toplesofficial",
-    "https://t.me/naebnet",
-    "https://t.me/Wylsared"
-]
-
-DESTINATION_CHANNEL = "@medical_news_aggregator"  # Целевой канал
-
-# Временные рамки мониторинга
-START_DATE = datetime(2025, 8, 17, 20, 0, 0, tzinfo=timezone.utc)
-END_DATE = datetime(2026, 8, 17, 20, 0, 0, tzinfo=timezone.utc)
-
-# Множество для отслеживания уже обработанных сообщений (защита от дублирования)
-processed_messages: Set[str] = set()
+# Перечитывание каналов и периода мониторинга: по SIGHUP и при изменении файла CHANNELS_CONFIG_PATH
+CONFIG_WATCH_INTERVAL = float(os.getenv('CONFIG_WATCH_INTERVAL', '5'))
+
+# Персистентное хранилище обработанных сообщений (защита от дублирования)
+DEDUP_DB_PATH = os.getenv('DEDUP_DB_PATH', 'processed_messages.db')
+dedup_store = DedupStore(DEDUP_DB_PATH)
+# Период удаления устаревших ключей и их максимальный возраст в днях (0 - весь период мониторинга)
+DEDUP_EVICT_INTERVAL = float(os.getenv('DEDUP_EVICT_INTERVAL', '3600'))
+DEDUP_MAX_AGE_DAYS = float(os.getenv('DEDUP_MAX_AGE_DAYS', '0'))
+
+# Журнал исходящих: незавершенные отправки повторяются после перезапуска
+outbox = Outbox(os.getenv('OUTBOX_PATH', 'outbox.db'))
+# Сколько сообщений канала запрашивать после перезапуска, начиная с последнего принятого
+CATCH_UP_LIMIT = int(os.getenv('CATCH_UP_LIMIT', '1000'))
+
+# Очередь отправки в целевой канал
+send_queue = SendQueue(
+    maxsize=int(os.getenv('SEND_QUEUE_SIZE', '1000')),
+    workers=int(os.getenv('SEND_WORKERS', '3')),
+    global_rate=float(os.getenv('SEND_GLOBAL_RATE', str(SendQueue.DEFAULT_GLOBAL_RATE))),
+    per_chat_rate=float(os.getenv('SEND_PER_CHAT_RATE', str(SendQueue.DEFAULT_PER_CHAT_RATE * 60))) / 60,
+    # Одновременных передач крупных файлов; у них свои воркеры, чтобы не задерживать остальные сообщения
+    large_workers=int(os.getenv('TRANSFER_MAX_CONCURRENT', '2'))
+)
+
+# Индекс почти одинаковых текстов (репосты одной новости в разных каналах)
+TEXT_SIMILARITY_DISTANCE = int(os.getenv('TEXT_SIMILARITY_DISTANCE', '3'))
+text_index = SimHashIndex(
+    max_distance=max(0, TEXT_SIMILARITY_DISTANCE),
+    window_seconds=float(os.getenv('TEXT_DEDUP_WINDOW_HOURS', '72')) * 3600
+)
+
+# Индекс похожих изображений (то же фото, перезалитое или пережатое другим каналом)
+IMAGE_SIMILARITY_DISTANCE = int(os.getenv('IMAGE_SIMILARITY_DISTANCE', '6'))
+image_index = ImageHashIndex(
+    max_distance=max(0, IMAGE_SIMILARITY_DISTANCE),
+    window_seconds=float(os.getenv('IMAGE_DEDUP_WINDOW_HOURS', '72')) * 3600,
+    enabled=IMAGE_SIMILARITY_DISTANCE >= 0
+)
+
+# Метрики: эндпоинт Prometheus (0 - отключен) и период сводки в логе
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+METRICS_LOG_INTERVAL = float(os.getenv('METRICS_LOG_INTERVAL', '300'))
+metrics_server = metrics.MetricsServer(METRICS_HOST, METRICS_PORT)
+metrics.registry.gauge('medbot_send_queue_depth', 'Сообщений в очереди отправки', send_queue.qsize)
+metrics.registry.gauge('medbot_pending_albums', 'Альбомов в ожидании остальных частей',
+                       lambda: len(album_aggregator))
+background_tasks: List[asyncio.Task] = []
+
+# Контроль цикла событий: остановки дольше LOOP_STALL_THRESHOLD секунд и обработчики дольше
+# SLOW_HANDLER_SECONDS (0 отключает проверку)
+loop_watchdog = LoopWatchdog(
+    stall_threshold=float(os.getenv('LOOP_STALL_THRESHOLD', '0.25')),
+    handler_threshold=float(os.getenv('SLOW_HANDLER_SECONDS', '10')),
+    interval=float(os.getenv('LOOP_LAG_INTERVAL', '0.1'))
+)
+# Профилирование по SIGUSR1: cprofile или flamegraph (пусто - отключено)
+PROFILE_MODE = os.getenv('PROFILE_MODE', '').lower()
+loop_profiler = LoopProfiler(
+    PROFILE_MODE,
+    directory=os.getenv('PROFILE_DIR', 'profiles'),
+    duration=float(os.getenv('PROFILE_SECONDS', '30')),
+    sample_interval=float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0.005'))
+) if PROFILE_MODE else None
 
 # Создание клиента
-client = TelegramClient('medical_monitor_bot', API_ID, API_HASH)
+# Шарды запускаются с собственными файлами сессий (BOT_SESSION задает супервизор)
+SESSION_NAME = os.getenv('BOT_SESSION', 'medical_monitor_bot')
+# Номер шарда и число шардов (задает супервизор; в основном процессе не заданы)
+SHARD_INDEX = int(os.environ['SHARD_INDEX']) if os.getenv('SHARD_INDEX') else None
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '1'))
+client = TelegramClient(SESSION_NAME, API_ID, API_HASH)
+
+# Кэш разрешенных каналов: источники и целевой канал разрешаются один раз при запуске
+entity_cache = EntityCache(
+    client,
+    os.getenv('ENTITY_CACHE_PATH', 'entity_cache.db'),
+    ttl=float(os.getenv('ENTITY_CACHE_TTL', str(EntityCache.DEFAULT_TTL))),
+    concurrency=int(os.getenv('RESOLVE_CONCURRENCY', '4'))
+)
+
+# Правила маршрутизации: без файла правил все сообщения идут в DESTINATION_CHANNEL
+ROUTING_RULES_PATH = os.getenv('ROUTING_RULES_PATH')
+router = Router.from_file(ROUTING_RULES_PATH) if ROUTING_RULES_PATH else Router.single(DESTINATION_CHANNEL)
 
-def generate_message_hash(event) -> str:
-    """Генерирует уникальный хеш для сообщения на основе его содержимого"""
-    message_data = f"{event.chat_id}_{event.message.id}_{event.message.date}"
-    if event.message.text:
-        message_data += event.message.text
-    if event.message.media:
-        message_data += str(event.message.media)
-    return hashlib.md5(message_data.encode()).hexdigest()
+# InputPeer каналов назначения (заполняются при запуске, до этого используется ссылка на канал)
+destination_peers: Dict[str, object] = {}
+
+def destination_peer(destination: str):
+    """Возвращает InputPeer канала назначения"""
+    return destination_peers.get(destination, destination)
+
+# Пересылка медиа по ссылке на файл (со скачиванием только при устаревшей ссылке)
+upload_cache = UploadCache(
+    os.getenv('MEDIA_CACHE_PATH', 'media_cache.db'),
+    ttl=float(os.getenv('MEDIA_CACHE_TTL', str(UploadCache.DEFAULT_TTL)))
+)
+# Каталог временных файлов медиа (можно указать tmpfs) с ограничением занимаемого места
+media_spool = MediaSpool(
+    os.getenv('MEDIA_SPOOL_DIR') or None,
+    budget=int(os.getenv('MEDIA_SPOOL_BUDGET', str(MediaSpool.DEFAULT_BUDGET))),
+    max_workers=int(os.getenv('MEDIA_SPOOL_WORKERS', '4')),
+    stale_age=float(os.getenv('MEDIA_SPOOL_STALE_AGE', str(MediaSpool.DEFAULT_STALE_AGE)))
+)
+MEDIA_SPOOL_SWEEP_INTERVAL = float(os.getenv('MEDIA_SPOOL_SWEEP_INTERVAL', '600'))
+# Пережатие крупных изображений в пуле процессов (нужен Pillow)
+image_transcoder = ImageTranscoder(
+    max_workers=int(os.getenv('TRANSCODE_WORKERS', '2')),
+    target_bytes=int(os.getenv('TRANSCODE_TARGET_BYTES', str(ImageTranscoder.DEFAULT_TARGET_BYTES))),
+    max_source_bytes=int(os.getenv('TRANSCODE_MAX_SOURCE_BYTES', str(ImageTranscoder.DEFAULT_MAX_SOURCE_BYTES))),
+    max_dimension=int(os.getenv('TRANSCODE_MAX_DIMENSION', str(ImageTranscoder.DEFAULT_MAX_DIMENSION))),
+    quality=int(os.getenv('TRANSCODE_QUALITY', '85')),
+    enabled=os.getenv('TRANSCODE_ENABLED', '1').lower() in ('1', 'true', 'yes')
+)
+media_forwarder = MediaForwarder(
+    client,
+    memory_limit=int(os.getenv('MEDIA_MEMORY_LIMIT', str(MediaForwarder.DEFAULT_MEMORY_LIMIT))),
+    cache=upload_cache,
+    spool=media_spool,
+    transcoder=image_transcoder,
+    outbox=outbox,
+    # Крупные документы и видео перекачиваются частями без временного файла
+    transfer=ChunkedTransfer(
+        client,
+        parallel=int(os.getenv('TRANSFER_PARALLEL_PARTS', '4')),
+        part_size=int(os.getenv('TRANSFER_PART_SIZE', str(ChunkedTransfer.PART_SIZE)))
+    )
+)
+
+def generate_message_hash(event) -> bytes:
+    """
+    Генерирует уникальный 16-байтный хеш для сообщения на основе его содержимого
+
+    В ключ входят только поля, одинаковые для всех аккаунтов: access_hash и
+    file_reference медиа у бота и у пользовательского клиента догрузки разные,
+    поэтому вместо представления медиа берется id фото или документа.
+    """
+    message = event.message
+    message_data = f"{event.chat_id}_{message.id}_{message.message or ''}"
+    media = getattr(message, 'photo', None) or getattr(message, 'document', None)
+    media_id = getattr(media, 'id', None)
+    if media_id is not None:
+        message_data += f"_{media_id}"
+    return DedupStore.digest(message_data)
+
+def channel_label(event) -> str:
+    """Метка канала-источника для логов и метрик"""
+    username = getattr(event.chat, 'username', None)
+    return f"@{username}" if username else str(event.chat_id)
+
+def describe_message(event) -> str:
+    """Краткое описание сообщения для логов: канал и id"""
+    return f"{channel_label(event)}/{event.message.id}"
+
+def text_signature(text: Optional[str]) -> Optional[int]:
+    """SimHash-подпись текста для поиска почти-дубликатов (None, если проверка отключена)"""
+    if not text or TEXT_SIMILARITY_DISTANCE < 0:
+        return None
+    with time_stage('text_dedup'):
+        return SimHashIndex.signature(text)
+
+def is_near_duplicate(description: str, signature: Optional[int]) -> bool:
+    """Проверяет, публиковался ли недавно почти такой же текст, и запоминает новый"""
+    if signature is None:
+        return False
+    match = text_index.find(signature)
+    if match is None:
+        text_index.add(signature, description)
+        return False
+    distance, original = match
+    logger.info("Сообщение %s - почти дубликат %s (расстояние %d)",
+                description, original, distance, extra={'sample': 'near_duplicate'})
+    return True
+
+def image_signatures(photo_events: List) -> List[int]:
+    """dHash-подписи фото (пусто, если проверка отключена или миниатюр нет)"""
+    if not photo_events or IMAGE_SIMILARITY_DISTANCE < 0:
+        return []
+    with time_stage('image_hash'):
+        signatures = [ImageHashIndex.signature(event.message.photo) for event in photo_events]
+    return [signature for signature in signatures if signature is not None]
+
+def same_caption(caption: Optional[int], original: Optional[int]) -> bool:
+    """Текст поста совпадает с текстом поста, где уже было фото (или у поста нет текста)"""
+    if caption is None:
+        return True
+    if original is None:
+        return False
+    return bin(caption ^ original).count('1') <= max(TEXT_SIMILARITY_DISTANCE, 0)
+
+def is_duplicate_image(description: str, signatures: List[int], text: Optional[str]) -> bool:
+    """
+    Проверяет, публиковались ли недавно такие же изображения, и запоминает новые
+    
+    Сообщение считается дубликатом, только если похожее найдено для каждого фото
+    и текст поста совпадает с текстом того поста (или текста нет). Миниатюра
+    слишком мала, чтобы по ней одной отбрасывать пост с другой новостью.
+    """
+    if not signatures:
+        return False
+    with time_stage('text_dedup'):
+        caption = SimHashIndex.fingerprint(text) if text else None
+    matches = [image_index.find(signature) for signature in signatures]
+    if any(match is None or not same_caption(caption, match[2]) for match in matches):
+        for signature in signatures:
+            image_index.add(signature, description, caption)
+        return False
+    distance, original, _ = max(matches)
+    logger.info("Изображения сообщения %s уже публиковались в %s (расстояние %d)",
+                description, original, distance, extra={'sample': 'image_duplicate'})
+    return True
+
+async def evict_dedup_keys():
+    """Удаляет ключи дедупликации вне периода мониторинга и старше DEDUP_MAX_AGE_DAYS"""
+    config = bot_config.current()
+    start_date = config.start_date
+    if DEDUP_MAX_AGE_DAYS > 0:
+        start_date = max(start_date, datetime.now(timezone.utc) - timedelta(days=DEDUP_MAX_AGE_DAYS))
+    await dedup_store.evict_outside_window(start_date, config.end_date)
+
+async def evict_dedup_keys_periodically(interval: float):
+    """Периодически удаляет устаревшие ключи дедупликации"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await evict_dedup_keys()
+        except Exception as e:
+            logger.error(f"Ошибка при удалении ключей дедупликации: {e}")
 
 def is_within_monitoring_period(message_date: datetime) -> bool:
     """Проверяет, находится ли сообщение в рамках периода мониторинга"""
-    return START_DATE <= message_date <= END_DATE
+    config = bot_config.current()
+    return config.start_date <= message_date <= config.end_date
 
 async def check_bot_permissions():
-    """Проверяет права бота в целевом канале"""
+    """Проверяет права бота во всех каналах назначения"""
     try:
-        chat = await client.get_entity(DESTINATION_CHANNEL)
-        participant = await client.get_permissions(chat)
-        
-        if not participant.is_admin:
-            logger.warning("Бот не является администратором целевого канала!")
-            return False
+        for destination in router.destinations():
+            chat = await entity_cache.get_entity(destination)
+            participant = await client.get_permissions(chat)
             
-        logger.info("Права бота в целевом канале проверены успешно")
+            if not participant.is_admin:
+                logger.warning(f"Бот не является администратором канала {destination}!")
+                return False
+            
+        logger.info("Права бота в каналах назначения проверены успешно")
         return True
     except Exception as e:
         logger.error(f"Ошибка при проверке прав бота: {e}")
         return False
 
-async def download_media_with_retry(event, max_retries: int = 3) -> Optional[str]:
-    """Скачивает медиа с повторными попытками"""
-    return await MediaHandler.download_media_with_retry(event, max_retries)
+def route_message(event, text: Optional[str]) -> List[str]:
+    """Определяет каналы назначения сообщения по правилам маршрутизации"""
+    with time_stage('route'):
+        return router.route(event.chat_id, text, getattr(event.chat, 'username', None))
 
-async def send_large_file(file_path: str, caption: str = None):
-    """Отправляет большой файл с разбивкой на части при необходимости"""
-    try:
-        file_size = os.path.getsize(file_path)
-        max_size = 50 * 1024 * 1024  # 50 MB
+async def submit_routed(destinations: List[str], make_send: Callable[[object], Callable],
+                        on_success: Callable[[], None], on_failure: Callable[[], None],
+                        description: str, on_sent: Optional[Callable[[str], None]] = None,
+                        digest: Optional[Tuple[str, str]] = None, large: bool = False):
+    """
+    Ставит в очередь отправку в каждый канал назначения
+    
+    on_success вызывается один раз, когда все отправки завершены и хотя бы
+    одна удалась, иначе вызывается on_failure.
+    
+    Args:
+        destinations: Каналы назначения
+        make_send: Создает корутинную функцию отправки по InputPeer канала
+        on_success: Обработчик успешной пересылки
+        on_failure: Обработчик неудачной пересылки
+        description: Описание для логов
+        on_sent: Вызывается с каналом назначения после каждой успешной отправки
+        digest: (источник, текст) - отправить в составе дайджеста, если он включен
+        large: Отправка может потребовать перекачки крупного файла
+    """
+    state = {'pending': len(destinations), 'sent': 0}
+    
+    def sent(destination: str):
+        state['sent'] += 1
+        if on_sent:
+            on_sent(destination)
         
-        if file_size > max_size:
-            logger.warning(f"Файл слишком большой ({file_size} bytes), попытка отправки...")
-        
-        await client.send_file(
-            entity=DESTINATION_CHANNEL,
-            file=file_path,
-            caption=caption,
-            supports_streaming=True
+    def done():
+        state['pending'] -= 1
+        if state['pending'] == 0:
+            (on_success if state['sent'] else on_failure)()
+    
+    for destination in destinations:
+        job = SendJob(
+            chat=destination,
+            send=make_send(destination_peer(destination)),
+            on_success=functools.partial(sent, destination),
+            on_done=done,
+            description=description if len(destinations) == 1 else f"{description} -> {destination}",
+            large=large
         )
-        logger.info("Файл отправлен успешно")
+        if digest is not None and digest_buffer is not None:
+            await digest_buffer.add(destination, *digest, job)
+        else:
+            await send_queue.submit(job)
+
+class PreparedMessage:
+    """
+    Сообщение (или альбом), прошедшее фильтры и маршрутизацию
+    
+    Подготовка выполняется там, где получено событие (в шарде или в основном
+    процессе), а проверка дубликатов и отправка - в основном процессе.
+    """
+    
+    __slots__ = ('channel', 'description', 'title', 'events', 'text', 'hashes',
+                 'signature', 'image_signatures', 'destinations', 'kind', 'count', 'position')
+    
+    def __init__(self, channel: str, description: str, title: str, events: List,
+                 text: Optional[str], hashes: List, signature: Optional[int],
+                 image_signatures: List[int], destinations: List[str], kind: str,
+                 count: int = 1, position: Tuple[int, int] = (0, 0)):
+        self.channel = channel
+        self.description = description
+        self.title = title
+        # События с медиа для отправки (пусто для текстовых сообщений)
+        self.events = events
+        self.text = text
+        # [(ключ дедупликации, дата сообщения)] для всех частей
+        self.hashes = hashes
+        self.signature = signature
+        self.image_signatures = image_signatures
+        self.destinations = destinations
+        self.kind = kind
+        self.count = count
+        # (id канала-источника, наибольший id сообщения) для догрузки после перезапуска
+        self.position = position
         
-    except Exception as e:
-        logger.error(f"Ошибка при отправке файла: {e}")
-        raise
+    def to_record(self) -> dict:
+        """Запись для передачи из шарда в основной процесс"""
+        return {
+            'channel': self.channel,
+            'description': self.description,
+            'title': self.title,
+            'messages': [serialize_message(event.message) for event in self.events],
+            'text': self.text,
+            'hashes': self.hashes,
+            'signature': self.signature,
+            'image_signatures': self.image_signatures,
+            'destinations': self.destinations,
+            'kind': self.kind,
+            'count': self.count,
+            'position': self.position,
+        }
+        
+    @classmethod
+    def from_record(cls, record: dict, client) -> 'PreparedMessage':
+        """Восстанавливает сообщение из записи шарда, привязывая медиа к клиенту отправителя"""
+        events = [ShardEvent(restore_message(data, client)) for data in record['messages']]
+        return cls(record['channel'], record['description'], record['title'], events,
+                   record['text'], record['hashes'], record['signature'],
+                   record['image_signatures'], record['destinations'], record['kind'],
+                   record['count'], record['position'])
+
+# Ключи сообщений, принятых к отправке, но еще не отмеченных в хранилище дедупликации
+claimed_hashes: Set[bytes] = set()
+
+async def dispatch_prepared(prepared: PreparedMessage, check_duplicate: bool = False,
+                            entry: Optional[Tuple[int, Set[str]]] = None):
+    """
+    Проверяет подготовленное сообщение на дубликаты и ставит его в очередь отправки
+    
+    Сообщение записывается в журнал исходящих до постановки в очередь и
+    удаляется из него, когда все отправки завершены.
+    
+    Args:
+        prepared: Подготовленное сообщение
+        check_duplicate: Повторно проверить ключи дедупликации (для сообщений
+            от шардов, которые не видят отметки других процессов)
+        entry: (номер записи журнала, каналы с подтвержденной отправкой) при
+            повторе после перезапуска
+    """
+    channel, count = prepared.channel, prepared.count
+    hashes = [message_hash for message_hash, _ in prepared.hashes]
+    if check_duplicate or entry is not None:
+        with time_stage('dedup'):
+            is_duplicate = all(message_hash in dedup_store for message_hash, _ in prepared.hashes)
+        if is_duplicate:
+            logger.info("Сообщение уже обработано (дубликат)", extra={'sample': 'duplicate'})
+            MESSAGES.inc(channel, 'duplicate', amount=count)
+            if entry is not None:
+                outbox.complete(entry[0])
+            return
+    
+    if entry is None:
+        # То же сообщение уже принято другим путем (подписка и запрос пропущенных),
+        # но еще не отмечено в хранилище дедупликации
+        if any(message_hash in claimed_hashes for message_hash in hashes):
+            logger.info("Сообщение уже принято к отправке (дубликат)", extra={'sample': 'duplicate'})
+            MESSAGES.inc(channel, 'duplicate', amount=count)
+            return
+        
+        # Проверяем на почти-дубликат из другого канала
+        if is_near_duplicate(prepared.description, prepared.signature):
+            MESSAGES.inc(channel, 'near_duplicate', amount=count)
+            return
+        
+        # Те же изображения уже отправлялись: пропускаем и скачивание, и загрузку
+        if is_duplicate_image(prepared.description, prepared.image_signatures, prepared.text):
+            MESSAGES.inc(channel, 'image_duplicate', amount=count)
+            return
+        
+        # Ключи занимаются до первого await, поэтому второй путь их уже увидит
+        claimed_hashes.update(hashes)
+        try:
+            with time_stage('journal'):
+                entry_id = await outbox.accept(prepared.to_record(), *prepared.position)
+        except BaseException:
+            claimed_hashes.difference_update(hashes)
+            raise
+        destinations, already_sent = prepared.destinations, False
+    else:
+        entry_id, sent = entry
+        destinations = [d for d in prepared.destinations if d not in sent]
+        already_sent = bool(sent)
+        
+    logger.info("Обрабатывается %s из %s", prepared.kind, prepared.title)
+    
+    def mark_processed():
+        for message_hash, message_date in prepared.hashes:
+            dedup_store.add(message_hash, message_date)
+        claimed_hashes.difference_update(hashes)
+        outbox.complete(entry_id)
+        MESSAGES.inc(channel, 'forwarded', amount=count)
+    
+    def mark_failed():
+        claimed_hashes.difference_update(hashes)
+        outbox.complete(entry_id)
+        MESSAGES.inc(channel, 'failed', amount=count)
+    
+    if not destinations:
+        mark_processed()
+        return
+    
+    if prepared.events:
+        # Медиа пересылается по ссылке на файл; если его приходится скачивать,
+        # скачивание выполняется один раз для всех каналов назначения
+        caption = MessageProcessor.create_caption(prepared.text) if prepared.text else None
+        make_send = lambda peer: functools.partial(media_forwarder.send_media, peer, prepared.events, caption)
+    else:
+        make_send = lambda peer: lambda: client.send_message(entity=peer, message=prepared.text)
+        
+    # Ставим отправку в очередь; отправка, начатая до перезапуска, засчитывается
+    with time_stage('enqueue'):
+        await submit_routed(destinations, make_send, mark_processed,
+                            mark_processed if already_sent else mark_failed, prepared.kind,
+                            on_sent=functools.partial(outbox.mark_sent, entry_id),
+                            digest=None if prepared.events else (prepared.title, prepared.text),
+                            large=any(media_forwarder.should_relay(e.message) for e in prepared.events))
+
+# Получатель подготовленных сообщений: в шарде - очередь к основному процессу
+prepared_sink: Callable[[PreparedMessage], Awaitable] = dispatch_prepared
+
+def prepare_album(album_events: List) -> Optional[PreparedMessage]:
+    """Фильтрует и маршрутизирует собранный альбом"""
+    album_text, media_events = MessageProcessor.extract_album_content(album_events)
+    channel = channel_label(album_events[0])
+    if not media_events:
+        logger.info("Альбом пропущен (нет медиа)", extra={'sample': 'skipped'})
+        MESSAGES.inc(channel, 'skipped', amount=len(album_events))
+        return None
+        
+    destinations = route_message(album_events[0], album_text)
+    if not destinations:
+        logger.info("Альбом не подходит ни под одно правило маршрутизации", extra={'sample': 'filtered'})
+        MESSAGES.inc(channel, 'filtered', amount=len(album_events))
+        return None
+        
+    return PreparedMessage(
+        channel, describe_message(album_events[0]), album_events[0].chat.title,
+        events=media_events,
+        text=album_text,
+        hashes=[(generate_message_hash(e), e.message.date) for e in album_events],
+        # Подпись альбома по подписи к медиа не считается: одинаковый шаблонный текст
+        # под разными медиа не делает посты дубликатами
+        signature=None,
+        image_signatures=image_signatures([e for e in media_events if e.message.photo]),
+        destinations=destinations,
+        kind=f"альбом ({len(media_events)} медиа)",
+        count=len(album_events),
+        position=(album_events[0].chat_id, max(e.message.id for e in album_events))
+    )
+
+async def handle_album(album_events: List):
+    """Обрабатывает собранный альбом и отправляет его одной медиагруппой"""
+    prepared = prepare_album(album_events)
+    if prepared is not None:
+        await prepared_sink(prepared)
+
+# Сборщик альбомов: части с общим grouped_id отправляются одной медиагруппой
+album_aggregator = AlbumAggregator(
+    handle_album,
+    settle_delay=float(os.getenv('ALBUM_SETTLE_DELAY', '0.7'))
+)
+
+# Дайджесты: текстовые сообщения копятся DIGEST_WINDOW секунд и объединяются (0 - отключено)
+DIGEST_WINDOW = float(os.getenv('DIGEST_WINDOW', '0'))
+digest_buffer = DigestBuffer(
+    lambda destination, text: client.send_message(entity=destination_peer(destination), message=text),
+    send_queue.submit,
+    window=DIGEST_WINDOW,
+    max_items=int(os.getenv('DIGEST_MAX_ITEMS', '20')),
+    per_source=os.getenv('DIGEST_PER_SOURCE', 'false').lower() in ('1', 'true', 'yes')
+) if DIGEST_WINDOW > 0 else None
+
+async def flush_pending():
+    """Передает в очередь отправки накопленные альбомы и дайджесты"""
+    await album_aggregator.flush_all()
+    if digest_buffer is not None:
+        await digest_buffer.flush_all()
 
-@client.on(events.NewMessage(chats=SOURCE_CHANNELS))
 async def handle_new_message(event):
     """Обработчик новых сообщений"""
+    with time_stage('handler'), loop_watchdog.track(
+            'handle_new_message', functools.partial(describe_message, event)):
+        await process_new_message(event)
+
+# Типы медиа, которые пересылаются вместе с текстом
+MEDIA_KINDS = {'photo': "фото", 'video': "видео", 'document': "документ"}
+
+def prepare_message(event) -> Optional[PreparedMessage]:
+    """Фильтрует и маршрутизирует сообщение (части альбома передаются сборщику)"""
+    channel = channel_label(event)
+    MESSAGES.inc(channel, 'in')
+    
+    # Проверяем, нужно ли обрабатывать сообщение
+    with time_stage('filter'):
+        should_process = MessageProcessor.should_process_message(event)
+    if not should_process:
+        logger.info("Сообщение пропущено (служебное или пустое)", extra={'sample': 'skipped'})
+        MESSAGES.inc(channel, 'skipped')
+        return None
+        
+    # Проверяем период мониторинга
+    if not is_within_monitoring_period(event.message.date):
+        logger.info("Сообщение вне периода мониторинга: %s", event.message.date,
+                    extra={'sample': 'out_of_period'})
+        MESSAGES.inc(channel, 'out_of_period')
+        return None
+        
+    # Проверяем на дублирование
+    with time_stage('hash'):
+        message_hash = generate_message_hash(event)
+    with time_stage('dedup'):
+        is_duplicate = message_hash in dedup_store
+    if is_duplicate:
+        logger.info("Сообщение уже обработано (дубликат)", extra={'sample': 'duplicate'})
+        MESSAGES.inc(channel, 'duplicate')
+        return None
+        
+    # Части альбома собираются и обрабатываются вместе
+    if event.message.grouped_id:
+        album_aggregator.add(event)
+        return None
+        
+    # Извлекаем содержимое сообщения
+    message_text, has_photo, media_type = MessageProcessor.extract_message_content(event)
+    
+    # Определяем каналы назначения по правилам маршрутизации
+    destinations = route_message(event, message_text)
+    if not destinations:
+        logger.info("Сообщение не подходит ни под одно правило маршрутизации",
+                    extra={'sample': 'filtered'})
+        MESSAGES.inc(channel, 'filtered')
+        return None
+        
+    if media_type in MEDIA_KINDS:
+        kind = MEDIA_KINDS[media_type] + (" с текстом" if message_text else "")
+        media_events = [event]
+    else:
+        kind = "текст"
+        media_events = []
+        
+    return PreparedMessage(
+        channel, describe_message(event), event.chat.title,
+        events=media_events,
+        text=message_text,
+        hashes=[(message_hash, event.message.date)],
+        signature=None if media_events else text_signature(message_text),
+        image_signatures=image_signatures(media_events if has_photo else []),
+        destinations=destinations,
+        kind=kind,
+        position=(event.chat_id, event.message.id)
+    )
+
+async def process_new_message(event):
+    """Фильтрует сообщение и передает его на отправку"""
     try:
-        # Проверяем, нужно ли обрабатывать сообщение
-        if not MessageProcessor.should_process_message(event):
-            logger.info("Сообщение пропущено (служебное или пустое)")
-            return
-            
-        # Проверяем период мониторинга
-        if not is_within_monitoring_period(event.message.date):
-            logger.info(f"Сообщение вне периода мониторинга: {event.message.date}")
-            return
+        prepared = prepare_message(event)
+        if prepared is not None:
+            await prepared_sink(prepared)
+    except Exception as e:
+        logger.error("Ошибка при обработке сообщения: %s", e)
+        MESSAGES.inc(channel_label(event), 'failed')
+
+async def resolve_peers(channels: Optional[List[str]] = None) -> List[int]:
+    """
+    Разрешает каналы-источники и каналы назначения в id и access_hash
+    
+    Результаты сохраняются в кэше сущностей, поэтому повторный запуск не
+    обращается к API. Канал, который не удалось разрешить, пропускается, а
+    бот продолжает работать с остальными.
+    
+    Args:
+        channels: Каналы-источники (по умолчанию свои каналы процесса, см. own_channels)
+    
+    Returns:
+        Список id каналов-источников в формате Telethon (-100...)
+    """
+    config = bot_config.current()
+    if channels is None:
+        channels = own_channels(config)
+    references = list(dict.fromkeys(channels + router.destinations() + router.sources()))
+    resolved, failed = await entity_cache.resolve_many(references)
+    for channel, error in failed.items():
+        logger.error(f"Не удалось разрешить канал {channel}: {error}")
+        
+    for destination in router.destinations():
+        if destination in resolved:
+            destination_peers[destination] = utils.get_input_peer(resolved[destination])
             
-        # Проверяем на дублирование
-        message_hash = generate_message_hash(event)
-        if message_hash in processed_messages:
-            logger.info("Сообщение уже обработано (дубликат)")
+    router.bind_sources({channel: utils.get_peer_id(resolved[channel])
+                         for channel in router.sources() if channel in resolved})
+    for channel in set(router.sources()) - set(config.source_channels):
+        logger.warning(f"Канал {channel} из правил маршрутизации не входит в SOURCE_CHANNELS")
+        
+    source_ids = [utils.get_peer_id(resolved[channel])
+                  for channel in channels if channel in resolved]
+    logger.info(f"Разрешено каналов-источников: {len(source_ids)}/{len(channels)}")
+    return source_ids
+
+def own_channels(config: MonitorConfig) -> List[str]:
+    """Каналы-источники этого процесса: все каналы или часть шарда"""
+    if SHARD_INDEX is None:
+        return config.source_channels
+    parts = split_channels(config.source_channels, SHARD_COUNT)
+    return parts[SHARD_INDEX] if SHARD_INDEX < len(parts) else []
+
+def subscribe(source_ids: List[int]):
+    """Подписывает обработчик новых сообщений на каналы-источники вместо прежних"""
+    client.remove_event_handler(handle_new_message)
+    client.add_event_handler(handle_new_message, events.NewMessage(chats=source_ids))
+
+async def apply_config(previous: MonitorConfig, config: MonitorConfig,
+                       supervisor: Optional[ShardSupervisor] = None):
+    """
+    Применяет перечитанную конфигурацию без переподключения
+    
+    Новые каналы разрешаются через кэш сущностей, и подписка обработчика
+    заменяется; соединение, кэши, очередь отправки и журнал сохраняются.
+    Новый период мониторинга действует для следующих сообщений. В режиме
+    шардов конфигурацию перечитывают сами шарды (им пересылается SIGHUP).
+    """
+    if (previous.start_date, previous.end_date) != (config.start_date, config.end_date):
+        logger.info(f"Новый период мониторинга: {config.start_date} - {config.end_date}")
+        if SHARD_INDEX is None:
+            await evict_dedup_keys()
+        
+    if supervisor is not None:
+        parts = split_channels(config.source_channels, len(supervisor.shard_channels))
+        # Перезапущенный шард получит каналы по новой конфигурации
+        supervisor.shard_channels = parts + [[] for _ in range(len(supervisor.shard_channels) - len(parts))]
+        supervisor.reload_config()
+        return
+    if own_channels(previous) == own_channels(config):
+        return
+        
+    channels = own_channels(config)
+    source_ids = await resolve_peers(channels)
+    if channels and not source_ids:
+        logger.error("Не удалось разрешить ни одного нового канала-источника, подписка не изменена")
+        return
+    subscribe(source_ids)
+    logger.info(f"Подписка обновлена: {len(source_ids)} каналов-источников")
+
+def start_diagnostics():
+    """Запускает контроль цикла событий и профилирование по сигналу"""
+    loop_watchdog.start()
+    if loop_profiler is not None:
+        loop_profiler.start()
+
+def stop_diagnostics():
+    """Останавливает контроль цикла событий и профилирование"""
+    loop_watchdog.stop()
+    if loop_profiler is not None:
+        loop_profiler.stop()
+
+async def replay_outbox():
+    """Повторяет отправки, не завершенные до остановки, и дожидается их"""
+    entries = outbox.pending()
+    if not entries:
+        return
+    logger.info("Незавершенных сообщений в журнале исходящих: %d", len(entries))
+    for entry_id, record, sent in entries:
+        try:
+            prepared = PreparedMessage.from_record(record, client)
+            await dispatch_prepared(prepared, entry=(entry_id, sent))
+        except Exception as e:
+            logger.error("Не удалось повторить сообщение %d из журнала: %s", entry_id, e)
+            outbox.complete(entry_id)
+    # Отметки дедупликации должны появиться до запроса пропущенных сообщений
+    if digest_buffer is not None:
+        await digest_buffer.flush_all()
+    await send_queue.join()
+
+async def catch_up(channels: List[str]):
+    """
+    Запрашивает сообщения, опубликованные после последнего принятого
+    
+    Боты не могут читать историю, но могут запрашивать сообщения по id,
+    поэтому id перебираются пачками от сохраненного наибольшего, пока в
+    пачке есть сообщения (не больше CATCH_UP_LIMIT на канал). Сообщение,
+    пришедшее одновременно через подписку, отсекается в dispatch_prepared.
+    """
+    for channel in channels:
+        try:
+            # Каналы уже разрешены при запуске, поэтому берутся из кэша сущностей
+            chat = await entity_cache.get_entity(channel)
+            source_id = utils.get_peer_id(chat)
+            last_id = outbox.high_water(source_id)
+            if not last_id:
+                continue
+            fetched = 0
+            while fetched < CATCH_UP_LIMIT:
+                ids = list(range(last_id + 1, last_id + 1 + HistoryBackfill.PAGE_SIZE))
+                messages = [m for m in await client.get_messages(chat, ids=ids) if m is not None]
+                if not messages:
+                    break
+                for message in messages:
+                    await handle_new_message(BackfillEvent(message, chat))
+                last_id = messages[-1].id
+                fetched += len(messages)
+            if fetched:
+                logger.info("Канал %s: запрошено пропущенных сообщений: %d", channel, fetched)
+        except Exception as e:
+            logger.error("Ошибка запроса пропущенных сообщений канала %s: %s", channel, e)
+
+def shard_environment(index: int, count: int) -> Dict[str, str]:
+    """Переменные окружения процесса шарда: своя сессия, файл логов и порт метрик"""
+    log_base, log_ext = os.path.splitext(os.getenv('LOG_PATH', 'medical_bot.log'))
+    return {
+        'BOT_SESSION': f"{SESSION_NAME}_shard{index}",
+        'LOG_PATH': f"{log_base}.shard{index}{log_ext}",
+        'METRICS_PORT': str(METRICS_PORT + 1 + index) if METRICS_PORT else '0',
+        'SHARD_INDEX': str(index),
+        'SHARD_COUNT': str(count),
+    }
+
+def run_shard(index: int, channels: List[str], shard_queue):
+    """Точка входа процесса шарда"""
+    if hasattr(signal, 'SIGHUP'):
+        # До запуска ConfigWatcher пересланный SIGHUP не должен завершать шард
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    asyncio.run(shard_main(index, channels, shard_queue))
+
+async def shard_main(index: int, channels: List[str], shard_queue):
+    """
+    Обрабатывает свою часть каналов-источников
+    
+    Шард фильтрует, хеширует и маршрутизирует сообщения своих каналов и
+    передает подготовленные сообщения отправителю в основном процессе.
+    """
+    global prepared_sink
+    
+    async def forward(prepared: PreparedMessage):
+        await put_record(shard_queue, prepared.to_record())
+    prepared_sink = forward
+    watcher = ConfigWatcher(apply_config, interval=CONFIG_WATCH_INTERVAL)
+    
+    try:
+        await client.start(bot_token=BOT_TOKEN)
+        source_ids = await resolve_peers(channels)
+        if channels and not source_ids:
+            logger.error(f"Шард {index}: не удалось разрешить ни одного канала-источника!")
             return
-            
-        # Извлекаем содержимое сообщения
-        message_text, has_photo, media_type = MessageProcessor.extract_message_content(event)
-        
-        logger.info(f"Обрабатывается новое сообщение из {event.chat.title} (тип медиа: {media_type})")
-
-        if has_photo:
-            # Скачиваем фото
-            photo_path = await download_media_with_retry(event)
-            if not photo_path:
-                logger.error("Не удалось скачать фото")
-                return
-                
-            try:
-                # Получаем информацию о файле
-                file_info = MediaHandler.get_media_info(photo_path)
-                logger.info(f"Скачан файл: {file_info.get('size_formatted', 'N/A')} {file_info.get('extension', '')}")
-                
-                # Создаем подпись с ограничением длины
-                caption = MessageProcessor.create_caption(message_text) if message_text else None
-                
-                # Отправляем фото с подписью
-                await send_large_file(photo_path, caption)
-                logger.info("Отправлено фото с текстом" if caption else "Отправлено фото")
-                
-            finally:
-                # Удаляем временный файл
-                MediaHandler.cleanup_temp_files(photo_path)
-        else:
-            # Отправляем только текст
-            await client.send_message(
-                entity=DESTINATION_CHANNEL,
-                message=message_text
-            )
-            logger.info("Отправлен текст")
-            
-        # Добавляем сообщение в обработанные
-        processed_messages.add(message_hash)
+        subscribe(source_ids)
+        watcher.start()
+        start_diagnostics()
         
-        # Ограничиваем размер множества обработанных сообщений
-        if len(processed_messages) > 10000:
-            processed_messages.clear()
-            logger.info("Очищено множество обработанных сообщений")
-            
-    except Exception as e:
-        logger.error(f"Ошибка при обработке сообщения: {str(e)}")
-        # Удаляем временный файл при ошибке
-        if 'photo_path' in locals() and os.path.exists(photo_path):
-            MediaHandler.cleanup_temp_files(photo_path)
+        if METRICS_PORT:
+            await metrics_server.start()
+        logger.info(f"Шард {index}: мониторинг запущен для {len(source_ids)} каналов")
+        await client.run_until_disconnected()
+    finally:
+        watcher.stop()
+        stop_diagnostics()
+        await flush_pending()
+        await metrics_server.stop()
+        await client.disconnect()
+        dedup_store.close()
+        outbox.close()
+        upload_cache.close()
+        entity_cache.close()
+        media_spool.close()
+        image_transcoder.close()
 
-async def main():
-    """Основная функция запуска бота"""
+async def consume_shards(supervisor: ShardSupervisor):
+    """Проверяет на дубликаты и отправляет сообщения, подготовленные шардами"""
+    async for record in supervisor.receive():
+        try:
+            await dispatch_prepared(PreparedMessage.from_record(record, client), check_duplicate=True)
+        except Exception as e:
+            logger.error("Ошибка при обработке сообщения от шарда: %s", e)
+            MESSAGES.inc(record.get('channel', '?'), 'failed', amount=record.get('count', 1))
+
+async def run_backfill():
+    """Догружает историю каналов за период мониторинга через пользовательский аккаунт"""
+    # Боты не могут читать историю каналов, поэтому используется отдельная сессия пользователя
+    reader = TelegramClient(os.getenv('BACKFILL_SESSION', 'medical_monitor_backfill'), API_ID, API_HASH)
+    await reader.start()
+    try:
+        config = bot_config.current()
+        backfill = HistoryBackfill(
+            reader, config.source_channels, config.start_date, config.end_date,
+            process=handle_new_message,
+            checkpoint_path=os.getenv('BACKFILL_CHECKPOINT_PATH', 'backfill_checkpoint.json'),
+            concurrency=int(os.getenv('BACKFILL_CONCURRENCY', '4'))
+        )
+        await backfill.run()
+        # Альбомы и дайджесты из истории отправляются до отключения читающего клиента
+        await flush_pending()
+        await send_queue.join()
+    finally:
+        await reader.disconnect()
+
+async def main(backfill: bool = False, shards: int = 0):
+    """
+    Основная функция запуска бота
+    
+    Args:
+        backfill: Перед мониторингом догрузить историю каналов
+        shards: Число процессов, между которыми делятся каналы-источники (0 или 1 - без шардов)
+    """
+    supervisor = None
+    watcher = None
     try:
         logger.info("Запуск медицинского мониторинг-бота...")
+        # Задержки цикла событий отслеживаются с самого запуска
+        start_diagnostics()
         
         # Запускаем клиент
         await client.start(bot_token=BOT_TOKEN)
         logger.info("Клиент Telegram успешно запущен")
         
+        # Разрешаем каналы один раз и подписываемся на источники по числовым id
+        source_ids = await resolve_peers()
+        if not source_ids:
+            logger.error("Не удалось разрешить ни одного канала-источника!")
+            return
+        
+        # Удаляем ключи дедупликации вне периода мониторинга
+        config = bot_config.current()
+        await evict_dedup_keys()
+        
         # Проверяем права бота
         if not await check_bot_permissions():
             logger.error("Бот не имеет необходимых прав в целевом канале!")
             return
             
+        # Запускаем воркеры отправки и повторяем отправки, прерванные остановкой
+        send_queue.start()
+        await replay_outbox()
+        
+        # Получаем новые сообщения сами или через процессы-шарды
+        if shards > 1:
+            shard_channels = split_channels(config.source_channels, shards)
+            supervisor = ShardSupervisor(
+                run_shard, shard_channels,
+                env=functools.partial(shard_environment, count=len(shard_channels)),
+                restart_delay=float(os.getenv('SHARD_RESTART_DELAY', '1')),
+                max_restart_delay=float(os.getenv('SHARD_MAX_RESTART_DELAY', '60'))
+            )
+            supervisor.start()
+            metrics.registry.gauge('medbot_shards_alive', 'Работающих процессов-шардов', supervisor.alive)
+            background_tasks.append(asyncio.create_task(supervisor.watch()))
+            background_tasks.append(asyncio.create_task(consume_shards(supervisor)))
+        else:
+            subscribe(source_ids)
+        
+        # Каналы и период мониторинга перечитываются без перезапуска
+        watcher = ConfigWatcher(functools.partial(apply_config, supervisor=supervisor),
+                                interval=CONFIG_WATCH_INTERVAL)
+        watcher.start()
+        
+        # Удаляем файлы, оставшиеся после аварийного завершения, и продолжаем очистку в фоне
+        background_tasks.append(asyncio.create_task(
+            media_spool.sweep_periodically(MEDIA_SPOOL_SWEEP_INTERVAL)))
+        # Ключи дедупликации удаляются не только при запуске: бот может работать неделями
+        if DEDUP_EVICT_INTERVAL > 0:
+            background_tasks.append(asyncio.create_task(
+                evict_dedup_keys_periodically(DEDUP_EVICT_INTERVAL)))
+        
+        # Запускаем эндпоинт метрик и периодическую сводку в логе
+        if METRICS_PORT:
+            await metrics_server.start()
+        if METRICS_LOG_INTERVAL > 0:
+            background_tasks.append(asyncio.create_task(
+                metrics.log_summary_periodically(METRICS_LOG_INTERVAL)))
+        
         # Выводим информацию о мониторинге
-        logger.info(f"Мониторинг запущен для {len(SOURCE_CHANNELS)} каналов")
-        logger.info(f"Период мониторинга: {START_DATE} - {END_DATE}")
-        logger.info(f"Целевой канал: {DESTINATION_CHANNEL}")
+        logger.info(f"Мониторинг запущен для {len(source_ids)} каналов"
+                    + (f" в {len(supervisor.shard_channels)} шардах" if supervisor else ""))
+        logger.info(f"Период мониторинга: {config.start_date} - {config.end_date}")
+        logger.info(f"Каналы назначения: {', '.join(router.destinations())}")
+        
+        # Запрашиваем сообщения, опубликованные, пока бот не работал
+        await catch_up(own_channels(config))
+        
+        # Догружаем пропущенные сообщения
+        if backfill:
+            await run_backfill()
         
         # Запускаем бота
         await client.run_until_disconnected()
@@ -209,8 +972,37 @@ async def main():
     except Exception as e:
         logger.error(f"Критическая ошибка: {e}")
     finally:
+        # Останавливаем шарды, затем дожидаемся отправки альбомов и сообщений из очереди
+        if watcher:
+            watcher.stop()
+        if supervisor:
+            supervisor.stop()
+        await flush_pending()
+        await send_queue.stop(drain=True)
+        stop_diagnostics()
+        for task in background_tasks:
+            task.cancel()
+        await metrics_server.stop()
+        logger.info(f"Метрики: {metrics.summary()}")
         await client.disconnect()
+        dedup_store.close()
+        outbox.close()
+        upload_cache.close()
+        entity_cache.close()
+        media_spool.close()
+        image_transcoder.close()
+        logger.info(f"Статистика пересылки медиа: {media_forwarder.stats_summary()}")
+        logger.info(f"Кэш загрузок: {upload_cache.stats_summary()}")
+        if digest_buffer is not None:
+            logger.info("Дайджесты: %d сообщений в %d постах",
+                        digest_buffer.stats['messages'], digest_buffer.stats['posts'])
         logger.info("Бот завершил работу")
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Медицинский мониторинг-бот")
+    parser.add_argument('--backfill', action='store_true',
+                        help="перед мониторингом догрузить историю каналов за период мониторинга")
+    parser.add_argument('--shards', type=int, default=int(os.getenv('SHARDS', '0')),
+                        help="число процессов, между которыми делятся каналы-источники")
+    args = parser.parse_args()
+    asyncio.run(main(backfill=args.backfill, shards=args.shards))
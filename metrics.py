@@ -0,0 +1,244 @@
+"""
+Метрики медицинского мониторинг-бота: счетчики, гистограммы задержек и HTTP-эндпоинт
+"""
+
+import time
+import asyncio
+import logging
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+class Counter:
+    """Монотонный счетчик с метками"""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def total(self) -> float:
+        return sum(self._values.values())
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value:g}")
+        return lines
+
+class Gauge:
+    """Текущее значение, вычисляемое при каждом запросе метрик"""
+
+    def __init__(self, name: str, help_text: str, getter: Callable[[], float]):
+        self.name = name
+        self.help_text = help_text
+        self.getter = getter
+
+    def value(self) -> float:
+        try:
+            return self.getter()
+        except Exception:
+            return float('nan')
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge",
+                f"{self.name} {self.value():g}"]
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин"""
+
+    DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                       0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label_values -> [счетчики по корзинам (+Inf последней), сумма]
+        self._series: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def quantile(self, q: float, *label_values) -> Optional[float]:
+        """Оценка квантиля по верхней границе корзины"""
+        series = self._series.get(label_values)
+        if not series:
+            return None
+        counts = series[0]
+        target = q * sum(counts)
+        cumulative = 0
+        for i, count in enumerate(counts):
+            cumulative += count
+            if cumulative >= target:
+                return self.buckets[i] if i < len(self.buckets) else float('inf')
+        return None
+
+    def count(self, *label_values) -> int:
+        series = self._series.get(label_values)
+        return sum(series[0]) if series else 0
+
+    def series(self):
+        return list(self._series)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                labels = _format_labels(self.labels + ('le',), label_values + (le,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {total:g}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+def _format_labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+class MetricsRegistry:
+    """Набор метрик с выводом в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Histogram:
+        return self.register(Histogram(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, getter: Callable[[], float]) -> Gauge:
+        return self.register(Gauge(name, help_text, getter))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+registry = MetricsRegistry()
+
+MESSAGES = registry.counter(
+    'medbot_messages_total', 'Сообщения по каналам-источникам и результату обработки',
+    ('channel', 'result'))
+STAGE_SECONDS = registry.histogram(
+    'medbot_stage_seconds', 'Длительность этапов обработки', ('stage',))
+BYTES = registry.counter(
+    'medbot_bytes_total', 'Объем скачанных и загруженных медиа', ('direction',))
+RETRIES = registry.counter(
+    'medbot_retries_total', 'Повторные попытки по операциям', ('operation',))
+LOOP_LAG = registry.histogram(
+    'medbot_loop_lag_seconds', 'Задержка планирования цикла событий')
+LOOP_STALLS = registry.counter(
+    'medbot_loop_stalls_total', 'Остановки цикла событий дольше порога')
+SLOW_HANDLERS = registry.counter(
+    'medbot_slow_calls_total', 'Вызовы дольше порога медленного обработчика', ('call',))
+
+@contextmanager
+def time_stage(stage: str):
+    """Замеряет длительность этапа и записывает ее в гистограмму"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage)
+
+def summary() -> str:
+    """Краткая сводка метрик для периодической записи в лог"""
+    results: Dict[str, float] = {}
+    for (_, result), value in MESSAGES._values.items():
+        results[result] = results.get(result, 0) + value
+    parts = [', '.join(f"{k}: {v:g}" for k, v in sorted(results.items())) or 'сообщений нет']
+
+    for (stage,) in sorted(STAGE_SECONDS.series()):
+        p50 = STAGE_SECONDS.quantile(0.5, stage)
+        p99 = STAGE_SECONDS.quantile(0.99, stage)
+        parts.append(f"{stage}: n={STAGE_SECONDS.count(stage)} p50<={p50:g}с p99<={p99:g}с")
+
+    if LOOP_LAG.count():
+        parts.append(f"loop_lag: p99<={LOOP_LAG.quantile(0.99):g}с, остановок: {LOOP_STALLS.total():g}")
+
+    traffic = {direction: value for (direction,), value in BYTES._values.items()}
+    if traffic:
+        parts.append(', '.join(f"{k}: {v / 1024 / 1024:.1f}MB" for k, v in sorted(traffic.items())))
+    for metric in registry._metrics:
+        if isinstance(metric, Gauge):
+            parts.append(f"{metric.name}: {metric.value():g}")
+    return '; '.join(parts)
+
+class MetricsServer:
+    """Минимальный HTTP-сервер, отдающий метрики на /metrics"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 9108,
+                 metrics_registry: MetricsRegistry = registry):
+        self.host = host
+        self.port = port
+        self.registry = metrics_registry
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"Метрики доступны на http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Заголовки запроса не нужны, но их надо дочитать
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b'\r\n', b'\n', b''):
+                pass
+
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] in ('/', '/metrics'):
+                body = self.registry.render().encode()
+                status = '200 OK'
+            else:
+                body = b'Not Found\n'
+                status = '404 Not Found'
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except Exception as e:
+            logger.debug(f"Ошибка запроса метрик: {e}")
+        finally:
+            writer.close()
+
+async def log_summary_periodically(interval: float):
+    """Периодически пишет сводку метрик в лог"""
+    while True:
+        await asyncio.sleep(interval)
+        logger.info(f"Метрики: {summary()}")
@@ -0,0 +1,224 @@
+"""
+Журнал исходящих сообщений (write-ahead outbox) для восстановления после сбоя
+"""
+
+import pickle
+import sqlite3
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+class Outbox:
+    """
+    Журнал принятых к отправке сообщений
+
+    Сообщение записывается в журнал (стадия accepted) до постановки в очередь
+    отправки, после каждой успешной отправки в канал назначения отмечается
+    этот канал (стадия sent), а после завершения всех отправок запись
+    удаляется. Скачанные во временные файлы медиа отмечаются по ключу медиа,
+    поэтому после сбоя файл используется повторно, а не скачивается заново.
+    Незавершенные записи после перезапуска отправляются повторно только в
+    те каналы, куда отправка еще не подтверждена.
+
+    Для каждого канала-источника хранится наибольший id принятого сообщения
+    (high-water mark), чтобы после перезапуска запросить только пропущенные
+    сообщения.
+
+    Изменения накапливаются и записываются одной транзакцией в отдельном
+    потоке (group commit): пока идет запись и fsync одной пачки, копится
+    следующая. accept ожидает записи своей пачки, остальные изменения не
+    ожидаются.
+    """
+
+    STAGE_ACCEPTED = 'accepted'
+    STAGE_SENT = 'sent'
+
+    def __init__(self, db_path: str = 'outbox.db', max_batch: int = 1000):
+        """
+        Args:
+            db_path: Путь к базе журнала
+            max_batch: Максимум изменений в одной транзакции
+        """
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # Транзакция считается записанной только после fsync журнала WAL
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "id INTEGER PRIMARY KEY, created REAL NOT NULL, stage TEXT NOT NULL, "
+            "record BLOB NOT NULL, sent TEXT NOT NULL DEFAULT '')"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS downloads (media_key TEXT PRIMARY KEY, path TEXT NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS high_water ("
+            "channel INTEGER PRIMARY KEY, message_id INTEGER NOT NULL)"
+        )
+        self._db.commit()
+
+        self._next_id = (self._db.execute("SELECT MAX(id) FROM entries").fetchone()[0] or 0) + 1
+        self._downloads: Dict[str, str] = dict(
+            self._db.execute("SELECT media_key, path FROM downloads"))
+        self._high_water: Dict[int, int] = dict(
+            self._db.execute("SELECT channel, message_id FROM high_water"))
+
+        # Изменения, ожидающие записи: группы (SQL, параметры), группа не делится между пачками
+        self._ops: List[List[Tuple[str, tuple]]] = []
+        self._waiters: List[asyncio.Future] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._writing = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='outbox')
+        self.batches = 0
+
+    def _queue(self, *statements: Tuple[str, tuple]):
+        self._ops.append(list(statements))
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        self._wakeup.set()
+
+    def _write(self, ops: List[List[Tuple[str, tuple]]]):
+        with self._db:
+            for statements in ops:
+                for sql, params in statements:
+                    self._db.execute(sql, params)
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._ops or self._waiters:
+                ops, self._ops = self._ops[:self.max_batch], self._ops[self.max_batch:]
+                waiters = []
+                if not self._ops:
+                    # Изменения ожидающих вошли в эту или уже записанные пачки
+                    waiters, self._waiters = self._waiters, []
+                try:
+                    if ops:
+                        self._writing = True
+                        await asyncio.get_running_loop().run_in_executor(self._executor, self._write, ops)
+                        self.batches += 1
+                except Exception as e:
+                    logger.error("Ошибка записи журнала исходящих: %s", e)
+                    for waiter in waiters:
+                        if not waiter.done():
+                            waiter.set_exception(e)
+                    continue
+                finally:
+                    self._writing = False
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(None)
+
+    async def flush(self):
+        """Ожидает записи всех накопленных изменений на диск"""
+        if not self._ops and not self._writing:
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._wakeup.set()
+        await waiter
+
+    async def accept(self, record: dict, channel: Optional[int] = None,
+                     message_id: Optional[int] = None) -> int:
+        """
+        Записывает сообщение в журнал и дожидается fsync
+
+        Запись и сдвиг наибольшего id канала попадают в одну транзакцию, поэтому
+        после сбоя сообщение либо есть в журнале, либо будет запрошено заново.
+
+        Args:
+            record: Запись PreparedMessage.to_record()
+            channel: id канала-источника
+            message_id: Наибольший id сообщения в записи
+
+        Returns:
+            Номер записи журнала
+        """
+        entry_id = self._next_id
+        self._next_id += 1
+        statements = [(
+            "INSERT INTO entries (id, created, stage, record) VALUES (?, ?, ?, ?)",
+            (entry_id, time.time(), self.STAGE_ACCEPTED, pickle.dumps(record, pickle.HIGHEST_PROTOCOL))
+        )]
+        if channel is not None and message_id > self._high_water.get(channel, 0):
+            self._high_water[channel] = message_id
+            statements.append((
+                "INSERT INTO high_water (channel, message_id) VALUES (?, ?) "
+                "ON CONFLICT(channel) DO UPDATE SET message_id = MAX(message_id, excluded.message_id)",
+                (channel, message_id)
+            ))
+        self._queue(*statements)
+        await self.flush()
+        return entry_id
+
+    def mark_sent(self, entry_id: int, destination: str):
+        """Отмечает успешную отправку в канал назначения"""
+        self._queue((
+            "UPDATE entries SET stage = ?, sent = sent || ? WHERE id = ?",
+            (self.STAGE_SENT, destination + '\n', entry_id)
+        ))
+
+    def complete(self, entry_id: int):
+        """Удаляет завершенную запись"""
+        self._queue(("DELETE FROM entries WHERE id = ?", (entry_id,)))
+
+    def mark_downloaded(self, media_key: Optional[str], path: str):
+        """Запоминает временный файл со скачанным медиа"""
+        if not media_key:
+            return
+        self._downloads[media_key] = path
+        self._queue(("INSERT OR REPLACE INTO downloads (media_key, path) VALUES (?, ?)",
+                     (media_key, path)))
+
+    def downloaded_path(self, media_key: Optional[str]) -> Optional[str]:
+        """Временный файл, скачанный до сбоя (наличие файла не проверяется)"""
+        return self._downloads.get(media_key) if media_key else None
+
+    def release_download(self, media_key: Optional[str]):
+        """Забывает временный файл медиа (файл удален)"""
+        if media_key and self._downloads.pop(media_key, None) is not None:
+            self._queue(("DELETE FROM downloads WHERE media_key = ?", (media_key,)))
+
+    def high_water(self, channel: int) -> int:
+        """Наибольший принятый id сообщения канала (0, если неизвестен)"""
+        return self._high_water.get(channel, 0)
+
+    def pending(self) -> List[Tuple[int, dict, Set[str]]]:
+        """
+        Незавершенные записи в порядке приема
+
+        Returns:
+            Список (номер записи, запись сообщения, каналы с подтвержденной отправкой)
+        """
+        entries = []
+        for entry_id, record, sent in self._db.execute(
+                "SELECT id, record, sent FROM entries ORDER BY id"):
+            try:
+                entries.append((entry_id, pickle.loads(record), set(filter(None, sent.split('\n')))))
+            except Exception as e:
+                logger.error("Запись журнала исходящих %d повреждена и пропущена: %s", entry_id, e)
+                self.complete(entry_id)
+        return entries
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def close(self):
+        """Записывает оставшиеся изменения и закрывает базу"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._executor.shutdown(wait=True)
+        if self._ops:
+            self._write(self._ops)
+            self._ops = []
+        self._db.close()
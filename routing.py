@@ -0,0 +1,261 @@
+"""
+Маршрутизация сообщений по каналам-источникам и ключевым словам
+"""
+
+import re
+import json
+import logging
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+class KeywordAutomaton:
+    """
+    Автомат Ахо-Корасик для поиска всех ключевых слов за один проход по тексту
+
+    Время поиска зависит от длины текста и числа совпадений, но не от числа
+    ключевых слов. Каждому слову соответствует множество меток (номеров правил).
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Set[int]] = [set()]
+
+    def add(self, word: str, label: int):
+        """Добавляет слово (до вызова build)"""
+        state = 0
+        for char in word:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(set())
+            state = next_state
+        self._output[state].add(label)
+
+    def build(self):
+        """Строит ссылки неудач (обход в ширину)"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                candidate = self._goto[fail].get(char, 0)
+                self._fail[next_state] = candidate if candidate != next_state else 0
+                self._output[next_state] |= self._output[self._fail[next_state]]
+
+    def find(self, text: str) -> Set[int]:
+        """Возвращает метки всех слов, встречающихся в тексте"""
+        labels: Set[int] = set()
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                labels |= output[state]
+        return labels
+
+class RoutingRule:
+    """Правило маршрутизации"""
+
+    # Глобальные флаги вида (?i): в общем выражении они допустимы только в самом начале
+    _GLOBAL_FLAGS_RE = re.compile(r'\(\?[aiLmsux]+\)')
+
+    __slots__ = ('name', 'sources', 'keywords', 'patterns', 'exclude', 'destinations', 'source_ids')
+
+    def __init__(self, name: str, destinations: List[str], sources: Iterable[str] = (),
+                 keywords: Iterable[str] = (), patterns: Iterable[str] = (),
+                 exclude: Iterable[str] = ()):
+        """
+        Args:
+            name: Название правила (для логов)
+            destinations: Каналы, в которые направляются подходящие сообщения
+            sources: Каналы-источники (пусто - любые)
+            keywords: Ключевые слова, хотя бы одно должно встретиться (пусто - любой текст)
+            patterns: Регулярные выражения, альтернатива ключевым словам
+            exclude: Ключевые слова, при наличии которых правило не срабатывает
+        """
+        self.name = name
+        self.destinations = list(destinations)
+        self.sources = list(sources)
+        self.keywords = [Router.normalize(k) for k in keywords if k]
+        self.patterns = [self.check_pattern(name, pattern) for pattern in patterns]
+        self.exclude = [Router.normalize(k) for k in exclude if k]
+        # Числовые id источников (заполняются после разрешения каналов)
+        self.source_ids: Optional[Set[int]] = None
+
+    @classmethod
+    def check_pattern(cls, name: str, pattern: str) -> str:
+        """
+        Проверяет регулярное выражение правила отдельно от остальных
+
+        Выражения всех правил объединяются в одно, поэтому в них нельзя
+        использовать ссылки на группы (номера групп сдвигаются), именованные
+        группы (имена могут совпасть) и глобальные флаги.
+
+        Raises:
+            ValueError: Выражение некорректно или использует недопустимые конструкции
+        """
+        try:
+            compiled = re.compile(pattern)
+        except re.error as e:
+            raise ValueError(f"Правило {name}: ошибка в выражении {pattern!r}: {e}") from e
+        if compiled.groupindex:
+            raise ValueError(f"Правило {name}: именованные группы в выражении {pattern!r} не поддерживаются")
+        i = 0
+        while i < len(pattern):
+            if pattern[i] == '\\':
+                if pattern[i + 1:i + 2] in tuple('123456789'):
+                    raise ValueError(f"Правило {name}: ссылки на группы в выражении {pattern!r} не поддерживаются")
+                i += 2
+                continue
+            if pattern.startswith('(?(', i) or pattern.startswith('(?P=', i):
+                raise ValueError(f"Правило {name}: ссылки на группы в выражении {pattern!r} не поддерживаются")
+            if cls._GLOBAL_FLAGS_RE.match(pattern, i):
+                raise ValueError(f"Правило {name}: глобальные флаги в выражении {pattern!r} не поддерживаются "
+                                 f"(используйте (?флаги:...); регистр и так не учитывается)")
+            i += 1
+        return pattern
+
+    @property
+    def has_terms(self) -> bool:
+        return bool(self.keywords or self.patterns)
+
+class Router:
+    """
+    Набор правил, скомпилированный для сопоставления за один проход
+
+    Ключевые слова всех правил собираются в один автомат Ахо-Корасик, а
+    регулярные выражения - в одно выражение с именованной группой на каждое.
+    Правила, чьи выражения не нашлись в общем проходе (его совпадения не
+    перекрываются), проверяются еще раз собственным выражением.
+    Сообщение направляется в объединение каналов всех сработавших правил;
+    если ни одно правило не сработало, сообщение отфильтровывается.
+    """
+
+    def __init__(self, rules: List[RoutingRule]):
+        self.rules = rules
+        self._include = KeywordAutomaton()
+        self._exclude = KeywordAutomaton()
+        patterns = []
+        self._rule_patterns: Dict[int, re.Pattern] = {}
+        for index, rule in enumerate(rules):
+            for keyword in rule.keywords:
+                self._include.add(keyword, index)
+            for keyword in rule.exclude:
+                self._exclude.add(keyword, index)
+            for number, pattern in enumerate(rule.patterns):
+                patterns.append(f"(?P<r{index}_{number}>{pattern})")
+            if rule.patterns:
+                self._rule_patterns[index] = re.compile(
+                    '|'.join(f"(?:{pattern})" for pattern in rule.patterns), re.IGNORECASE)
+        self._include.build()
+        self._exclude.build()
+        # Совпадения общего выражения не перекрываются: фрагмент, подходящий выражениям
+        # нескольких правил, засчитывается первому из них, остальные проверяются в route
+        self._pattern = re.compile('|'.join(patterns), re.IGNORECASE) if patterns else None
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Приводит текст к виду для поиска ключевых слов"""
+        return text.casefold().replace('ё', 'е')
+
+    @classmethod
+    def single(cls, destination: str) -> 'Router':
+        """Маршрутизатор без фильтрации: все сообщения в один канал"""
+        return cls([RoutingRule('default', [destination])])
+
+    @classmethod
+    def from_file(cls, path: str) -> 'Router':
+        """
+        Загружает правила из JSON
+
+        Формат: {"rules": [{"name": ..., "destinations": [...], "sources": [...],
+        "keywords": [...], "patterns": [...], "exclude": [...]}]}
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        rules = []
+        for number, item in enumerate(config.get('rules', [])):
+            if not item.get('destinations'):
+                raise ValueError(f"Правило {item.get('name', number)}: не указаны destinations")
+            rules.append(RoutingRule(
+                name=item.get('name', f"rule_{number}"),
+                destinations=item['destinations'],
+                sources=item.get('sources', ()),
+                keywords=item.get('keywords', ()),
+                patterns=item.get('patterns', ()),
+                exclude=item.get('exclude', ())
+            ))
+        logger.info("Загружено правил маршрутизации: %d", len(rules))
+        return cls(rules)
+
+    def destinations(self) -> List[str]:
+        """Все каналы назначения (без повторов, в порядке появления)"""
+        return list(dict.fromkeys(d for rule in self.rules for d in rule.destinations))
+
+    def sources(self) -> List[str]:
+        """Все каналы-источники, упомянутые в правилах"""
+        return list(dict.fromkeys(s for rule in self.rules for s in rule.sources))
+
+    def bind_sources(self, peer_ids: Dict[str, int]):
+        """
+        Задает числовые id источников правил
+
+        Args:
+            peer_ids: {ссылка на канал: id канала}; неразрешенные ссылки пропускаются
+        """
+        for rule in self.rules:
+            if rule.sources:
+                rule.source_ids = {peer_ids[s] for s in rule.sources if s in peer_ids}
+
+    def _source_matches(self, rule: RoutingRule, source_id: int, source_name: Optional[str]) -> bool:
+        if not rule.sources:
+            return True
+        if rule.source_ids is not None:
+            return source_id in rule.source_ids
+        # До разрешения каналов сравниваем по имени канала
+        return source_name is not None and any(
+            s.rstrip('/').rsplit('/', 1)[-1].lstrip('@').lower() == source_name.lower()
+            for s in rule.sources
+        )
+
+    def route(self, source_id: int, text: Optional[str], source_name: Optional[str] = None) -> List[str]:
+        """
+        Определяет каналы назначения сообщения
+
+        Args:
+            source_id: id канала-источника
+            text: Текст или подпись сообщения
+            source_name: username канала-источника (если каналы еще не разрешены)
+
+        Returns:
+            Список каналов назначения (пустой - сообщение отфильтровано)
+        """
+        normalized = self.normalize(text) if text else ''
+        included = self._include.find(normalized) if normalized else set()
+        excluded = self._exclude.find(normalized) if normalized else set()
+        if self._pattern is not None and text:
+            for match in self._pattern.finditer(text):
+                included.add(int(match.lastgroup[1:].split('_', 1)[0]))
+            for index, pattern in self._rule_patterns.items():
+                if index not in included and index not in excluded and pattern.search(text):
+                    included.add(index)
+
+        destinations: Dict[str, None] = {}
+        for index, rule in enumerate(self.rules):
+            if index in excluded or not self._source_matches(rule, source_id, source_name):
+                continue
+            if rule.has_terms and index not in included:
+                continue
+            destinations.update(dict.fromkeys(rule.destinations))
+        return list(destinations)
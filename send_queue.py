@@ -0,0 +1,202 @@
+"""
+Асинхронная очередь исходящих сообщений с ограничением скорости
+"""
+
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+from telethon.errors import FloodWaitError
+from metrics import RETRIES, time_stage
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Ограничитель скорости по алгоритму token bucket"""
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        Args:
+            rate: Скорость пополнения (токенов в секунду)
+            capacity: Максимальный запас токенов (размер всплеска)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Ожидает, пока не освободится токен"""
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+class SendJob:
+    """Задание на отправку в целевой канал"""
+
+    __slots__ = ('chat', 'send', 'on_success', 'on_failure', 'on_done', 'description', 'large')
+
+    def __init__(self, chat, send: Callable[[], Awaitable],
+                 on_success: Optional[Callable[[], None]] = None,
+                 on_failure: Optional[Callable[[], None]] = None,
+                 on_done: Optional[Callable[[], None]] = None,
+                 description: str = 'сообщение', large: bool = False):
+        self.chat = chat
+        self.send = send
+        self.on_success = on_success
+        self.on_failure = on_failure
+        self.on_done = on_done
+        self.description = description
+        # Отправка может потребовать перекачки крупного файла
+        self.large = large
+
+class SendQueue:
+    """
+    Очередь отправки с пулом воркеров
+
+    Обработчик входящих сообщений только ставит задание в очередь, а
+    отправкой занимаются воркеры. Скорость ограничивается глобально и для
+    каждого чата; FloodWait приостанавливает всю очередь на указанное
+    Telegram время, после чего задание повторяется, а не теряется.
+
+    Задания с крупными файлами (large) идут в отдельную очередь со своими
+    воркерами: их число ограничивает одновременные крупные передачи, и они
+    не занимают воркеры, отправляющие остальные сообщения.
+    """
+
+    # Лимиты Telegram для ботов: ~30 сообщений/с всего и ~20 сообщений/мин в один чат
+    DEFAULT_GLOBAL_RATE = 30.0
+    DEFAULT_PER_CHAT_RATE = 20.0 / 60.0
+
+    def __init__(self, maxsize: int = 1000, workers: int = 3,
+                 global_rate: float = DEFAULT_GLOBAL_RATE,
+                 per_chat_rate: float = DEFAULT_PER_CHAT_RATE,
+                 max_retries: int = 3, delay_base: float = 1.0, large_workers: int = 1):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.large_queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.workers_count = workers
+        self.large_workers_count = large_workers
+        self.per_chat_rate = per_chat_rate
+        self.max_retries = max_retries
+        self.delay_base = delay_base
+        self._global_bucket = TokenBucket(global_rate, max(1.0, global_rate))
+        self._chat_buckets: Dict[object, TokenBucket] = {}
+        self._paused_until = 0.0
+        self._workers = []
+
+    def _chat_bucket(self, chat) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat)
+        if bucket is None:
+            # Небольшой запас позволяет отправить короткую серию без задержки
+            bucket = TokenBucket(self.per_chat_rate, 3)
+            self._chat_buckets[chat] = bucket
+        return bucket
+
+    def start(self):
+        """Запускает воркеры отправки"""
+        for i in range(self.workers_count):
+            self._workers.append(asyncio.create_task(self._worker(i, self.queue)))
+        for i in range(self.large_workers_count):
+            self._workers.append(asyncio.create_task(
+                self._worker(self.workers_count + i, self.large_queue)))
+        logger.info(f"Запущено воркеров отправки: {self.workers_count} "
+                    f"(+{self.large_workers_count} для крупных файлов)")
+
+    async def stop(self, drain: bool = True):
+        """
+        Останавливает воркеры
+
+        Args:
+            drain: Дождаться отправки всех заданий из очереди
+        """
+        if drain and self._workers:
+            await self.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+    async def submit(self, job: SendJob):
+        """Ставит задание в очередь (ожидает, если очередь заполнена)"""
+        await (self.large_queue if job.large else self.queue).put(job)
+
+    async def join(self):
+        """Ожидает выполнения всех поставленных заданий"""
+        await self.queue.join()
+        await self.large_queue.join()
+
+    def qsize(self) -> int:
+        return self.queue.qsize() + self.large_queue.qsize()
+
+    async def _wait_flood(self):
+        # FloodWait действует на весь аккаунт, поэтому ждут все воркеры
+        while True:
+            delay = self._paused_until - time.monotonic()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    async def _worker(self, index: int, queue: asyncio.Queue):
+        while True:
+            job = await queue.get()
+            cancelled = False
+            try:
+                await self._process(job)
+            except asyncio.CancelledError:
+                # Отправка не завершена: on_done не вызывается, и сообщение остается
+                # в журнале исходящих для повтора после перезапуска
+                cancelled = True
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка воркера отправки {index}: {e}")
+            finally:
+                if job.on_done and not cancelled:
+                    try:
+                        job.on_done()
+                    except Exception as e:
+                        logger.error(f"Ошибка при завершении задания: {e}")
+                queue.task_done()
+
+    async def _process(self, job: SendJob):
+        attempt = 0
+        while True:
+            await self._wait_flood()
+            await self._global_bucket.acquire()
+            await self._chat_bucket(job.chat).acquire()
+            try:
+                with time_stage('send'):
+                    await job.send()
+            except FloodWaitError as e:
+                RETRIES.inc('flood_wait')
+                self._paused_until = max(self._paused_until, time.monotonic() + e.seconds)
+                logger.warning(f"FloodWait {e.seconds} с: очередь отправки приостановлена "
+                               f"(в очереди: {self.queue.qsize()})")
+                continue
+            except Exception as e:
+                attempt += 1
+                if attempt >= self.max_retries:
+                    logger.error(f"Не удалось отправить {job.description} после "
+                                 f"{attempt} попыток: {e}")
+                    if job.on_failure:
+                        job.on_failure()
+                    return
+                RETRIES.inc('send')
+                delay = self.delay_base * (2 ** (attempt - 1))
+                logger.warning(f"Попытка {attempt} отправки не удалась: {e}, "
+                               f"повтор через {delay} с")
+                await asyncio.sleep(delay)
+                continue
+
+            logger.info("Отправлено: %s", job.description)
+            if job.on_success:
+                job.on_success()
+            return
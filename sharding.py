@@ -0,0 +1,182 @@
+"""
+Обработка каналов-источников в нескольких процессах
+"""
+
+import os
+import time
+import queue
+import signal
+import asyncio
+import logging
+import multiprocessing
+from typing import AsyncIterator, Callable, Dict, List, Optional
+from telethon.extensions import BinaryReader
+
+logger = logging.getLogger(__name__)
+
+def split_channels(channels: List[str], shards: int) -> List[List[str]]:
+    """Делит каналы между шардами по кругу (порядок каналов внутри шарда сохраняется)"""
+    shards = max(1, min(shards, len(channels)))
+    return [channels[index::shards] for index in range(shards)]
+
+def serialize_message(message) -> bytes:
+    """Сериализует сообщение Telethon (TL-объект) для передачи между процессами"""
+    return bytes(message)
+
+def restore_message(data: bytes, client):
+    """Восстанавливает сообщение и привязывает его к клиенту текущего процесса"""
+    message = BinaryReader(data).tgread_object()
+    message._finish_init(client, {}, None)
+    return message
+
+class ShardEvent:
+    """Сообщение, полученное от шарда, с тем же интерфейсом, что и событие NewMessage"""
+
+    def __init__(self, message, chat=None):
+        self.message = message
+        self.chat = chat
+        self.chat_id = message.chat_id
+        self.client = message.client
+
+class ShardSupervisor:
+    """
+    Запускает обработчики шардов в отдельных процессах
+
+    Каждый шард получает свою часть каналов-источников и отправляет
+    подготовленные сообщения в общую очередь, которую читает единственный
+    отправитель в основном процессе. Упавший шард перезапускается с
+    экспоненциально растущей задержкой; задержка сбрасывается, если шард
+    проработал дольше STABLE_UPTIME секунд.
+    """
+
+    STABLE_UPTIME = 60.0
+
+    def __init__(self, target: Callable, shard_channels: List[List[str]],
+                 env: Optional[Callable[[int], Dict[str, str]]] = None,
+                 queue_size: int = 10000, restart_delay: float = 1.0,
+                 max_restart_delay: float = 60.0):
+        """
+        Args:
+            target: Функция шарда target(index, channels, queue), импортируемая по имени
+            shard_channels: Каналы каждого шарда
+            env: Переменные окружения процесса шарда (сессия, лог, порт метрик)
+            queue_size: Емкость очереди от шардов к отправителю
+            restart_delay: Начальная задержка перезапуска упавшего шарда, с
+            max_restart_delay: Максимальная задержка перезапуска, с
+        """
+        self.target = target
+        self.shard_channels = shard_channels
+        self.env = env
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        # spawn: шарды не наследуют состояние клиента и цикла событий родителя
+        self._context = multiprocessing.get_context('spawn')
+        self.queue = self._context.Queue(queue_size)
+        self._processes: Dict[int, multiprocessing.Process] = {}
+        self._started: Dict[int, float] = {}
+        self._delays: Dict[int, float] = {}
+        self._restart_at: Dict[int, float] = {}
+        self._stopping = False
+        self.restarts = 0
+
+    def _spawn(self, index: int):
+        overrides = self.env(index) if self.env else {}
+        saved = {key: os.environ.get(key) for key in overrides}
+        # Процесс spawn получает копию окружения в момент запуска
+        os.environ.update(overrides)
+        try:
+            process = self._context.Process(
+                target=self.target, args=(index, self.shard_channels[index], self.queue),
+                name=f"shard-{index}", daemon=True
+            )
+            process.start()
+        finally:
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+        self._processes[index] = process
+        self._started[index] = time.monotonic()
+        logger.info("Запущен шард %d (pid %d, каналов: %d)",
+                    index, process.pid, len(self.shard_channels[index]))
+
+    def start(self):
+        """Запускает процессы всех шардов"""
+        for index in range(len(self.shard_channels)):
+            self._spawn(index)
+
+    def _check(self):
+        now = time.monotonic()
+        for index, process in self._processes.items():
+            if process.is_alive():
+                continue
+            restart_at = self._restart_at.get(index)
+            if restart_at is None:
+                uptime = now - self._started[index]
+                delay = self._delays.get(index, self.restart_delay)
+                if uptime >= self.STABLE_UPTIME:
+                    delay = self.restart_delay
+                self._delays[index] = min(delay * 2, self.max_restart_delay)
+                self._restart_at[index] = now + delay
+                logger.error("Шард %d завершился с кодом %s после %.0f с работы, перезапуск через %.0f с",
+                             index, process.exitcode, uptime, delay)
+            elif now >= restart_at:
+                del self._restart_at[index]
+                self.restarts += 1
+                self._spawn(index)
+
+    async def watch(self, interval: float = 1.0):
+        """Следит за шардами и перезапускает упавшие"""
+        while not self._stopping:
+            self._check()
+            await asyncio.sleep(interval)
+
+    def _get(self, timeout: float):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    async def receive(self, poll_interval: float = 0.5) -> AsyncIterator[dict]:
+        """Выдает записи, поступающие от шардов"""
+        loop = asyncio.get_running_loop()
+        while not self._stopping:
+            record = await loop.run_in_executor(None, self._get, poll_interval)
+            if record is not None:
+                yield record
+
+    def alive(self) -> int:
+        """Количество работающих шардов"""
+        return sum(process.is_alive() for process in self._processes.values())
+
+    def reload_config(self):
+        """Просит работающие шарды перечитать конфигурацию (SIGHUP)"""
+        if not hasattr(signal, 'SIGHUP'):
+            return
+        for process in self._processes.values():
+            if process.is_alive():
+                try:
+                    os.kill(process.pid, signal.SIGHUP)
+                except ProcessLookupError:
+                    pass
+
+    def stop(self, timeout: float = 10.0):
+        """Останавливает все шарды"""
+        self._stopping = True
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in self._processes.values():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.kill()
+                process.join()
+
+async def put_record(shard_queue, record: dict):
+    """Кладет запись в очередь к отправителю, не блокируя цикл событий при переполнении"""
+    try:
+        shard_queue.put_nowait(record)
+    except queue.Full:
+        await asyncio.get_running_loop().run_in_executor(None, shard_queue.put, record)
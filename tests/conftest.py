@@ -0,0 +1,22 @@
+"""
+Общие настройки тестов
+
+Хранилища бота создаются при импорте medical_monitor_bot, поэтому пути к ним
+переводятся во временный каталог до импорта модуля тестами.
+"""
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+_workdir = tempfile.TemporaryDirectory(prefix='medbot-tests-')
+os.environ['DEDUP_DB_PATH'] = os.path.join(_workdir.name, 'processed_messages.db')
+os.environ['MEDIA_CACHE_PATH'] = os.path.join(_workdir.name, 'media_cache.db')
+os.environ['OUTBOX_PATH'] = os.path.join(_workdir.name, 'outbox.db')
+os.environ['MEDIA_SPOOL_DIR'] = os.path.join(_workdir.name, 'spool')
+os.environ['METRICS_PORT'] = '0'
+os.environ['METRICS_LOG_INTERVAL'] = '0'
@@ -0,0 +1,34 @@
+"""Удаление устаревших ключей дедупликации в фоне"""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from dedup_store import DedupStore
+
+NOW = datetime(2025, 9, 1, tzinfo=timezone.utc)
+
+def test_evict_keeps_recent_and_concurrently_added_keys(tmp_path):
+    store = DedupStore(str(tmp_path / 'dedup.db'), bloom_capacity=1000)
+    old = [DedupStore.digest(f"old_{i}") for i in range(25)]
+    recent = [DedupStore.digest(f"recent_{i}") for i in range(5)]
+    late = DedupStore.digest("late")
+    store.EVICT_BATCH = 10
+    for digest in old:
+        store.add(digest, NOW - timedelta(days=30))
+    for digest in recent:
+        store.add(digest, NOW)
+
+    async def evict():
+        task = asyncio.create_task(store.evict_outside_window(NOW - timedelta(days=1), NOW))
+        await asyncio.sleep(0)
+        # Ключ добавлен, пока фильтр Блума перестраивается в потоке хранилища
+        store.add(late, NOW)
+        return await task
+
+    try:
+        assert asyncio.run(evict()) == len(old)
+        assert len(store) == len(recent) + 1
+        assert all(digest in store for digest in recent + [late])
+        assert not any(digest in store for digest in old)
+    finally:
+        store.close()
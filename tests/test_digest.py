@@ -0,0 +1,55 @@
+"""Дайджест не теряет сообщения, пока очередь отправки заполнена"""
+
+import asyncio
+
+from digest import DigestBuffer
+from send_queue import SendJob
+
+async def run_digest(texts, max_items=20):
+    """Добавляет сообщения параллельно при занятой очереди; возвращает отправленные тексты"""
+    sent = []
+    queue = asyncio.Queue(maxsize=1)
+
+    async def send_text(destination, text):
+        sent.append(text)
+
+    digest = DigestBuffer(send_text, queue.put, window=3600, max_items=max_items)
+    # Очередь занята: первая же постановка задания ждет, пока ее не разгрузят
+    await queue.put(None)
+    adds = [asyncio.create_task(digest.add('@dest', 'source', text,
+                                           SendJob(chat='@dest', send=None)))
+            for text in texts]
+    await asyncio.sleep(0)
+
+    async def consume():
+        while True:
+            job = await queue.get()
+            if job is not None:
+                await job.send()
+            queue.task_done()
+
+    consumer = asyncio.create_task(consume())
+    await asyncio.gather(*adds)
+    await digest.flush_all()
+    await queue.join()
+    consumer.cancel()
+    return sent
+
+def split(sent):
+    return [part.split('\n', 1)[-1] for text in sent
+            for part in text.split(DigestBuffer.SEPARATOR)]
+
+def test_overflow_keeps_messages_added_during_flush():
+    # Два сообщения не помещаются в один пост: второе вызывает отправку первого
+    texts = [letter * 2500 for letter in 'ABC']
+    sent = asyncio.run(run_digest(texts))
+    assert sent == texts
+
+def test_max_items_keeps_messages_added_during_flush():
+    sent = asyncio.run(run_digest(['A', 'B', 'C', 'D', 'E'], max_items=2))
+    assert split(sent) == ['A', 'B', 'C', 'D', 'E']
+
+def test_oversize_keeps_messages_added_during_flush():
+    texts = ['A', 'B' * 5000, 'C']
+    sent = asyncio.run(run_digest(texts))
+    assert split(sent) == texts
@@ -0,0 +1,58 @@
+"""Отмена одного из одновременных запросов сущности не затрагивает остальные"""
+
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from telethon.tl.types import Channel, ChatPhotoEmpty
+
+from entity_cache import EntityCache
+
+CHANNEL = Channel(id=1234567890, title='Канал', photo=ChatPhotoEmpty(),
+                  date=datetime(2025, 1, 1, tzinfo=timezone.utc), access_hash=42)
+
+class SlowClient:
+    """Клиент, отвечающий на get_entity только после release"""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.calls = 0
+
+    async def get_entity(self, reference):
+        self.calls += 1
+        await self.release.wait()
+        return CHANNEL
+
+def test_cancelled_waiter_does_not_break_owner(tmp_path):
+    async def run():
+        client = SlowClient()
+        cache = EntityCache(client, str(tmp_path / 'entities.db'))
+        owner = asyncio.create_task(cache.get_entity('@channel'))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get_entity('https://t.me/channel'))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        client.release.set()
+        assert await owner == CHANNEL
+        assert waiter.cancelled()
+        assert client.calls == 1
+
+    asyncio.run(run())
+
+def test_cancelled_owner_releases_waiters(tmp_path):
+    async def run():
+        client = SlowClient()
+        cache = EntityCache(client, str(tmp_path / 'entities.db'))
+        owner = asyncio.create_task(cache.get_entity('@channel'))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get_entity('@channel'))
+        await asyncio.sleep(0)
+        owner.cancel()
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(waiter, timeout=1)
+        # Следующий запрос снова обращается к API
+        client.release.set()
+        assert await cache.get_entity('@channel') == CHANNEL
+
+    asyncio.run(run())
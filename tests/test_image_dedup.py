@@ -0,0 +1,19 @@
+"""Одинаковое фото под другим текстом не считается дубликатом"""
+
+import medical_monitor_bot as bot
+
+NEWS = "Минздрав утвердил новые клинические рекомендации по лечению гриппа"
+OTHER = "В регионе открылся новый онкологический центр для детей и взрослых"
+
+def test_same_photo_with_other_caption_is_sent():
+    assert not bot.is_duplicate_image('@a/1', [0x1234_5678_9abc_def0], NEWS)
+    assert not bot.is_duplicate_image('@b/1', [0x1234_5678_9abc_def0], OTHER)
+
+def test_same_photo_with_same_caption_is_duplicate():
+    assert not bot.is_duplicate_image('@a/2', [0x0fed_cba9_8765_4321], NEWS)
+    assert bot.is_duplicate_image('@b/2', [0x0fed_cba9_8765_4321], NEWS + '!')
+
+def test_same_photo_without_caption_is_duplicate():
+    assert not bot.is_duplicate_image('@a/3', [0x5555_aaaa_5555_aaaa], 'Коротко')
+    assert bot.is_duplicate_image('@b/3', [0x5555_aaaa_5555_aaaa], None)
+    assert not bot.is_duplicate_image('@c/3', [0x5555_aaaa_5555_aaaa], 'Иначе')
@@ -0,0 +1,46 @@
+"""Ключ дедупликации не зависит от аккаунта, через который получено сообщение"""
+
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from telethon.tl.types import (
+    Document, Message, MessageMediaDocument, MessageMediaPhoto, PeerChannel, Photo
+)
+
+import medical_monitor_bot as bot
+
+CHAT_ID = -1001234567890
+DATE = datetime(2025, 9, 1, 12, 0, tzinfo=timezone.utc)
+
+def make_event(media, text='Новость'):
+    message = Message(id=42, peer_id=PeerChannel(1234567890), date=DATE,
+                      message=text, media=media)
+    return SimpleNamespace(chat_id=CHAT_ID, message=message)
+
+def photo(access_hash: int, file_reference: bytes, photo_id: int = 555):
+    return MessageMediaPhoto(photo=Photo(
+        id=photo_id, access_hash=access_hash, file_reference=file_reference,
+        date=DATE, sizes=[], dc_id=2
+    ))
+
+def document(access_hash: int, file_reference: bytes, document_id: int = 777):
+    return MessageMediaDocument(document=Document(
+        id=document_id, access_hash=access_hash, file_reference=file_reference,
+        date=DATE, mime_type='video/mp4', size=1024, dc_id=2, attributes=[]
+    ))
+
+def test_photo_key_same_for_two_clients():
+    bot_view = make_event(photo(111, b'bot-reference'))
+    user_view = make_event(photo(222, b'user-reference'))
+    assert bot.generate_message_hash(bot_view) == bot.generate_message_hash(user_view)
+
+def test_document_key_same_for_two_clients():
+    bot_view = make_event(document(111, b'bot-reference'))
+    user_view = make_event(document(222, b'user-reference'))
+    assert bot.generate_message_hash(bot_view) == bot.generate_message_hash(user_view)
+
+def test_key_depends_on_content():
+    base = bot.generate_message_hash(make_event(photo(111, b'ref')))
+    assert bot.generate_message_hash(make_event(photo(111, b'ref', photo_id=556))) != base
+    assert bot.generate_message_hash(make_event(photo(111, b'ref'), text='Другая')) != base
+    assert bot.generate_message_hash(make_event(None)) != base
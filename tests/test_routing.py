@@ -0,0 +1,24 @@
+"""Выражения разных правил, подходящие к одному фрагменту, засчитываются всем правилам"""
+
+from routing import Router, RoutingRule
+
+def test_overlapping_patterns_match_every_rule():
+    router = Router([
+        RoutingRule('a', ['@A'], patterns=[r'грипп\w*']),
+        RoutingRule('b', ['@B'], patterns=['гриппа']),
+    ])
+    assert router.route(1, 'Начался сезон гриппа') == ['@A', '@B']
+
+def test_pattern_rule_without_match_is_filtered():
+    router = Router([
+        RoutingRule('a', ['@A'], patterns=[r'грипп\w*']),
+        RoutingRule('b', ['@B'], patterns=['ковид']),
+    ])
+    assert router.route(1, 'Начался сезон гриппа') == ['@A']
+
+def test_excluded_rule_not_rechecked():
+    router = Router([
+        RoutingRule('a', ['@A'], patterns=[r'грипп\w*']),
+        RoutingRule('b', ['@B'], patterns=['гриппа'], exclude=['сезон']),
+    ])
+    assert router.route(1, 'Начался сезон гриппа') == ['@A']
@@ -0,0 +1,75 @@
+"""
+Поиск почти одинаковых текстов из разных каналов (SimHash + LSH)
+"""
+
+import re
+import hashlib
+import logging
+from typing import List, Optional
+from hamming_index import HammingIndex
+
+logger = logging.getLogger(__name__)
+
+class SimHashIndex(HammingIndex):
+    """
+    Индекс SimHash-подписей текстов в скользящем временном окне
+
+    64-битная подпись делится на max_distance + 1 полос, так что у похожих
+    текстов хотя бы одна полоса совпадает целиком (см. HammingIndex).
+    """
+
+    SHINGLE_SIZE = 3
+    MIN_TOKENS = 5
+
+    _URL_RE = re.compile(r'https?://\S+|t\.me/\S+|@\w+')
+    _TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+    def __init__(self, max_distance: int = 3, window_seconds: float = 3 * 24 * 60 * 60):
+        """
+        Args:
+            max_distance: Порог сходства - максимальное расстояние Хэмминга между подписями
+            window_seconds: Сколько секунд хранить подписи
+        """
+        super().__init__(max_distance, window_seconds)
+
+    @classmethod
+    def normalize(cls, text: str) -> List[str]:
+        """Приводит текст к списку слов: нижний регистр, без ссылок и упоминаний"""
+        text = cls._URL_RE.sub(' ', text.lower()).replace('ё', 'е')
+        return cls._TOKEN_RE.findall(text)
+
+    @classmethod
+    def signature(cls, text: str) -> Optional[int]:
+        """Вычисляет 64-битную SimHash-подпись текста (None для слишком коротких текстов)"""
+        tokens = cls.normalize(text)
+        if len(tokens) < cls.MIN_TOKENS:
+            return None
+
+        weights = [0] * cls.HASH_BITS
+        for i in range(len(tokens) - cls.SHINGLE_SIZE + 1):
+            shingle = ' '.join(tokens[i:i + cls.SHINGLE_SIZE])
+            h = int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), 'little')
+            for bit in range(cls.HASH_BITS):
+                weights[bit] += 1 if h >> bit & 1 else -1
+
+        result = 0
+        for bit, weight in enumerate(weights):
+            if weight > 0:
+                result |= 1 << bit
+        return result
+
+    @classmethod
+    def fingerprint(cls, text: str) -> Optional[int]:
+        """
+        Подпись текста любой длины (None для пустого текста)
+
+        Для текстов из MIN_TOKENS слов и длиннее это SimHash-подпись, для более
+        коротких - хеш нормализованного текста, совпадающий только у одинаковых.
+        """
+        signature = cls.signature(text)
+        if signature is not None:
+            return signature
+        words = ' '.join(cls.normalize(text)) or text.strip()
+        if not words:
+            return None
+        return int.from_bytes(hashlib.blake2b(words.encode(), digest_size=8).digest(), 'little')